@@ -1,5 +1,12 @@
 from django.contrib import admin
 
-from answers.models import Answer
+from answers.models import Answer, QuestionImage
 
-admin.site.register(Answer)
+
+class AnswerAdmin(admin.ModelAdmin):
+    # A select of all images would load the images.
+    raw_id_fields = ("question_image",)
+
+
+admin.site.register(Answer, AnswerAdmin)
+admin.site.register(QuestionImage)
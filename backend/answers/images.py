@@ -0,0 +1,66 @@
+"""
+The images of the questions, which are stored once for all answers to a question.
+
+The app sends the base 64 encoded image of the question with every answer.
+The image is keyed by the SHA-256 hash of its text, so the answers only store
+the hash and an image that many users answered is stored once. Images that
+no answer references anymore are deleted after the answers are deleted.
+"""
+import hashlib
+from typing import Iterable, Optional
+
+from answers.models import Answer, QuestionImage
+from django.db import IntegrityError, transaction
+
+
+def image_hash(data: str) -> str:
+    return hashlib.sha256(data.encode("utf-8")).hexdigest()
+
+
+def store_images(images: Iterable[QuestionImage]):
+    """
+    Insert the images that aren't stored yet.
+    """
+    # Images that are stored already or inserted concurrently are ignored.
+    unique_images = {image.hash: image for image in images}
+    QuestionImage.objects.bulk_create(list(unique_images.values()), ignore_conflicts=True)
+
+
+def store_image(data: Optional[str]) -> Optional[str]:
+    """
+    Store an image if it isn't stored yet and return its hash, or None if there is no image.
+    """
+    if data is None:
+        return None
+    image = QuestionImage(hash=image_hash(data), data=data)
+    store_images([image])
+    return image.hash
+
+
+def save_answer(answer: Answer, image: Optional[str]):
+    """
+    Insert a new answer together with its image.
+    """
+    try:
+        with transaction.atomic():
+            answer.question_image_id = store_image(image)
+            answer.save(force_insert=True)
+    except IntegrityError:
+        # The image was deleted as unused, by the sync, between storing it and inserting the answer.
+        if image is None or QuestionImage.objects.filter(pk=answer.question_image_id).exists():
+            raise
+        with transaction.atomic():
+            answer.question_image_id = store_image(image)
+            answer.save(force_insert=True)
+
+
+def delete_unused_images(hashes: Optional[Iterable[str]] = None) -> int:
+    """
+    Delete the images that no answer references, among the given hashes or among all images. Returns the number of deleted images.
+    """
+    # Only the hashes are loaded to delete the images.
+    images = QuestionImage.objects.filter(answers__isnull=True).only("hash")
+    if hashes is not None:
+        images = images.filter(pk__in=list(hashes))
+    deleted, _ = images.delete()
+    return deleted
@@ -0,0 +1,17 @@
+# Generated by Django 4.2.30 on 2026-10-18 11:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('answers', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='answer',
+            index=models.Index(fields=['date', 'session_id'], name='answer_date_session_id_idx'),
+        ),
+    ]
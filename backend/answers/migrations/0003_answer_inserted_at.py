@@ -0,0 +1,23 @@
+# Generated by Django 4.2.30 on 2026-10-18 13:52
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('answers', '0002_answer_date_session_id_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='answer',
+            name='inserted_at',
+            field=models.DateTimeField(default=django.utils.timezone.now, editable=False),
+        ),
+        migrations.AddIndex(
+            model_name='answer',
+            index=models.Index(fields=['inserted_at', 'session_id'], name='answer_inserted_at_idx'),
+        ),
+    ]
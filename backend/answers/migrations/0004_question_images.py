@@ -0,0 +1,76 @@
+import hashlib
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+# The number of answers whose images are moved at once, the images are up to 10MB each.
+BATCH_SIZE = 50
+
+
+def move_images(apps, schema_editor):
+    """
+    Store every distinct image of the answers once and reference it from the answers by its hash.
+    """
+    Answer = apps.get_model("answers", "Answer")
+    QuestionImage = apps.get_model("answers", "QuestionImage")
+
+    def flush(images, pks_by_hash):
+        QuestionImage.objects.bulk_create(images, ignore_conflicts=True)
+        for image_hash, pks in pks_by_hash.items():
+            Answer.objects.filter(pk__in=pks).update(image=image_hash)
+
+    images, pks_by_hash, stored = [], {}, set()
+    rows = Answer.objects.exclude(question_image=None).order_by().values_list("pk", "question_image").iterator(chunk_size=BATCH_SIZE)
+    for pk, data in rows:
+        image_hash = hashlib.sha256(data.encode("utf-8")).hexdigest()
+        if image_hash not in stored:
+            stored.add(image_hash)
+            images.append(QuestionImage(hash=image_hash, data=data))
+        pks_by_hash.setdefault(image_hash, []).append(pk)
+        if len(images) >= BATCH_SIZE or sum(len(pks) for pks in pks_by_hash.values()) >= BATCH_SIZE:
+            flush(images, pks_by_hash)
+            images, pks_by_hash = [], {}
+    flush(images, pks_by_hash)
+
+
+def restore_images(apps, schema_editor):
+    """
+    Copy the images back into the answers.
+    """
+    Answer = apps.get_model("answers", "Answer")
+    QuestionImage = apps.get_model("answers", "QuestionImage")
+    for image_hash in QuestionImage.objects.values_list("hash", flat=True):
+        data = QuestionImage.objects.values_list("data", flat=True).get(hash=image_hash)
+        Answer.objects.filter(image=image_hash).update(question_image=data)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('answers', '0003_answer_inserted_at'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='QuestionImage',
+            fields=[
+                ('hash', models.CharField(max_length=64, primary_key=True, serialize=False)),
+                ('data', models.TextField(max_length=10000000)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='answer',
+            name='image',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='answers', to='answers.questionimage'),
+        ),
+        migrations.RunPython(move_images, restore_images),
+        migrations.RemoveField(
+            model_name='answer',
+            name='question_image',
+        ),
+        migrations.RenameField(
+            model_name='answer',
+            old_name='image',
+            new_name='question_image',
+        ),
+    ]
@@ -2,6 +2,24 @@ from django.db import models
 from django.utils import timezone
 
 
+class QuestionImage(models.Model):
+    """
+    A base 64 encoded image of a question, stored once for all answers to the question.
+
+    The image is keyed by the SHA-256 hash of its text, see answers.images.
+    """
+
+    # The hex SHA-256 hash of the base 64 text.
+    hash = models.CharField(max_length=64, primary_key=True)
+
+    # The base 64 encoded image.
+    # Max size: 10MB (10M symbols in base 64).
+    data = models.TextField(max_length=10_000_000)
+
+    def __str__(self) -> str:
+        return f"Image {self.hash}"
+
+
 class Answer(models.Model):
     """An answer to a feedback question."""
 
@@ -16,9 +34,8 @@ class Answer(models.Model):
     # The text of the question. Max length: 300 symbols.
     question_text = models.TextField(max_length=300)
 
-    # The base 64 encoded image of this question, if provided.
-    # Max size: 10MB (10M symbols in base 64).
-    question_image = models.TextField(null=True, blank=True, max_length=10_000_000)
+    # The image of this question, if provided. The answers to a question share the stored image.
+    question_image = models.ForeignKey(QuestionImage, null=True, blank=True, on_delete=models.PROTECT, related_name="answers")
 
     # The value of the answer, if provided. Max length: 1000 symbols.
     # This can be:
@@ -30,6 +47,10 @@ class Answer(models.Model):
     # The date of this answer. Added by the service and not configurable by the user.
     date = models.DateTimeField(default=timezone.now)
 
+    # When the answer was inserted into this database. Not synced, such that the manager
+    # knows which answers are new since the last cleanup of answers without a track.
+    inserted_at = models.DateTimeField(default=timezone.now, editable=False)
+
     def __str__(self) -> str:
         return f"{self.question_text}: {self.value} (ID {self.user_id})"
 
@@ -37,3 +58,9 @@ class Answer(models.Model):
         verbose_name = "Answer"
         verbose_name_plural = "Answers"
         ordering = ["-date"]
+        indexes = [
+            # The sort key of the cursor mode of the list endpoint.
+            models.Index(fields=["date", "session_id"], name="answer_date_session_id_idx"),
+            # The watermark of the cleanup of answers without a track, see sync.cleanup.
+            models.Index(fields=["inserted_at", "session_id"], name="answer_inserted_at_idx"),
+        ]
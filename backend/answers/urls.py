@@ -3,13 +3,24 @@ from django.urls import path
 
 from . import views
 
+# ASGI workers serve the async views, see SERVER_MODE in the settings.
+if settings.ASYNC_VIEWS:
+    PostAnswerResource = views.AsyncPostAnswerResource
+    ListAnswersResource = views.AsyncListAnswersResource
+    GetImageResource = views.AsyncGetImageResource
+else:
+    PostAnswerResource = views.PostAnswerResource
+    ListAnswersResource = views.ListAnswersResource
+    GetImageResource = views.GetImageResource
+
 app_name = 'answers'
 
 if settings.WORKER_MODE:
     urlpatterns = [
-        path("post/", views.PostAnswerResource.as_view(), name="send-answer"),
+        path("post/", PostAnswerResource.as_view(), name="send-answer"),
     ]
 else:
     urlpatterns = [
-        path("list/", views.ListAnswersResource.as_view(), name="list-answers"),
+        path("list/", ListAnswersResource.as_view(), name="list-answers"),
+        path("image/", GetImageResource.as_view(), name="get-image"),
     ]
@@ -1,15 +1,79 @@
 import json
+import math
 
-from answers.models import Answer
+from datetime import datetime
+
+from answers.images import save_answer
+from answers.models import Answer, QuestionImage
+from asgiref.sync import sync_to_async
+from backend.pagination import (InvalidCursor, InvalidPageParams, cursor_response,
+                                decode_cursor, get_page_params)
 from django.conf import settings
 from django.core.exceptions import ValidationError
 from django.core.paginator import Paginator
-from django.http import HttpResponseBadRequest, JsonResponse
+from django.http import (HttpResponseBadRequest, HttpResponseNotModified,
+                         JsonResponse)
 from django.utils.decorators import method_decorator
 from django.views.decorators.csrf import csrf_exempt
 from django.views.generic import View
 
 
+def serialize_answer(answer: Answer):
+    return {
+        "pk": answer.pk,
+        "userId": answer.user_id,
+        "questionText": answer.question_text,
+        # The image is fetched from the image endpoint by its hash, such that it is only sent once.
+        "questionImageHash": answer.question_image_id,
+        "sessionId": answer.session_id,
+        "value": answer.value,
+        "date": answer.date.isoformat(),
+    }
+
+
+def image_response(request, image: QuestionImage):
+    """
+    Get the response of the image endpoint, or an empty response if the client has the image already.
+
+    The hash is the content of the image, so the image never changes and is cached without revalidation.
+    """
+    etag = f'"{image.hash}"'
+    if_none_match = request.META.get("HTTP_IF_NONE_MATCH")
+    if if_none_match and (if_none_match.strip() == "*" or etag in [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]):
+        response = HttpResponseNotModified()
+    else:
+        response = JsonResponse({"hash": image.hash, "questionImage": image.data})
+    response["ETag"] = etag
+    # Private, since the url contains the API key.
+    response["Cache-Control"] = "private, max-age=31536000, immutable"
+    return response
+
+
+def answers_after_cursor(token: str):
+    """
+    Get the answers after the cursor of the cursor mode of the list endpoint.
+
+    The answers are ordered by (date, session_id), which is covered by an index,
+    so the cursor is the date and session id of the last answer of the previous page.
+    An empty token starts at the first answer. Raises InvalidCursor if the token is invalid.
+    """
+    answers = Answer.objects.order_by("date", "session_id")
+    if not token:
+        return answers
+    cursor = decode_cursor(token)
+    try:
+        date = datetime.fromisoformat(cursor["date"])
+        session_id = str(cursor["sessionId"])
+    except (KeyError, TypeError, ValueError):
+        raise InvalidCursor(f"Invalid cursor: {token[:100]}")
+    # Equivalent to (date, session_id) > (cursor date, cursor session id), written such that the index range starts at the cursor date.
+    return answers.filter(date__gte=date).exclude(date=date, session_id__lte=session_id)
+
+
+def answer_cursor_values(answer: Answer):
+    return {"date": answer.date.isoformat(), "sessionId": answer.session_id}
+
+
 @method_decorator(csrf_exempt, name='dispatch')
 class PostAnswerResource(View):
     def post(self, request):
@@ -26,15 +90,16 @@ class PostAnswerResource(View):
 
         # Make some sanity checks on the requested data.
         try:
-            Answer.objects.create(
+            answer = Answer(
                 # Necessary args
                 user_id=json_data.get("userId", "anonymous"),
                 question_text=json_data["questionText"],
                 # Optional args
-                question_image=json_data.get("questionImage"),
                 session_id=session_id,
                 value=json_data.get("value"),
             )
+            # The image is only stored if no other answer has the same image.
+            save_answer(answer, json_data.get("questionImage"))
         except (ValidationError, KeyError):
             return HttpResponseBadRequest(json.dumps({"error": "Invalid request."}))
         
@@ -51,32 +116,140 @@ class ListAnswersResource(View):
             return HttpResponseBadRequest(json.dumps({"error": "Invalid key."}))
 
         # Paginate the answers.
-        page = int(request.GET.get("page", 1))
-        if page < 1:
-            page = 1
+        try:
+            page, page_size = get_page_params(request.GET)
+        except InvalidPageParams as e:
+            print(e)
+            return HttpResponseBadRequest(json.dumps({"error": "Invalid page."}))
 
-        page_size = int(request.GET.get("pageSize", 10))
-        if page_size > 100:
-            page_size = 100
+        # In the cursor mode, the next page starts after the last answer of the previous page.
+        # This neither counts the answers nor skips the previous pages.
+        if "cursor" in request.GET:
+            try:
+                answers = answers_after_cursor(request.GET["cursor"])
+            except InvalidCursor as e:
+                print(e)
+                return HttpResponseBadRequest(json.dumps({"error": "Invalid cursor."}))
+            return cursor_response(list(answers[:page_size + 1]), page_size, serialize_answer, answer_cursor_values)
 
         answers = Answer.objects.all()
         paginator = Paginator(answers, page_size)
         answers = paginator.get_page(page)
 
         return JsonResponse({
-            "results": [
-                {
-                    "pk": answer.pk,
-                    "userId": answer.user_id,
-                    "questionText": answer.question_text,
-                    "questionImage": answer.question_image,
-                    "sessionId": answer.session_id,
-                    "value": answer.value,
-                    "date": answer.date.isoformat(),
-                }
-                for answer in answers
-            ],
+            "results": [serialize_answer(answer) for answer in answers],
             "page": page,
             "pageSize": page_size,
             "totalPages": answers.paginator.num_pages,
-        })
\ No newline at end of file
+        })
+
+
+@method_decorator(csrf_exempt, name='dispatch')
+class GetImageResource(View):
+    def get(self, request):
+        # Get the API key from the request.
+        api_key = request.GET.get("key", None)
+        if not api_key:
+            return HttpResponseBadRequest(json.dumps({"error": "Missing key."}))
+        if api_key != settings.API_KEY:
+            return HttpResponseBadRequest(json.dumps({"error": "Invalid key."}))
+
+        if "hash" not in request.GET:
+            return HttpResponseBadRequest(json.dumps({"error": "Missing hash."}))
+        try:
+            image = QuestionImage.objects.get(pk=request.GET["hash"])
+        except QuestionImage.DoesNotExist:
+            return HttpResponseBadRequest(json.dumps({"error": "Invalid hash."}))
+        return image_response(request, image)
+
+
+# Async versions of the views above, served by ASGI workers (SERVER_MODE=asgi).
+
+
+@method_decorator(csrf_exempt, name='dispatch')
+class AsyncPostAnswerResource(View):
+    async def post(self, request):
+        try:
+            json_data = json.loads(request.body)
+        except json.JSONDecodeError:
+            return HttpResponseBadRequest(json.dumps({"error": "Invalid request."}))
+        
+        session_id = json_data.get("sessionId")
+        if not session_id:
+            return HttpResponseBadRequest(json.dumps({"error": "Missing session ID."}))
+        if await Answer.objects.filter(session_id=session_id).aexists():
+            return HttpResponseBadRequest(json.dumps({"error": "Session already exists."}))
+
+        # Make some sanity checks on the requested data.
+        try:
+            answer = Answer(
+                # Necessary args
+                user_id=json_data.get("userId", "anonymous"),
+                question_text=json_data["questionText"],
+                # Optional args
+                session_id=session_id,
+                value=json_data.get("value"),
+            )
+            # The image is only stored if no other answer has the same image.
+            await sync_to_async(save_answer)(answer, json_data.get("questionImage"))
+        except (ValidationError, KeyError):
+            return HttpResponseBadRequest(json.dumps({"error": "Invalid request."}))
+        
+        return JsonResponse({"success": True})
+
+@method_decorator(csrf_exempt, name='dispatch')
+class AsyncListAnswersResource(View):
+    async def get(self, request):
+        # Get the API key from the request.
+        api_key = request.GET.get("key", None)
+        if not api_key:
+            return HttpResponseBadRequest(json.dumps({"error": "Missing key."}))
+        if api_key != settings.API_KEY:
+            return HttpResponseBadRequest(json.dumps({"error": "Invalid key."}))
+
+        # Paginate the answers like Paginator.get_page, which has no async interface.
+        try:
+            page, page_size = get_page_params(request.GET)
+        except InvalidPageParams as e:
+            print(e)
+            return HttpResponseBadRequest(json.dumps({"error": "Invalid page."}))
+
+        # In the cursor mode, the next page starts after the last answer of the previous page.
+        if "cursor" in request.GET:
+            try:
+                answers = answers_after_cursor(request.GET["cursor"])
+            except InvalidCursor as e:
+                print(e)
+                return HttpResponseBadRequest(json.dumps({"error": "Invalid cursor."}))
+            rows = [answer async for answer in answers[:page_size + 1]]
+            return cursor_response(rows, page_size, serialize_answer, answer_cursor_values)
+
+        answers = Answer.objects.all()
+        num_pages = max(1, math.ceil(await answers.acount() / page_size))
+        offset = (min(page, num_pages) - 1) * page_size
+
+        return JsonResponse({
+            "results": [serialize_answer(answer) async for answer in answers[offset:offset + page_size]],
+            "page": page,
+            "pageSize": page_size,
+            "totalPages": num_pages,
+        })
+
+
+@method_decorator(csrf_exempt, name='dispatch')
+class AsyncGetImageResource(View):
+    async def get(self, request):
+        # Get the API key from the request.
+        api_key = request.GET.get("key", None)
+        if not api_key:
+            return HttpResponseBadRequest(json.dumps({"error": "Missing key."}))
+        if api_key != settings.API_KEY:
+            return HttpResponseBadRequest(json.dumps({"error": "Invalid key."}))
+
+        if "hash" not in request.GET:
+            return HttpResponseBadRequest(json.dumps({"error": "Missing hash."}))
+        try:
+            image = await QuestionImage.objects.aget(pk=request.GET["hash"])
+        except QuestionImage.DoesNotExist:
+            return HttpResponseBadRequest(json.dumps({"error": "Invalid hash."}))
+        return image_response(request, image)
@@ -0,0 +1,73 @@
+import base64
+import binascii
+import json
+
+from django.http import JsonResponse
+
+
+class InvalidCursor(ValueError):
+    """
+    Raised when a cursor token can't be decoded.
+    """
+    pass
+
+
+class InvalidPageParams(ValueError):
+    """
+    Raised when the page or the page size of a list endpoint isn't an integer.
+    """
+    pass
+
+
+# The number of rows on a page of the list endpoints if no page size is given, and the largest page size.
+DEFAULT_PAGE_SIZE = 10
+MAX_PAGE_SIZE = 100
+
+
+def get_page_params(params):
+    """
+    Get the requested page and page size of a list endpoint.
+
+    The page size is clamped to 1..MAX_PAGE_SIZE, such that pages are never empty slices.
+    """
+    try:
+        page = int(params.get("page", 1))
+        page_size = int(params.get("pageSize", DEFAULT_PAGE_SIZE))
+    except ValueError:
+        raise InvalidPageParams(f"Invalid page: {params.get('page', '')[:100]}, page size: {params.get('pageSize', '')[:100]}")
+    return max(1, page), max(1, min(MAX_PAGE_SIZE, page_size))
+
+
+def encode_cursor(values: dict) -> str:
+    """
+    Encode the sort key of the last row of a page into an opaque cursor token.
+    """
+    data = json.dumps(values, separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(data).decode("ascii").rstrip("=")
+
+
+def decode_cursor(token: str) -> dict:
+    try:
+        data = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4))
+        values = json.loads(data)
+    except (binascii.Error, ValueError):
+        raise InvalidCursor(f"Invalid cursor: {token[:100]}")
+    if not isinstance(values, dict):
+        raise InvalidCursor(f"Invalid cursor: {token[:100]}")
+    return values
+
+
+def cursor_response(rows: list, page_size: int, serialize, cursor_values) -> JsonResponse:
+    """
+    Respond with a page of the cursor mode of the list endpoints.
+
+    The rows are fetched with one row more than the page size, which tells
+    if there is a next page without counting the matching rows.
+    """
+    has_next = len(rows) > page_size
+    rows = rows[:page_size]
+    return JsonResponse({
+        "results": [serialize(row) for row in rows],
+        "pageSize": page_size,
+        "next": encode_cursor(cursor_values(rows[-1])) if has_next else None,
+    })
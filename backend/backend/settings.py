@@ -63,6 +63,38 @@ else:
 # SECURITY WARNING: keep the API key used in production secret!
 API_KEY = os.environ.get('API_KEY', 'secret')
 
+# Upper bounds for the decompressed size of uploaded track files in bytes.
+# Uploads that inflate beyond these limits (e.g. gzip bombs) are rejected with 413.
+MAX_DECOMPRESSED_FILE_SIZE = int(os.environ.get('MAX_DECOMPRESSED_FILE_SIZE', 64 * 1024 * 1024))
+MAX_DECOMPRESSED_TRACK_SIZE = int(os.environ.get('MAX_DECOMPRESSED_TRACK_SIZE', 160 * 1024 * 1024))
+
+# How uploaded tracks are inserted into the database:
+# - 'sync': The track is validated and inserted while the client waits.
+# - 'spool': The upload is durably written into the spool directory and the client gets a 202.
+#            The drain_spool command validates and inserts the spooled tracks in batches.
+INGEST_MODE = os.environ.get('INGEST_MODE', 'sync')
+INGEST_SPOOL_DIR = os.environ.get('INGEST_SPOOL_DIR', os.path.join(BASE_DIR, 'data', 'spool'))
+
+# The directory in which every server process writes its request metrics, see monitoring/instrumentation.py.
+REQUEST_METRICS_DIR = os.environ.get('REQUEST_METRICS_DIR', os.path.join(BASE_DIR, 'data', 'request-metrics'))
+
+# How the requests are served:
+# - 'wsgi': Sync gunicorn workers serve the sync views, one request per worker at a time.
+# - 'asgi': Uvicorn workers serve the async views. Database queries run through Django's async ORM
+#           and decompression and validation run in a bounded thread pool of OFFLOAD_THREADS threads.
+# Sync views must not be served by ASGI workers, since Django runs all of them in a single thread.
+SERVER_MODE = os.environ.get('SERVER_MODE', 'wsgi')
+ASYNC_VIEWS = SERVER_MODE == 'asgi'
+OFFLOAD_THREADS = int(os.environ.get('OFFLOAD_THREADS', 4))
+
+# Whether the metadata of the tracks is stored in a jsonb column on PostgreSQL, whose keys can be queried.
+# Existing databases are converted with the convert_metadata_jsonb command after setting it.
+METADATA_JSONB = 'True' in os.environ.get('METADATA_JSONB', 'False')
+
+# Whether the benchmark commands are available. They delete data, so they are only installed on demand.
+# DEBUG isn't enough, since it defaults to True and the images don't set it.
+BENCHMARKS = 'True' in os.environ.get('BENCHMARKS', 'False')
+
 # Application definition
 
 INSTALLED_APPS = [
@@ -80,8 +112,12 @@ INSTALLED_APPS = [
 ]
 if not WORKER_MODE:
     INSTALLED_APPS.append('django.contrib.admin')
+if BENCHMARKS:
+    INSTALLED_APPS.append('benchmarks')
 
 MIDDLEWARE = [
+    # First, such that the latency includes all other middleware.
+    'monitoring.middleware.RequestMetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -110,6 +146,7 @@ TEMPLATES = [
 ]
 
 WSGI_APPLICATION = 'backend.wsgi.application'
+ASGI_APPLICATION = 'backend.asgi.application'
 
 # Database
 # https://docs.djangoproject.com/en/4.0/ref/settings/#databases
@@ -22,6 +22,7 @@ from backend.views import HealthcheckView, StatusView
 urlpatterns = [
     path('tracks/', include('tracks.urls')),
     path('answers/', include('answers.urls')),
+    path('monitoring/', include('monitoring.urls')),
     path('status', StatusView.as_view(), name='status'),
     path('healthcheck', HealthcheckView.as_view(), name='healthcheck'),
 ]
@@ -31,4 +32,3 @@ if settings.SYNC_EXPOSED:
 
 if not settings.WORKER_MODE:
     urlpatterns.append(path(settings.ADMIN_URL, admin.site.urls))
-    urlpatterns.append(path('monitoring/', include('monitoring.urls')))
@@ -0,0 +1,72 @@
+import json
+import time
+import tracemalloc
+
+from benchmarks.synthetic import create_tracks
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, reset_queries
+from django.test import RequestFactory
+from tracks.views import (ExportTracksResource, FetchTrackResource,
+                          ListTracksResource, filter_tracks)
+
+
+class Command(BaseCommand):
+    help = """Compares exporting tracks with the export endpoint to paging through the list endpoint and fetching every track."""
+
+    def add_arguments(self, parser):
+        parser.add_argument("--tracks", type=int, default=100_000, help="The number of tracks in the dataset. Missing tracks are generated.")
+        parser.add_argument("--export", type=int, default=5_000, help="The number of tracks to export, selected by a pk range.")
+        parser.add_argument("--fields", type=str, default="metadata,gps", help="The fields to export.")
+
+    def handle(self, *args, **options):
+        create_tracks(options["tracks"])
+        pks = list(filter_tracks({}).values_list("pk", flat=True)[:options["export"]])
+        if not pks:
+            raise CommandError("There are no tracks.")
+        params = {"key": "secret", "maxPk": pks[-1], "fields": options["fields"]}
+        self.factory = RequestFactory()
+
+        print(f"Exporting {len(pks)} tracks with the fields {options['fields']}.")
+        print(f"{'method':<25} {'time [s]':>9} {'bytes':>12} {'requests':>9} {'queries':>8} {'peak memory [MB]':>17}")
+        for label, fn in [
+            ("list + fetch per track", lambda: self.list_and_fetch(params)),
+            ("export ndjson", lambda: self.export(params, "ndjson")),
+            ("export tar", lambda: self.export(params, "tar")),
+        ]:
+            reset_queries()
+            start = time.perf_counter()
+            size, n_requests = fn()
+            duration = time.perf_counter() - start
+            queries = f"{len(connection.queries):>8}" if connection.queries_logged else f"{'-':>8}"
+            # Tracing the memory slows the allocations down, so it is measured in a separate run.
+            tracemalloc.start()
+            fn()
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            print(f"{label:<25} {duration:>9.2f} {size:>12} {n_requests:>9} {queries} {peak / 1024 / 1024:>17.1f}")
+
+    def get(self, view, params):
+        response = view.as_view()(self.factory.get("/", params))
+        if response.status_code != 200:
+            raise CommandError(response.content.decode("utf-8"))
+        return response
+
+    def list_and_fetch(self, params):
+        """
+        Page through the pks with the list endpoint and fetch the tracks one by one, like the analytics jobs did.
+        """
+        size = 0
+        n_requests = 0
+        cursor = ""
+        while cursor is not None:
+            page = json.loads(self.get(ListTracksResource, {**params, "cursor": cursor, "pageSize": 100}).content)
+            n_requests += 1
+            for track in page["results"]:
+                size += len(self.get(FetchTrackResource, {**params, "pk": track["pk"]}).content)
+                n_requests += 1
+            cursor = page["next"]
+        return size, n_requests
+
+    def export(self, params, response_format: str):
+        response = self.get(ExportTracksResource, {**params, "format": response_format})
+        return sum(len(chunk) for chunk in response.streaming_content), 1
@@ -0,0 +1,78 @@
+import gzip
+import random
+import statistics
+import time
+import tracemalloc
+
+from benchmarks.synthetic import (generate_gps_csv, generate_metadata,
+                                  generate_sensor_csv)
+from django.core.management.base import BaseCommand, CommandError
+from django.test import RequestFactory
+from tracks.ingest import build_track, save_track
+from tracks.models import SensorStream, Track
+from tracks.sensors import SENSORS, encode_sensor_data, parse_sensor_csv
+from tracks.views import FetchTrackResource
+
+# The session id of the track that is fetched.
+SESSION_ID = "benchmark-fetch"
+
+
+class Command(BaseCommand):
+    help = """Measures the time, the response size and the peak memory of the formats of the fetch endpoint for one large track."""
+
+    def add_arguments(self, parser):
+        parser.add_argument("--gps-points", type=int, default=3_600, help="The number of GPS points of the track, one per second.")
+        parser.add_argument("--samples", type=int, default=180_000, help="The number of samples per inertial sensor, 50 Hz for an hour by default.")
+        parser.add_argument("--repeat", type=int, default=5, help="The number of runs per format, the median is reported.")
+
+    def handle(self, *args, **options):
+        self.create_track(options["gps_points"], options["samples"])
+        pk = Track.objects.get(session_id=SESSION_ID).pk
+        factory = RequestFactory()
+        view = FetchTrackResource.as_view()
+
+        print(f"{'format':<45} {'median [ms]':>12} {'bytes':>12} {'peak memory [MB]':>17}")
+        for label, params, headers in [
+            ("json, all fields", {}, {}),
+            ("json, fields=gps,metadata", {"fields": "gps,metadata"}, {}),
+            ("ndjson, all fields", {"format": "ndjson"}, {}),
+            ("multipart, all fields", {"format": "multipart"}, {}),
+            ("multipart, all fields, Accept-Encoding: gzip", {"format": "multipart"}, {"HTTP_ACCEPT_ENCODING": "gzip"}),
+            ("multipart, fields=gps, Accept-Encoding: gzip", {"format": "multipart", "fields": "gps"}, {"HTTP_ACCEPT_ENCODING": "gzip"}),
+        ]:
+            request = factory.get("/tracks/fetch/", {"key": "secret", "pk": pk, **params}, **headers)
+            durations = []
+            for _ in range(options["repeat"]):
+                start = time.perf_counter()
+                size = self.consume(view(request))
+                durations.append(time.perf_counter() - start)
+            tracemalloc.start()
+            self.consume(view(request))
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            print(f"{label:<45} {statistics.median(durations) * 1000:>12.1f} {size:>12} {peak / 1024 / 1024:>17.1f}")
+
+    def consume(self, response) -> int:
+        """
+        Read the response like a client, chunk by chunk, and return its size.
+        """
+        if response.status_code != 200:
+            raise CommandError(response.content.decode("utf-8"))
+        if response.streaming:
+            return sum(len(chunk) for chunk in response.streaming_content)
+        return len(response.content)
+
+    def create_track(self, n_gps_points: int, n_samples: int):
+        if Track.objects.filter(session_id=SESSION_ID).exists():
+            print("Using the existing track.")
+            return
+        rng = random.Random(0)
+        metadata = generate_metadata(SESSION_ID, rng)
+        sensor_csvs = {sensor: generate_sensor_csv(n_samples, rng) for sensor in SENSORS}
+        gps_gz = gzip.compress(generate_gps_csv(n_gps_points, metadata["backend"], rng).encode("utf-8"))
+        track = build_track(metadata, gps_gz, {sensor: None for sensor in SENSORS})
+        sensor_streams = []
+        for sensor, csv in sensor_csvs.items():
+            data = parse_sensor_csv([csv])
+            sensor_streams.append(SensorStream(sensor=sensor, n_samples=len(data.timestamp), data=encode_sensor_data(data)))
+        save_track(track, sensor_streams)
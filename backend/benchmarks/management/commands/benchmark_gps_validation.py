@@ -0,0 +1,66 @@
+import importlib
+import time
+from io import StringIO
+
+from benchmarks.synthetic import generate_gps_csv
+from django.core.management.base import BaseCommand
+from tracks.validation import BOUNDING_BOXES, validate_gps_csv
+
+
+def validate_gps_csv_pandas(pd, gps_csv: str, bounding_box) -> bool:
+    """
+    The previous pandas-based validation, kept here for comparison.
+    """
+    min_lat, max_lat, min_lon, max_lon = bounding_box
+    track_gps_data = pd.read_csv(StringIO(gps_csv), sep=",")
+    if len(track_gps_data.index) < 6:
+        return False
+    track_max_lat = track_gps_data['latitude'].max()
+    track_min_lat = track_gps_data['latitude'].min()
+    track_max_lon = track_gps_data['longitude'].max()
+    track_min_lon = track_gps_data['longitude'].min()
+    return not (track_max_lat > max_lat or track_min_lat < min_lat or track_max_lon > max_lon or track_min_lon < min_lon)
+
+
+class Command(BaseCommand):
+    help = """Compares the pandas-based GPS validation with the streaming GPS validation."""
+
+    def add_arguments(self, parser):
+        parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000], help="The numbers of GPS points to benchmark.")
+        parser.add_argument("--repeat", type=int, default=3, help="The number of runs per validator, the fastest run is reported.")
+
+    def handle(self, *args, **options):
+        bounding_box = BOUNDING_BOXES["production"]
+
+        start = time.perf_counter()
+        try:
+            pd = importlib.import_module("pandas")
+        except ImportError:
+            pd = None
+            print("pandas is not installed, only the streaming validator is benchmarked.")
+        else:
+            print(f"Importing pandas took {time.perf_counter() - start:.3f}s (paid once per worker).")
+
+        print(f"{'points':>10} {'pandas [s]':>12} {'streaming [s]':>14} {'early exit [s]':>15} {'speedup':>8}")
+        for n_points in options["sizes"]:
+            gps_csv = generate_gps_csv(n_points)
+            # A track that leaves the bounding box after the first points.
+            gps_csv_outside = gps_csv.replace("\n", "\n0,0.0,0.0,0,0\n", 2)
+
+            streaming = self.measure(lambda: validate_gps_csv(StringIO(gps_csv), bounding_box), options["repeat"])
+            early_exit = self.measure(lambda: validate_gps_csv(StringIO(gps_csv_outside), bounding_box), options["repeat"])
+            if pd is not None:
+                legacy = self.measure(lambda: validate_gps_csv_pandas(pd, gps_csv, bounding_box), options["repeat"])
+                print(f"{n_points:>10} {legacy:>12.4f} {streaming:>14.4f} {early_exit:>15.6f} {legacy / streaming:>7.2f}x")
+            else:
+                print(f"{n_points:>10} {'-':>12} {streaming:>14.4f} {early_exit:>15.6f} {'-':>8}")
+
+    def measure(self, fn, repeat: int) -> float:
+        best = None
+        for _ in range(repeat):
+            start = time.perf_counter()
+            fn()
+            elapsed = time.perf_counter() - start
+            if best is None or elapsed < best:
+                best = elapsed
+        return best
@@ -0,0 +1,51 @@
+import statistics
+import time
+from unittest import mock
+
+from benchmarks.synthetic import create_tracks
+from django.core.management.base import BaseCommand
+from tracks import fields
+from tracks.models import Track
+
+
+class Command(BaseCommand):
+    help = """Measures iterating tracks with their payloads, with and without accessing the metadata, parsed with the json module and with orjson."""
+
+    def add_arguments(self, parser):
+        parser.add_argument("--tracks", type=int, default=100_000, help="The number of tracks in the dataset. Missing tracks are generated.")
+        parser.add_argument("--repeat", type=int, default=3, help="The number of runs per measurement, the median is reported.")
+
+    def handle(self, *args, **options):
+        create_tracks(options["tracks"])
+        n_tracks = Track.objects.count()
+
+        measurements = [
+            ("metadata not accessed", False, fields.orjson),
+            ("metadata accessed, json module", True, None),
+        ]
+        if fields.orjson is not None:
+            measurements.append(("metadata accessed, orjson", True, fields.orjson))
+        else:
+            print("orjson isn't installed, skipping it.")
+
+        print(f"Iterating {n_tracks} tracks with their payloads.")
+        print(f"{'measurement':<35} {'median [s]':>11} {'tracks/s':>10}")
+        for label, access, decoder in measurements:
+            durations = []
+            with mock.patch.object(fields, "orjson", decoder):
+                for _ in range(options["repeat"]):
+                    start = time.perf_counter()
+                    self.iterate(access)
+                    durations.append(time.perf_counter() - start)
+            median = statistics.median(durations)
+            print(f"{label:<35} {median:>11.2f} {n_tracks / median:>10.0f}")
+
+    def iterate(self, access: bool):
+        """
+        Iterate the tracks like the exports and the sync, the payloads are selected with the tracks.
+        """
+        for track in Track.objects.select_related("payload").defer(
+            "payload__gps_csv", "payload__accelerometer_csv", "payload__gyroscope_csv", "payload__magnetometer_csv"
+        ).iterator(chunk_size=1000):
+            if access:
+                track.metadata.get("deviceType")
@@ -0,0 +1,60 @@
+import io
+import statistics
+import time
+from contextlib import redirect_stdout
+
+from benchmarks.synthetic import create_track_rows
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.db.models import Count, Sum
+from monitoring.rollups import read_breakdowns, rebuild_rollups, scan_tracks
+from tracks.models import Track
+
+
+class Command(BaseCommand):
+    help = """Compares the track queries of generate_metrics with one query per breakdown, the single grouped scan and the aggregates, on synthetic tracks."""
+
+    def add_arguments(self, parser):
+        parser.add_argument("--tracks", type=int, default=1_000_000, help="The number of tracks in the dataset. Missing tracks are generated without payloads.")
+        parser.add_argument("--repeat", type=int, default=3, help="The number of runs per measurement, the median is reported.")
+        parser.add_argument("--seed", type=int, default=0, help="The seed of the generated dataset.")
+
+    def handle(self, *args, **options):
+        create_track_rows(options["tracks"], options["seed"])
+        if connection.vendor == "postgresql":
+            with connection.cursor() as cursor:
+                cursor.execute(f"VACUUM ANALYZE {connection.ops.quote_name(Track._meta.db_table)}")
+
+        print(f"{'measurement':<45} {'median [s]':>11}")
+        for label, fn in [
+            ("one query per breakdown (before)", self.separate_queries),
+            ("single grouped scan over the tracks", scan_tracks),
+            ("rebuild of the aggregates", rebuild_rollups),
+            ("breakdowns from the aggregates", read_breakdowns),
+            ("generate_metrics", self.generate_metrics),
+        ]:
+            durations = []
+            for _ in range(options["repeat"]):
+                start = time.perf_counter()
+                fn()
+                durations.append(time.perf_counter() - start)
+            print(f"{label:<45} {statistics.median(durations):>11.3f}")
+
+    def separate_queries(self):
+        """
+        Run the track queries of generate_metrics before the aggregates, each breakdown scans the tracks.
+        """
+        for debug in (True, False):
+            Track.objects.filter(debug=debug).count()
+            tracks = Track.objects.filter(debug=debug).exclude(end_time=None)
+            tracks.aggregate(v=Sum("start_time"))
+            tracks.aggregate(v=Sum("end_time"))
+            Track.objects.filter(debug=debug).values("user_id").distinct().count()
+            list(Track.objects.filter(debug=debug).values("device_type").annotate(v=Count("device_type")).values_list("device_type", "v"))
+        for field in ("bike_type", "preference_type", "activity_type"):
+            list(Track.objects.values(field).annotate(v=Count(field)).values_list(field, "v"))
+
+    def generate_metrics(self):
+        with redirect_stdout(io.StringIO()):
+            call_command("generate_metrics")
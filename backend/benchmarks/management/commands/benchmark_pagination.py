@@ -0,0 +1,60 @@
+import statistics
+import time
+
+from answers.models import Answer
+from answers.views import ListAnswersResource, answer_cursor_values
+from backend.pagination import encode_cursor
+from benchmarks.synthetic import create_answers, create_tracks
+from django.core.management.base import BaseCommand, CommandError
+from django.test import RequestFactory
+from tracks.views import (ListTracksResource, filter_tracks,
+                          track_cursor_values)
+
+
+class Command(BaseCommand):
+    help = """Compares the page and the cursor mode of the list endpoints at the first and at a late page."""
+
+    def add_arguments(self, parser):
+        parser.add_argument("--tracks", type=int, default=100_000, help="The number of tracks in the dataset. Missing tracks are generated.")
+        parser.add_argument("--answers", type=int, default=100_000, help="The number of answers in the dataset. Missing answers are generated.")
+        parser.add_argument("--pages", type=int, nargs="+", default=[1, 5000], help="The pages to request.")
+        parser.add_argument("--page-size", type=int, default=10, help="The page size.")
+        parser.add_argument("--repeat", type=int, default=5, help="The number of runs per measurement, the median is reported.")
+
+    def handle(self, *args, **options):
+        create_tracks(options["tracks"])
+        create_answers(options["answers"])
+        page_size = options["page_size"]
+        factory = RequestFactory()
+
+        print(f"{'endpoint':<10} {'page':>6} {'page mode [ms]':>15} {'cursor mode [ms]':>17}")
+        for name, view, ordered, cursor_values in [
+            ("tracks", ListTracksResource.as_view(), filter_tracks({}), track_cursor_values),
+            ("answers", ListAnswersResource.as_view(), Answer.objects.order_by("date", "session_id"), answer_cursor_values),
+        ]:
+            for page in options["pages"]:
+                page_request = factory.get("/", {"key": "secret", "page": page, "pageSize": page_size})
+                # The cursor that a client has after walking to the same page.
+                cursor = ""
+                if page > 1:
+                    previous = ordered[(page - 1) * page_size - 1:(page - 1) * page_size].first()
+                    if previous is None:
+                        raise CommandError(f"There are less than {page} pages of {name}.")
+                    cursor = encode_cursor(cursor_values(previous))
+                cursor_request = factory.get("/", {"key": "secret", "cursor": cursor, "pageSize": page_size})
+
+                page_time = self.measure(lambda: self.check_response(view(page_request)), options["repeat"])
+                cursor_time = self.measure(lambda: self.check_response(view(cursor_request)), options["repeat"])
+                print(f"{name:<10} {page:>6} {page_time * 1000:>15.2f} {cursor_time * 1000:>17.2f}")
+
+    def check_response(self, response):
+        if response.status_code != 200:
+            raise CommandError(response.content.decode("utf-8"))
+
+    def measure(self, fn, repeat: int) -> float:
+        durations = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            fn()
+            durations.append(time.perf_counter() - start)
+        return statistics.median(durations)
@@ -0,0 +1,132 @@
+import statistics
+import time
+
+from benchmarks.synthetic import create_tracks
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Count, Sum
+from django.test import RequestFactory
+from django.test.utils import CaptureQueriesContext
+from tracks.attributes import pending_tracks
+from tracks.models import Track
+from tracks.views import ListTracksResource
+
+
+class Command(BaseCommand):
+    help = """Runs the query patterns of the track list endpoint and the metrics on synthetic tracks and reports their timings and query plans."""
+
+    def add_arguments(self, parser):
+        parser.add_argument("--tracks", type=int, default=100_000, help="The number of tracks in the dataset. Missing tracks are generated.")
+        parser.add_argument("--gps-points", type=int, default=600, help="The number of GPS points per generated track.")
+        parser.add_argument("--repeat", type=int, default=5, help="The number of runs per query pattern, the median is reported.")
+        parser.add_argument("--seed", type=int, default=0, help="The seed of the generated dataset.")
+        parser.add_argument("--explain", action="store_true", help="Print the query plans of every query pattern.")
+        parser.add_argument("--only", type=str, default=None, help="Only run the query patterns whose label contains this text.")
+
+    def handle(self, *args, **options):
+        create_tracks(options["tracks"], options["gps_points"], options["seed"])
+        # Vacuum and analyze the table, such that the plans (e.g. index only scans) don't depend on when autovacuum ran last.
+        if connection.vendor == "postgresql":
+            with connection.cursor() as cursor:
+                cursor.execute(f"VACUUM ANALYZE {connection.ops.quote_name(Track._meta.db_table)}")
+
+        patterns = self.list_patterns() + self.metrics_patterns()
+        if options["only"]:
+            patterns = [(label, fn) for label, fn in patterns if options["only"] in label]
+        if not patterns:
+            raise CommandError("No query pattern matches.")
+
+        print(f"{'query pattern':<45} {'median [ms]':>12} {'queries':>8}")
+        for label, fn in patterns:
+            durations = []
+            for _ in range(options["repeat"]):
+                start = time.perf_counter()
+                fn()
+                durations.append(time.perf_counter() - start)
+            with CaptureQueriesContext(connection) as queries:
+                fn()
+            print(f"{label:<45} {statistics.median(durations) * 1000:>12.2f} {len(queries):>8}")
+            if options["explain"]:
+                for query in queries:
+                    self.explain(query["sql"])
+
+    def list_patterns(self):
+        """
+        Get the requests of the list endpoint, with filter values that match many and few tracks.
+        """
+        factory = RequestFactory()
+        view = ListTracksResource.as_view()
+        user_id = Track.objects.filter(debug=False).values_list("user_id", flat=True).first()
+        first_start = Track.objects.order_by("start_time").values_list("start_time", flat=True).first()
+        if first_start is None:
+            raise CommandError("There are no tracks.")
+        one_week = 7 * 24 * 60 * 60 * 1000
+        # The time window of the week in the middle of the dataset.
+        middle = first_start + 26 * one_week
+
+        def request(params):
+            request = factory.get("/tracks/list/", {"key": "secret", "pageSize": 10, **params})
+
+            def run():
+                response = view(request)
+                if response.status_code != 200:
+                    raise CommandError(response.content.decode("utf-8"))
+            return run
+
+        return [
+            ("list page 1", request({"page": 1})),
+            ("list page 1000", request({"page": 1000})),
+            ("list cursor first page", request({"cursor": ""})),
+            ("list from+to (one week)", request({"from": middle, "to": middle + one_week})),
+            ("list backend=production", request({"backend": "production"})),
+            ("list backend=release", request({"backend": "release"})),
+            ("list positioning=follow18kmh", request({"positioning": "follow18kmh"})),
+            ("list deviceType=Pixel 7", request({"deviceType": "Pixel 7"})),
+            ("list deviceType=Pixel 7 page 100", request({"deviceType": "Pixel 7", "page": 100})),
+            ("list userId", request({"userId": user_id})),
+            ("list backend+deviceType+from", request({"backend": "production", "deviceType": "Pixel 7", "from": middle})),
+            ("list appVersion=1.6.0", request({"appVersion": "1.6.0"})),
+            ("list buildNumber", request({"buildNumber": "1500"})),
+            ("list appVersion+isDarkMode", request({"appVersion": "1.6.0", "isDarkMode": "true"})),
+            ("admin changelist (ordered by -date)", lambda: list(Track.objects.only("pk", "date", "debug", "positioning_mode", "backend", "device_type", "user_id")[:100])),
+        ]
+
+    def metrics_patterns(self):
+        """
+        Get the track queries of the generate_metrics command.
+        """
+        def group_by(field, **filters):
+            return lambda: list(Track.objects.filter(**filters).values(field).annotate(v=Count(field)).values_list(field, "v"))
+
+        def riding_seconds(debug):
+            tracks = Track.objects.filter(debug=debug).exclude(end_time=None)
+            return lambda: (tracks.aggregate(v=Sum("start_time")), tracks.aggregate(v=Sum("end_time")))
+
+        return [
+            ("metrics n_tracks", lambda: (Track.objects.filter(debug=True).count(), Track.objects.filter(debug=False).count())),
+            ("metrics n_seconds_riding debug=true", riding_seconds(True)),
+            ("metrics n_seconds_riding debug=false", riding_seconds(False)),
+            ("metrics n_users debug=true", lambda: Track.objects.filter(debug=True).values("user_id").distinct().count()),
+            ("metrics n_users debug=false", lambda: Track.objects.filter(debug=False).values("user_id").distinct().count()),
+            ("metrics by device_type debug=true", group_by("device_type", debug=True)),
+            ("metrics by device_type debug=false", group_by("device_type", debug=False)),
+            ("metrics by bike_type", group_by("bike_type")),
+            ("metrics by preference_type", group_by("preference_type")),
+            ("metrics by activity_type", group_by("activity_type")),
+            # The tracks that the battery analysis has to classify, none after the first run.
+            ("metrics unclassified battery tracks", lambda: list(Track.objects.filter(has_battery_data=None).values_list("pk", flat=True))),
+            ("metrics battery tracks without consumption", lambda: list(Track.objects.filter(has_battery_data=True, avg_battery_consumption=None).values_list("pk", flat=True))),
+            ("metrics tracks without attributes", lambda: list(pending_tracks().values_list("pk", flat=True))),
+            ("metrics battery histogram", lambda: list(Track.objects.filter(has_battery_data=True, is_dark_mode__isnull=False, save_battery_mode_enabled__isnull=False).order_by().values_list("device_type", "is_dark_mode", "save_battery_mode_enabled", "avg_battery_consumption"))),
+        ]
+
+    def explain(self, sql: str):
+        if connection.vendor == "postgresql":
+            sql = f"EXPLAIN (ANALYZE, BUFFERS) {sql}"
+        else:
+            sql = f"EXPLAIN QUERY PLAN {sql}"
+        with connection.cursor() as cursor:
+            cursor.execute(sql)
+            rows = cursor.fetchall()
+        for row in rows:
+            print(f"    {row[-1]}")
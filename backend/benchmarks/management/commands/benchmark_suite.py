@@ -0,0 +1,245 @@
+import io
+import json
+import platform
+import random
+import subprocess
+import tempfile
+import time
+import tracemalloc
+import uuid
+from contextlib import redirect_stdout
+from datetime import datetime, timezone
+
+import numpy as np
+from answers.models import Answer
+from benchmarks.synthetic import (create_answers, create_tracks, generate_ride,
+                                  ride_upload)
+from django.conf import settings
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import RequestFactory
+from monitoring.rollups import rebuild_rollups
+from sync.views import SyncResource
+from sync.wire import VERSION, load_wire
+from tracks.models import Track
+from tracks.views import (FetchTrackResource, ListTracksResource,
+                          PostTrackResource)
+
+# The scenarios in the order in which they run. The sync deletes and reloads the dataset, so it runs last.
+SCENARIOS = ("post", "list", "fetch", "generate_metrics", "sync")
+
+# The number of distinct rides that are uploaded, the uploads reuse them with new session ids.
+RIDE_POOL_SIZE = 4
+
+
+class Command(BaseCommand):
+    """
+    This command runs the ingest, the list and fetch endpoints, generate_metrics and the sync against the local database.
+
+    The views are called in the process like gunicorn would call them, so the
+    results don't include the network and the server. For every scenario, the
+    operations per second, the p50 and p99 latency and the peak memory of one
+    traced operation are written into a JSON file, to compare releases.
+    """
+
+    help = """Benchmarks the ingest, the endpoints, the metrics and the sync with realistic rides and writes the results as JSON. Deletes all tracks and answers, so only run it against a scratch database."""
+
+    def add_arguments(self, parser):
+        parser.add_argument("--scenarios", type=str, nargs="+", default=list(SCENARIOS), choices=SCENARIOS, help="The scenarios to run.")
+        parser.add_argument("--uploads", type=int, default=40, help="The number of uploaded rides.")
+        parser.add_argument("--duration", type=int, default=30 * 60, help="The duration of the uploaded rides in seconds.")
+        parser.add_argument("--imu-rate", type=int, default=50, help="The sample rate of the inertial sensors of the uploaded rides in Hz, the app records 50 to 100 Hz.")
+        parser.add_argument("--tracks", type=int, default=10_000, help="The number of tracks in the dataset of the other scenarios. The tracks beyond the uploads are generated without sensor data.")
+        parser.add_argument("--requests", type=int, default=200, help="The number of requests of the list and fetch scenarios.")
+        parser.add_argument("--repeat", type=int, default=3, help="The number of runs of generate_metrics and the sync.")
+        parser.add_argument("--seed", type=int, default=0, help="The seed of the generated rides and tracks.")
+        parser.add_argument("--output", type=str, default="benchmark-results.json", help="The file to write the results to.")
+        parser.add_argument("--baseline", type=str, default=None, help="The results of an earlier run to compare with.")
+
+    def handle(self, *args, **options):
+        if Track.objects.exists() or Answer.objects.exists():
+            raise CommandError("The database already contains tracks or answers. Run this command against a scratch database.")
+        self.factory = RequestFactory()
+        self.options = options
+        self.rng = random.Random(options["seed"])
+
+        results = {}
+        try:
+            for scenario in SCENARIOS:
+                if scenario not in options["scenarios"]:
+                    continue
+                if scenario != "post" and not Track.objects.exists():
+                    self.create_dataset()
+                print(f"Running {scenario}...")
+                results[scenario] = getattr(self, f"run_{scenario}")()
+        finally:
+            Track.objects.all().delete()
+            Answer.objects.all().delete()
+            rebuild_rollups()
+
+        report = {
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "commit": self.commit(),
+            "python": platform.python_version(),
+            "database": connection.vendor,
+            "serverMode": settings.SERVER_MODE,
+            "ingestMode": settings.INGEST_MODE,
+            "parameters": {name: options[name] for name in ("uploads", "duration", "imu_rate", "tracks", "requests", "repeat", "seed")},
+            "results": results,
+        }
+        with open(options["output"], "w") as file:
+            json.dump(report, file, indent=2)
+
+        print(f"\n{'scenario':<18} {'ops/s':>10} {'p50 [ms]':>10} {'p99 [ms]':>10} {'peak memory [MB]':>17}")
+        for scenario, result in results.items():
+            print(f"{scenario:<18} {result['perSecond']:>10.2f} {result['p50Ms']:>10.1f} {result['p99Ms']:>10.1f} {result['peakMemoryMb']:>17.1f}")
+        print(f"Wrote the results to {options['output']}.")
+
+        if options["baseline"]:
+            self.compare(options["baseline"], results)
+
+    def create_dataset(self):
+        """
+        Add tracks with GPS data for the duration of the rides until the dataset has the configured size, and answers to half of them.
+        """
+        create_tracks(self.options["tracks"], n_gps_points=self.options["duration"], seed=self.options["seed"])
+        create_answers(self.options["tracks"] // 2, seed=self.options["seed"])
+
+    def run_post(self) -> dict:
+        rides = [generate_ride(self.options["duration"], self.options["imu_rate"], rng=self.rng) for _ in range(min(RIDE_POOL_SIZE, self.options["uploads"]))]
+        view = PostTrackResource.as_view()
+
+        def request(i: int):
+            files = ride_upload(rides[i % len(rides)], f"benchmark-{uuid.uuid4().hex}")
+            return self.factory.post("/tracks/post/", {name: SimpleUploadedFile(name, data) for name, data in files.items()})
+
+        upload_bytes = sum(len(data) for data in ride_upload(rides[0], "size").values())
+        # The multipart bodies are encoded before the timing, like the server receives them.
+        requests = [request(i) for i in range(self.options["uploads"])]
+        result = self.measure(lambda i: self.check_response(view(requests[i])), len(requests), lambda: self.check_response(view(request(-1))))
+        result["uploadBytes"] = upload_bytes
+        return result
+
+    def run_list(self) -> dict:
+        view = ListTracksResource.as_view()
+        cursor = {"next": ""}
+
+        def list_page(_):
+            # Walk through the tracks like a client in the cursor mode, and start over at the end.
+            page = json.loads(self.check_response(view(self.factory.get("/tracks/list/", {"key": settings.API_KEY, "cursor": cursor["next"], "pageSize": 50}))).content)
+            if not page["results"]:
+                raise CommandError("The list endpoint returned no tracks.")
+            cursor["next"] = page["next"] or ""
+
+        return self.measure(list_page, self.options["requests"], lambda: list_page(None))
+
+    def run_fetch(self) -> dict:
+        view = FetchTrackResource.as_view()
+        # The uploaded rides have sensor data, so they are fetched if there are any.
+        pks = list(Track.objects.filter(session_id__startswith="benchmark-").values_list("pk", flat=True)) or list(Track.objects.values_list("pk", flat=True)[:1000])
+        requests = [self.factory.get("/tracks/fetch/", {"key": settings.API_KEY, "pk": self.rng.choice(pks)}) for _ in range(self.options["requests"])]
+        return self.measure(lambda i: self.consume(view(requests[i])), len(requests), lambda: self.consume(view(requests[0])))
+
+    def run_generate_metrics(self) -> dict:
+        def generate(_):
+            with redirect_stdout(io.StringIO()):
+                call_command("generate_metrics")
+
+        return self.measure(generate, self.options["repeat"], lambda: generate(None))
+
+    def run_sync(self) -> dict:
+        """
+        Pull all tracks and answers like the manager, from an empty database.
+
+        Every run dumps the wire stream of the worker into a file, deletes the tracks and answers and loads the stream.
+        """
+        n_tracks, n_answers = Track.objects.count(), Answer.objects.count()
+        params = {"format": "wire", "version": VERSION}
+        if settings.SYNC_KEY is not None:
+            params["key"] = settings.SYNC_KEY
+
+        def sync(_):
+            with tempfile.TemporaryFile() as file:
+                for chunk in self.check_response(SyncResource.as_view()(self.factory.get("/sync/sync", params))).streaming_content:
+                    file.write(chunk)
+                Track.objects.all().delete()
+                Answer.objects.all().delete()
+                file.seek(0)
+                load_wire(file)
+            if Track.objects.count() != n_tracks or Answer.objects.count() != n_answers:
+                raise CommandError(f"The sync lost data: {Track.objects.count()} tracks, {Answer.objects.count()} answers.")
+
+        result = self.measure(sync, self.options["repeat"], lambda: sync(None))
+        # The tracks were inserted past the deletions, so the aggregates of the metrics are recomputed.
+        rebuild_rollups()
+        result["tracks"], result["answers"] = n_tracks, n_answers
+        return result
+
+    def measure(self, operation, n: int, traced_operation) -> dict:
+        """
+        Time `n` runs of the operation, then trace the peak memory of another one.
+        """
+        latencies = []
+        start = time.perf_counter()
+        for i in range(n):
+            operation_start = time.perf_counter()
+            operation(i)
+            latencies.append(time.perf_counter() - operation_start)
+        seconds = time.perf_counter() - start
+
+        tracemalloc.start()
+        try:
+            traced_operation()
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+
+        p50, p99 = np.percentile(latencies, [50, 99])
+        return {
+            "operations": n,
+            "seconds": round(seconds, 4),
+            "perSecond": round(n / seconds, 3),
+            "p50Ms": round(p50 * 1000, 3),
+            "p99Ms": round(p99 * 1000, 3),
+            "peakMemoryMb": round(peak / 1024 / 1024, 2),
+        }
+
+    def check_response(self, response):
+        if response.status_code not in (200, 202):
+            raise CommandError(response.content.decode("utf-8"))
+        return response
+
+    def consume(self, response) -> int:
+        """
+        Read the response like a client, chunk by chunk, and return its size.
+        """
+        self.check_response(response)
+        if response.streaming:
+            return sum(len(chunk) for chunk in response.streaming_content)
+        return len(response.content)
+
+    def commit(self):
+        try:
+            return subprocess.run(["git", "rev-parse", "HEAD"], cwd=settings.BASE_DIR, capture_output=True, text=True, check=True).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            return None
+
+    def compare(self, path: str, results: dict):
+        """
+        Print the change of the throughput, the p99 latency and the peak memory against an earlier run.
+        """
+        with open(path) as file:
+            baseline = json.load(file)
+        print(f"\nCompared to {baseline.get('commit') or path}:")
+        print(f"{'scenario':<18} {'ops/s':>10} {'p99':>10} {'peak memory':>12}")
+        for scenario, result in results.items():
+            before = baseline.get("results", {}).get(scenario)
+            if before is None:
+                continue
+            changes = [
+                f"{(result[key] / before[key] - 1) * 100:+.1f}%" if before[key] else "-"
+                for key in ("perSecond", "p99Ms", "peakMemoryMb")
+            ]
+            print(f"{scenario:<18} {changes[0]:>10} {changes[1]:>10} {changes[2]:>12}")
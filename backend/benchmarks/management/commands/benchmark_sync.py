@@ -0,0 +1,93 @@
+import os
+import tempfile
+import time
+import tracemalloc
+
+from answers.models import Answer
+from benchmarks.synthetic import create_answers, create_tracks
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.test import RequestFactory
+from sync.views import SyncResource
+from sync.wire import VERSION, load_wire
+from tracks.models import Track
+
+
+class Command(BaseCommand):
+    help = """Compares the XML fixtures of the old sync and the wire format of the sync between workers and the manager. Deletes all tracks and answers, so only run it against a scratch database."""
+
+    def add_arguments(self, parser):
+        parser.add_argument("--tracks", type=int, nargs="+", default=[1_000, 10_000, 50_000], help="The numbers of tracks to sync.")
+        parser.add_argument("--gps-points", type=int, default=600, help="The number of GPS points per generated track.")
+        parser.add_argument("--sensor-samples", type=int, default=1_500, help="The number of samples per inertial sensor of the generated tracks.")
+        parser.add_argument("--formats", type=str, nargs="+", default=["xml", "wire"], choices=["xml", "wire"], help="The formats to compare.")
+        parser.add_argument("--trace-memory", action="store_true", help="Trace the peak memory, which slows down both formats.")
+
+    def handle(self, *args, **options):
+        if Track.objects.exists() or Answer.objects.exists():
+            raise CommandError("The database already contains tracks or answers. Run this command against a scratch database.")
+        self.factory = RequestFactory()
+        self.trace_memory = options["trace_memory"]
+
+        print(f"{'tracks':>7} {'format':<6} {'dump [s]':>9} {'bytes':>12} {'load [s]':>9} {'dump peak [MB]':>15} {'load peak [MB]':>15}")
+        try:
+            for n_tracks in sorted(options["tracks"]):
+                create_tracks(n_tracks, options["gps_points"], n_sensor_samples=options["sensor_samples"])
+                create_answers(n_tracks // 2)
+                for response_format in options["formats"]:
+                    with tempfile.TemporaryDirectory() as temp_dir:
+                        path = os.path.join(temp_dir, f"sync.{response_format}")
+                        (dump_time, dump_peak), size = self.measure(lambda: self.dump(response_format, path))
+                        # The manager starts without the data of the worker.
+                        Track.objects.all().delete()
+                        Answer.objects.all().delete()
+                        (load_time, load_peak), _ = self.measure(lambda: self.load(response_format, path))
+                    if Track.objects.count() != n_tracks or Answer.objects.count() != n_tracks // 2:
+                        raise CommandError(f"The {response_format} sync lost data: {Track.objects.count()} tracks, {Answer.objects.count()} answers.")
+                    print(f"{n_tracks:>7} {response_format:<6} {dump_time:>9.2f} {size:>12} {load_time:>9.2f} {self.format_peak(dump_peak):>15} {self.format_peak(load_peak):>15}")
+        finally:
+            Track.objects.all().delete()
+            Answer.objects.all().delete()
+
+    def dump(self, response_format: str, path: str) -> int:
+        """
+        Request the data like the manager and write the response to a file. Returns its size.
+
+        The workers don't serve XML fixtures anymore, they are dumped like the old sync did.
+        """
+        if response_format == "xml":
+            call_command("dumpdata", "--format", "xml", "tracks", "answers", "--output", path, verbosity=0)
+            return os.path.getsize(path)
+        params = {"format": response_format, "version": VERSION}
+        if settings.SYNC_KEY is not None:
+            params["key"] = settings.SYNC_KEY
+        response = SyncResource.as_view()(self.factory.get("/sync/sync", params))
+        if response.status_code != 200:
+            raise CommandError(response.content.decode("utf-8"))
+        with open(path, "wb") as file:
+            for chunk in response.streaming_content:
+                file.write(chunk)
+        return os.path.getsize(path)
+
+    def load(self, response_format: str, path: str):
+        if response_format == "xml":
+            call_command("loaddata", "--format=xml", path, verbosity=0)
+        else:
+            with open(path, "rb") as file:
+                load_wire(file)
+
+    def measure(self, fn):
+        if self.trace_memory:
+            tracemalloc.start()
+        start = time.perf_counter()
+        result = fn()
+        duration = time.perf_counter() - start
+        peak = None
+        if self.trace_memory:
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+        return (duration, peak), result
+
+    def format_peak(self, peak) -> str:
+        return f"{peak / 1024 / 1024:.1f}" if peak is not None else "-"
@@ -0,0 +1,65 @@
+import io
+import statistics
+import time
+from contextlib import redirect_stdout
+
+from benchmarks.synthetic import create_tracks
+from django.contrib import admin
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db import connection, reset_queries
+from django.test import RequestFactory
+from tracks.models import Track
+from tracks.views import ListTracksResource
+
+
+class Command(BaseCommand):
+    help = """Generates synthetic tracks and measures the list endpoint, the admin changelist and the metrics command on them."""
+
+    def add_arguments(self, parser):
+        parser.add_argument("--tracks", type=int, default=100_000, help="The number of tracks in the dataset. Missing tracks are generated.")
+        parser.add_argument("--gps-points", type=int, default=600, help="The number of GPS points per generated track.")
+        parser.add_argument("--repeat", type=int, default=5, help="The number of runs per measurement, the median is reported.")
+        parser.add_argument("--seed", type=int, default=0, help="The seed of the generated dataset.")
+
+    def handle(self, *args, **options):
+        create_tracks(options["tracks"], options["gps_points"], options["seed"])
+        repeat = options["repeat"]
+        factory = RequestFactory()
+        list_view = ListTracksResource.as_view()
+
+        print(f"{'measurement':<40} {'median [s]':>11}")
+        for label, params in [
+            ("list page 1", {"page": 1}),
+            ("list page 100", {"page": 100}),
+            ("list backend+deviceType page 10", {"page": 10, "backend": "production", "deviceType": "Pixel 7"}),
+        ]:
+            request = factory.get("/tracks/list/", {"key": "secret", "pageSize": 100, **params})
+            self.report(label, lambda: list_view(request), repeat)
+
+        changelist = admin.site._registry[Track]
+        request = factory.get("/admin/tracks/track/")
+        self.report("admin changelist page (100 rows)", lambda: [str(track) for track in changelist.get_queryset(request)[:100]], repeat)
+
+        # The first run of the metrics command classifies every track for the battery analysis,
+        # later runs only classify new tracks.
+        self.report("generate_metrics (first run)", self.run_metrics, 1, setup=lambda: Track.objects.update(has_battery_data=None, avg_battery_consumption=None))
+        self.report("generate_metrics", self.run_metrics, repeat)
+
+    def run_metrics(self):
+        with redirect_stdout(io.StringIO()):
+            call_command("generate_metrics")
+
+    def report(self, label: str, fn, repeat: int, setup=None):
+        durations = []
+        n_queries = 0
+        for _ in range(repeat):
+            if setup is not None:
+                setup()
+            reset_queries()
+            start = time.perf_counter()
+            fn()
+            durations.append(time.perf_counter() - start)
+            n_queries = len(connection.queries)
+        queries = f" ({n_queries} queries)" if connection.queries_logged else ""
+        print(f"{label:<40} {statistics.median(durations):>11.4f}{queries}")
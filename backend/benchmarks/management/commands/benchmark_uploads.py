@@ -0,0 +1,124 @@
+import gzip
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from benchmarks.synthetic import (generate_gps_csv, generate_metadata,
+                                  generate_sensor_csv)
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from tracks.sensors import SENSORS
+
+# The gunicorn arguments of the server modes, like in run-server.sh.
+SERVER_ARGS = {
+    "wsgi": ["backend.wsgi:application"],
+    "asgi": ["backend.asgi:application", "--worker-class", "uvicorn.workers.UvicornWorker"],
+}
+
+
+def generate_upload(n_gps_points: int, n_sensor_samples: int):
+    """
+    Generate the compressed multipart files of a valid track upload, without the metadata.
+    """
+    files = {"gps.csv.gz": gzip.compress(generate_gps_csv(n_gps_points).encode("utf-8"))}
+    for sensor in SENSORS:
+        files[f"{sensor}.csv.gz"] = gzip.compress(generate_sensor_csv(n_sensor_samples).encode("utf-8"))
+    return files
+
+
+def valid_metadata(session_id: str) -> bytes:
+    """
+    Generate compressed metadata of a track that passes the validation.
+    """
+    metadata = generate_metadata(session_id)
+    metadata.update(debug=False, backend="production", positioningMode="gnss")
+    return gzip.compress(json.dumps(metadata).encode("utf-8"))
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def wait_for_server(url: str, timeout: float = 30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            requests.get(url, timeout=5)
+            return
+        except requests.RequestException:
+            time.sleep(0.2)
+    raise CommandError(f"Server at {url} didn't start within {timeout}s.")
+
+
+class Command(BaseCommand):
+    help = """Measures the throughput of concurrent track uploads with sync (WSGI) and async (ASGI) serving."""
+
+    def add_arguments(self, parser):
+        parser.add_argument("--url", type=str, default=None, help="Upload to a running server (e.g. http://localhost:8000/tracks/post/) instead of starting one per mode.")
+        parser.add_argument("--modes", type=str, nargs="+", default=["wsgi", "asgi"], choices=list(SERVER_ARGS), help="The server modes to benchmark.")
+        parser.add_argument("--workers", type=int, default=4, help="The number of gunicorn workers of the started servers.")
+        parser.add_argument("--concurrency", type=int, nargs="+", default=[8, 32, 128], help="The numbers of concurrent clients.")
+        parser.add_argument("--requests", type=int, default=256, help="The number of uploads per run.")
+        parser.add_argument("--gps-points", type=int, default=1_000, help="The number of GPS points per track.")
+        parser.add_argument("--sensor-samples", type=int, default=10_000, help="The number of samples per inertial sensor.")
+
+    def handle(self, *args, **options):
+        files = generate_upload(options["gps_points"], options["sensor_samples"])
+        size = sum(len(data) for data in files.values())
+        print(f"Upload size: {size / 1024:.0f} KiB compressed")
+
+        if options["url"]:
+            self.run(options["url"], files, options)
+            return
+
+        for mode in options["modes"]:
+            port = free_port()
+            env = dict(os.environ, WORKER_MODE="True", SERVER_MODE=mode, SYNC_EXPOSED="False")
+            server = subprocess.Popen(
+                [sys.executable, "-m", "gunicorn", *SERVER_ARGS[mode], "--workers", str(options["workers"]), "--bind", f"127.0.0.1:{port}", "--log-level", "warning"],
+                cwd=settings.BASE_DIR, env=env, stdout=subprocess.DEVNULL,
+            )
+            try:
+                url = f"http://127.0.0.1:{port}/tracks/post/"
+                wait_for_server(url)
+                print(f"\n{mode} ({options['workers']} workers)")
+                self.run(url, files, options)
+            finally:
+                server.terminate()
+                server.wait()
+
+    def run(self, url: str, files, options):
+        print(f"{'clients':>8} {'uploads/s':>10} {'p50 [ms]':>9} {'p95 [ms]':>9} {'p99 [ms]':>9} {'errors':>7}")
+        for concurrency in options["concurrency"]:
+            session = requests.Session()
+            session.mount("http://", requests.adapters.HTTPAdapter(pool_maxsize=concurrency))
+
+            def upload(_):
+                upload_files = {name: (name, data) for name, data in files.items()}
+                upload_files["metadata.json.gz"] = ("metadata.json.gz", valid_metadata(uuid.uuid4().hex))
+                start = time.perf_counter()
+                try:
+                    response = session.post(url, files=upload_files, timeout=300)
+                    ok = response.status_code in (200, 202)
+                except requests.RequestException:
+                    ok = False
+                return time.perf_counter() - start, ok
+
+            start = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=concurrency) as executor:
+                results = list(executor.map(upload, range(options["requests"])))
+            duration = time.perf_counter() - start
+
+            latencies = sorted(latency for latency, _ in results)
+            quantiles = statistics.quantiles(latencies, n=100)
+            errors = sum(1 for _, ok in results if not ok)
+            print(f"{concurrency:>8} {len(results) / duration:>10.1f} {quantiles[49] * 1000:>9.0f} {quantiles[94] * 1000:>9.0f} {quantiles[98] * 1000:>9.0f} {errors:>7}")
@@ -0,0 +1,377 @@
+import gzip
+import io
+import json
+import math
+import random
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import Dict, NamedTuple
+
+import numpy as np
+from answers.models import Answer
+from monitoring.rollups import rebuild_rollups
+from sync.wire import insert_answers
+from tracks.attributes import ATTRIBUTES_VERSION
+from tracks.ingest import build_track, insert_tracks
+from tracks.models import SensorStream, Track
+from tracks.sensors import (CSV_HEADER, SENSORS, encode_sensor_data,
+                            parse_sensor_csv)
+from tracks.validation import BOUNDING_BOXES
+
+# Rough distributions of the field values of real tracks.
+BACKENDS = {"production": 0.8, "staging": 0.15, "release": 0.05}
+POSITIONING_MODES = {"gnss": 0.95, "follow18kmh": 0.03, "follow40kmh": 0.02}
+DEVICE_TYPES = {
+    "iPhone 14,7": 0.2, "iPhone 13,2": 0.15, "iPhone 11,2": 0.1, "iPhone 15,4": 0.1,
+    "SM-G991B": 0.15, "Pixel 7": 0.1, "SM-A536B": 0.1, "Pixel 6a": 0.05, "moto g52": 0.05,
+}
+BIKE_TYPES = {"citybike": 0.5, "racingbike": 0.15, "mountainbike": 0.15, "ebike": 0.15, "cargobike": 0.05}
+PREFERENCE_TYPES = {"fast": 0.6, "comfortable": 0.4}
+ACTIVITY_TYPES = {"commute": 0.5, "leisure": 0.3, "sport": 0.1, "unknown": 0.1}
+
+# The share of tracks that are recorded in debug mode.
+DEBUG_SHARE = 0.05
+
+# The first track start time, 2023-04-01 in unix milliseconds.
+START_TIME = 1680307200000
+
+# The number of rows that are inserted per batch when a dataset is generated.
+BATCH_SIZE = 1_000
+
+# The speed of a ride in m/s, its mean and standard deviation.
+RIDE_SPEED = (5.0, 1.5)
+
+# The mean magnetic field in Hamburg and Dresden in µT, as measured by the magnetometer.
+MAGNETIC_FIELD = (18.0, 0.5, -46.0)
+
+# The mean number of taps on the screen per minute of a ride.
+TAPS_PER_MINUTE = 2
+
+# The questions of the feedback dialog and their answer values.
+QUESTIONS = {
+    "Dein Feedback zur App": ["1", "2", "3", "4", "5"],
+    "Wie sicher hast du dich gefühlt?": ["strongly disagree", "disagree", "neutral", "agree", "strongly agree"],
+    "Hast du die Geschwindigkeitsempfehlung befolgt?": ["yes", "no"],
+}
+
+
+def choose(distribution, rng=random):
+    return rng.choices(list(distribution), weights=list(distribution.values()))[0]
+
+
+def generate_gps_csv(n_points: int, backend: str = "production", rng=random) -> str:
+    """
+    Generate a GPS CSV with `n_points` points inside the bounding box of the backend.
+    """
+    min_lat, max_lat, min_lon, max_lon = BOUNDING_BOXES[backend]
+    lines = ["timestamp,longitude,latitude,speed,accuracy"]
+    for i in range(n_points):
+        lon = rng.uniform(min_lon, max_lon)
+        lat = rng.uniform(min_lat, max_lat)
+        lines.append(f"{1712401108772 + i * 1000},{lon:.7f},{lat:.7f},{rng.uniform(0, 10):.2f},{rng.uniform(3, 20):.1f}")
+    return "\n".join(lines) + "\n"
+
+
+def generate_sensor_csv(n_samples: int, rng=random) -> str:
+    """
+    Generate a `timestamp,x,y,z` sensor CSV with `n_samples` samples.
+    """
+    lines = [CSV_HEADER]
+    for i in range(n_samples):
+        lines.append(f"{1712401108772 + i * 20},{rng.gauss(0, 1):.6f},{rng.gauss(0, 1):.6f},{rng.gauss(9.81, 1):.6f}")
+    return "\n".join(lines) + "\n"
+
+
+def generate_metadata(session_id: str = None, rng=random) -> dict:
+    """
+    Generate the metadata of a track like the app sends it.
+
+    Tracks take 5 to 60 minutes and log a battery state per minute. Some of them are charging.
+    """
+    session_id = session_id or uuid.uuid4().hex
+    backend = choose(BACKENDS, rng)
+    device_type = choose(DEVICE_TYPES, rng)
+    start_time = START_TIME + rng.randrange(365 * 24 * 60 * 60 * 1000)
+    n_minutes = rng.randint(5, 60)
+    end_time = start_time + n_minutes * 60 * 1000
+
+    level = rng.randint(20, 100)
+    charging = rng.random() < 0.1
+    battery_states = []
+    for minute in range(n_minutes + 1):
+        battery_state = {"level": level, "timestamp": start_time + minute * 60 * 1000}
+        if charging:
+            battery_state["batteryState"] = "BatteryState.charging"
+        battery_states.append(battery_state)
+        if rng.random() < 0.2:
+            level = max(level - 1, 0)
+
+    min_lat, max_lat, min_lon, max_lon = BOUNDING_BOXES[backend]
+    waypoints = [{"lat": rng.uniform(min_lat, max_lat), "lon": rng.uniform(min_lon, max_lon)} for _ in range(2)]
+    return {
+        "startTime": start_time,
+        "endTime": end_time,
+        "debug": rng.random() < DEBUG_SHARE,
+        "backend": backend,
+        "positioningMode": choose(POSITIONING_MODES, rng),
+        "userId": f"user-{rng.randrange(20_000)}",
+        "sessionId": session_id,
+        "deviceType": device_type,
+        "deviceHeight": rng.choice([812, 844, 896, 915]),
+        "deviceWidth": rng.choice([375, 390, 412, 414]),
+        "appVersion": rng.choice(["1.4.0", "1.5.1", "1.6.0"]),
+        "buildNumber": str(rng.randint(1000, 2000)),
+        "bikeType": choose(BIKE_TYPES, rng),
+        "preferenceType": choose(PREFERENCE_TYPES, rng),
+        "activityType": choose(ACTIVITY_TYPES, rng),
+        "statusSummary": {},
+        "taps": [],
+        "selectedWaypoints": waypoints,
+        "routes": [
+            {
+                "id": route,
+                "waypoints": waypoints,
+                "path": [[rng.uniform(min_lon, max_lon), rng.uniform(min_lat, max_lat)] for _ in range(rng.randint(50, 300))],
+            }
+            for route in range(rng.randint(1, 3))
+        ],
+        "predictions": [
+            {"timestamp": start_time + i * 1000, "greentimeThreshold": 50, "predictionQuality": rng.random()}
+            for i in range(rng.randint(0, 200))
+        ],
+        "batteryStates": battery_states,
+        "isDarkMode": rng.random() < 0.4,
+        "saveBatteryModeEnabled": rng.random() < 0.2,
+    }
+
+
+class Ride(NamedTuple):
+    metadata: dict
+    gps_csv: str
+    sensor_csvs: Dict[str, str]
+
+
+def generate_ride(duration: int, imu_rate: int, valid: bool = True, rng=random) -> Ride:
+    """
+    Generate a ride of `duration` seconds like the app records it.
+
+    The GPS position is logged at 1 Hz along a continuous path at cycling
+    speed, the inertial sensors at `imu_rate` Hz. The metadata has a battery
+    state per minute and some taps. If `valid` is set, the ride passes the validation.
+    """
+    metadata = generate_metadata(rng=rng)
+    if valid:
+        metadata.update(debug=False, positioningMode="gnss")
+    start_time = metadata["startTime"]
+    metadata["endTime"] = start_time + duration * 1000
+
+    level = rng.randint(20, 100)
+    charging = rng.random() < 0.1
+    battery_states = []
+    for minute in range(duration // 60 + 1):
+        battery_state = {"level": level, "timestamp": start_time + minute * 60 * 1000}
+        if charging:
+            battery_state["batteryState"] = "BatteryState.charging"
+        battery_states.append(battery_state)
+        if rng.random() < 0.2:
+            level = max(level - 1, 0)
+    metadata["batteryStates"] = battery_states
+
+    n_taps = rng.randint(0, 2 * TAPS_PER_MINUTE * max(duration // 60, 1))
+    metadata["taps"] = sorted(
+        [
+            {
+                "timestamp": start_time + rng.randrange(duration * 1000),
+                "x": round(rng.uniform(0, metadata["deviceWidth"]), 1),
+                "y": round(rng.uniform(0, metadata["deviceHeight"]), 1),
+            }
+            for _ in range(n_taps)
+        ],
+        key=lambda tap: tap["timestamp"],
+    )
+
+    np_rng = np.random.default_rng(rng.randrange(2 ** 32))
+    gps_csv = generate_gps_path(duration, start_time, metadata["backend"], np_rng)
+    sensor_csvs = {sensor: generate_imu_csv(sensor, duration * imu_rate, imu_rate, start_time, np_rng) for sensor in SENSORS}
+    return Ride(metadata, gps_csv, sensor_csvs)
+
+
+def generate_gps_path(n_points: int, start_time: int, backend: str, np_rng) -> str:
+    """
+    Generate a GPS CSV with a point per second along a path at cycling speed, inside the bounding box of the backend.
+    """
+    min_lat, max_lat, min_lon, max_lon = BOUNDING_BOXES[backend]
+    speed = np.clip(np_rng.normal(*RIDE_SPEED, n_points), 0, None)
+    heading = np_rng.uniform(0, 2 * math.pi) + np.cumsum(np_rng.normal(0, 0.1, n_points))
+    lat_0 = np_rng.uniform(min_lat + 0.1, max_lat - 0.1)
+    lon_0 = np_rng.uniform(min_lon + 0.1, max_lon - 0.1)
+    # Meters per degree of latitude, and of longitude at the start of the path.
+    lat = lat_0 + np.cumsum(speed * np.cos(heading)) / 111_320
+    lon = lon_0 + np.cumsum(speed * np.sin(heading)) / (111_320 * math.cos(math.radians(lat_0)))
+    columns = np.column_stack([
+        start_time + np.arange(n_points) * 1000,
+        np.clip(lon, min_lon, max_lon),
+        np.clip(lat, min_lat, max_lat),
+        speed,
+        np_rng.uniform(3, 20, n_points),
+    ])
+    buffer = io.StringIO()
+    np.savetxt(buffer, columns, fmt=["%d", "%.7f", "%.7f", "%.2f", "%.1f"], delimiter=",", header="timestamp,longitude,latitude,speed,accuracy", comments="")
+    return buffer.getvalue()
+
+
+def generate_imu_csv(sensor: str, n_samples: int, rate: int, start_time: int, np_rng) -> str:
+    """
+    Generate a `timestamp,x,y,z` sensor CSV with `n_samples` samples at `rate` Hz around the resting values of the sensor.
+    """
+    if sensor == "accelerometer":
+        mean, std = (0.0, 0.0, 9.81), 1.5
+    elif sensor == "magnetometer":
+        mean, std = MAGNETIC_FIELD, 2.0
+    else:
+        mean, std = (0.0, 0.0, 0.0), 0.3
+    columns = np.column_stack([
+        start_time + np.arange(n_samples) * 1000 // rate,
+        np_rng.normal(mean, std, (n_samples, 3)),
+    ])
+    buffer = io.StringIO()
+    np.savetxt(buffer, columns, fmt=["%d", "%.6f", "%.6f", "%.6f"], delimiter=",", header=CSV_HEADER, comments="")
+    return buffer.getvalue()
+
+
+def ride_upload(ride: Ride, session_id: str) -> Dict[str, bytes]:
+    """
+    Get the compressed multipart files of a ride as the app uploads them, with the given session id.
+    """
+    files = {
+        "metadata.json.gz": gzip.compress(json.dumps(dict(ride.metadata, sessionId=session_id)).encode("utf-8")),
+        "gps.csv.gz": gzip.compress(ride.gps_csv.encode("utf-8")),
+    }
+    for sensor, csv in ride.sensor_csvs.items():
+        files[f"{sensor}.csv.gz"] = gzip.compress(csv.encode("utf-8"))
+    return files
+
+
+class GPSPool:
+    """
+    A pool of compressed GPS CSVs per backend, which are shared by the generated tracks.
+
+    Compressing a CSV for every track would dominate the time to generate large datasets.
+    """
+    def __init__(self, n_points: int, size: int = 20, rng=random):
+        self.blobs = {
+            backend: [gzip.compress(generate_gps_csv(n_points, backend, rng).encode("utf-8")) for _ in range(size)]
+            for backend in BACKENDS
+        }
+
+    def get(self, backend: str, rng=random) -> bytes:
+        return rng.choice(self.blobs[backend])
+
+
+class SensorPool:
+    """
+    A pool of encoded sensor streams, which are shared by the generated tracks like the GPS CSVs.
+    """
+    def __init__(self, n_samples: int, size: int = 20, rng=random):
+        self.streams = [encode_sensor_data(parse_sensor_csv([generate_sensor_csv(n_samples, rng)])) for _ in range(size)]
+        self.n_samples = n_samples
+
+    def get(self, sensor: str, rng=random) -> SensorStream:
+        return SensorStream(sensor=sensor, n_samples=self.n_samples, data=rng.choice(self.streams))
+
+
+def create_tracks(n_tracks: int, n_gps_points: int = 600, seed: int = 0, n_sensor_samples: int = 0):
+    """
+    Insert synthetic tracks until the database contains `n_tracks` tracks.
+
+    If `n_sensor_samples` is set, the tracks get sensor streams with as many samples per sensor.
+    """
+    n_existing = Track.objects.count()
+    if n_existing >= n_tracks:
+        print(f"Using {n_existing} existing tracks.")
+        return
+    rng = random.Random(seed + n_existing)
+    gps_pool = GPSPool(n_gps_points, rng=rng)
+    sensor_pool = SensorPool(n_sensor_samples, rng=rng) if n_sensor_samples else None
+    start = time.perf_counter()
+    for offset in range(n_existing, n_tracks, BATCH_SIZE):
+        tracks = []
+        for i in range(offset, min(offset + BATCH_SIZE, n_tracks)):
+            metadata = generate_metadata(f"synthetic-{seed}-{i}", rng)
+            track = build_track(metadata, gps_pool.get(metadata["backend"], rng), {sensor: None for sensor in SENSORS})
+            sensor_streams = [sensor_pool.get(sensor, rng) for sensor in SENSORS] if sensor_pool else []
+            tracks.append((track, sensor_streams))
+        insert_tracks(tracks)
+        print(f"\rGenerated {min(offset + BATCH_SIZE, n_tracks)}/{n_tracks} tracks", end="", flush=True)
+    print(f"\nGenerating the tracks took {time.perf_counter() - start:.1f}s.")
+
+
+def create_track_rows(n_tracks: int, seed: int = 0):
+    """
+    Insert synthetic tracks without payloads until the database contains `n_tracks` tracks.
+
+    Much faster than create_tracks, for benchmarks that only query the track
+    table. The tracks have no battery data and no attributes. The aggregates of
+    the metrics are rebuilt afterwards, since the tracks are inserted past them.
+    """
+    n_existing = Track.objects.count()
+    if n_existing >= n_tracks:
+        print(f"Using {n_existing} existing tracks.")
+        return
+    rng = random.Random(seed + n_existing)
+    start = time.perf_counter()
+    batch_size = 10 * BATCH_SIZE
+    for offset in range(n_existing, n_tracks, batch_size):
+        tracks = []
+        for i in range(offset, min(offset + batch_size, n_tracks)):
+            start_time = START_TIME + rng.randrange(365 * 24 * 60 * 60 * 1000)
+            # Some tracks weren't finished.
+            end_time = start_time + rng.randint(5, 60) * 60 * 1000 if rng.random() < 0.95 else None
+            tracks.append(Track(
+                session_id=f"rows-{seed}-{i}",
+                start_time=start_time,
+                end_time=end_time,
+                debug=rng.random() < DEBUG_SHARE,
+                backend=choose(BACKENDS, rng),
+                positioning_mode=choose(POSITIONING_MODES, rng),
+                user_id=f"user-{rng.randrange(20_000)}",
+                device_type=choose(DEVICE_TYPES, rng),
+                bike_type=choose(BIKE_TYPES, rng),
+                preference_type=choose(PREFERENCE_TYPES, rng),
+                activity_type=choose(ACTIVITY_TYPES, rng),
+                has_battery_data=False,
+                attributes_version=ATTRIBUTES_VERSION,
+            ))
+        Track.objects.bulk_create(tracks)
+        print(f"\rGenerated {min(offset + batch_size, n_tracks)}/{n_tracks} tracks", end="", flush=True)
+    print(f"\nGenerating the tracks took {time.perf_counter() - start:.1f}s.")
+    rebuild_rollups()
+
+
+def create_answers(n_answers: int, seed: int = 0):
+    """
+    Insert synthetic answers until the database contains `n_answers` answers.
+
+    The answers are spread over a year, some of them share the same second.
+    """
+    n_existing = Answer.objects.count()
+    if n_existing >= n_answers:
+        print(f"Using {n_existing} existing answers.")
+        return
+    rng = random.Random(seed + n_existing)
+    first_date = datetime.fromtimestamp(START_TIME / 1000, tz=timezone.utc)
+    for offset in range(n_existing, n_answers, BATCH_SIZE):
+        answers = []
+        for i in range(offset, min(offset + BATCH_SIZE, n_answers)):
+            question = rng.choice(list(QUESTIONS))
+            answers.append(Answer(
+                session_id=f"synthetic-{seed}-{i}",
+                user_id=f"user-{rng.randrange(20_000)}",
+                question_text=question,
+                value=rng.choice(QUESTIONS[question]),
+                date=first_date + timedelta(seconds=rng.randrange(365 * 24 * 60 * 60)),
+            ))
+        insert_answers(answers)
+        print(f"\rGenerated {min(offset + BATCH_SIZE, n_answers)}/{n_answers} answers", end="", flush=True)
+    print()
@@ -0,0 +1,104 @@
+"""
+Prometheus histograms that are built from raw values with NumPy.
+
+The observed values are collected per series, i.e. per combination of label
+values, and bucketed when the histogram is rendered: the index of the bucket
+of every value is found with one binary search, the buckets are counted with
+`bincount` and made cumulative with `cumsum`. The sum is the exact sum of the
+values. A histogram takes any label names and bucket bounds, so breaking it
+down by another label only adds series.
+
+Histograms whose buckets are counted elsewhere, like the request metrics of
+the server processes, are rendered with `render_series`.
+"""
+from array import array
+from typing import Dict, Iterable, List, Sequence, Tuple
+
+import numpy as np
+
+
+def linear_buckets(start: float, width: float, count: int) -> List[float]:
+    """
+    Get `count` bucket bounds, starting at `start` and `width` apart.
+    """
+    # Rounded, such that e.g. the third bound of 0.1 wide buckets is 0.3 and not 0.30000000000000004.
+    return [round(start + i * width, 10) for i in range(count)]
+
+
+def exponential_buckets(start: float, factor: float, count: int) -> List[float]:
+    """
+    Get `count` bucket bounds, starting at `start` and each `factor` times the previous one.
+    """
+    return [round(start * factor ** i, 10) for i in range(count)]
+
+
+def escape_label_value(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def render_series(name: str, les: Sequence[str], label_names: Sequence[str], series: Iterable[Tuple[Sequence, Sequence[int], float, int]]) -> List[str]:
+    """
+    Get the lines of a histogram from the labels, the cumulative bucket counts, the sum and the count of every series.
+    """
+    # The type tells Prometheus and OpenMetrics parsers that the series belong to one histogram.
+    lines = [f"# TYPE {name} histogram"]
+    for labels, buckets, total, count in series:
+        label_pairs = [f'{label_name}="{escape_label_value(value)}"' for label_name, value in zip(label_names, labels)]
+        for le, bucket_count in zip(les, buckets):
+            bucket_labels = ", ".join(label_pairs + [f'le="{le}"'])
+            lines.append(f"{name}_bucket{{{bucket_labels}}} {bucket_count}")
+        label_text = f'{{{", ".join(label_pairs)}}}' if label_pairs else ""
+        lines.append(f"{name}_sum{label_text} {float(total)}")
+        lines.append(f"{name}_count{label_text} {count}")
+    return lines
+
+
+class Histogram:
+    """
+    A histogram with the given label names and upper bucket bounds. The `+Inf` bucket is added.
+    """
+
+    def __init__(self, name: str, bounds: Sequence[float], label_names: Sequence[str] = (), le_format: str = "{:g}"):
+        self.name = name
+        self.bounds = np.asarray(bounds, dtype=np.float64)
+        if np.any(np.diff(self.bounds) <= 0):
+            raise ValueError("The bucket bounds must be increasing.")
+        self.label_names = tuple(label_names)
+        self.le_format = le_format
+        # The observed values of every series, in the order in which the series were added.
+        self.series: Dict[tuple, array] = {}
+
+    def add_series(self, labels: Sequence):
+        """
+        Add a series without values, such that it is rendered even if nothing is observed.
+        """
+        self.values(labels)
+
+    def values(self, labels: Sequence) -> array:
+        labels = tuple(labels)
+        if len(labels) != len(self.label_names):
+            raise ValueError(f"Expected values for the labels {self.label_names}, got {labels}.")
+        if labels not in self.series:
+            self.series[labels] = array("d")
+        return self.series[labels]
+
+    def observe(self, labels: Sequence, value: float):
+        self.values(labels).append(value)
+
+    def observe_many(self, labels: Sequence, values: Sequence[float]):
+        self.values(labels).extend(values)
+
+    def render(self) -> List[str]:
+        """
+        Get the lines of the histogram in the Prometheus text format, which are also valid OpenMetrics.
+        """
+        les = [self.le_format.format(bound) for bound in self.bounds] + ["+Inf"]
+        return render_series(self.name, les, self.label_names, self.bucketed())
+
+    def bucketed(self):
+        for labels, values in self.series.items():
+            values = np.array(values, dtype=np.float64)
+            # The bucket of a value is the first one whose bound is at least the value.
+            indices = np.searchsorted(self.bounds, values, side="left")
+            buckets = np.cumsum(np.bincount(indices, minlength=len(self.bounds) + 1))
+            yield labels, buckets, values.sum(), len(values)
@@ -0,0 +1,209 @@
+"""
+Latency and size histograms of the requests, collected across all server processes.
+
+Every gunicorn worker counts its observations in memory and writes them into
+its own JSON file in REQUEST_METRICS_DIR, at most once per FLUSH_INTERVAL and
+from a background timer, so observations never wait longer than that for the
+file. The file is replaced atomically. The request metrics endpoint merges the
+files of all processes with the counts of the serving process. The files of
+exited processes are kept, such that the counters never go backwards, and the
+directory is cleared when the server starts.
+
+Only the processes that call enable(), i.e. the server processes and the
+drain_spool command, write their file. Other commands that run the upload
+code, e.g. the benchmarks, count in memory only.
+"""
+import atexit
+import bisect
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+
+from django.conf import settings
+from monitoring.histograms import exponential_buckets, render_series
+
+# The interval in seconds in which a process writes its observations into its file.
+FLUSH_INTERVAL = 1.0
+
+# The upper bounds of the latency buckets in seconds.
+LATENCY_BUCKETS = [0.005, 0.01, 0.025, 0.05, 0.075, 0.1, 0.25, 0.5, 0.75, 1.0, 2.5, 5.0, 7.5, 10.0, 30.0]
+
+# The upper bounds of the size buckets in bytes, from 1 KiB to 256 MiB.
+SIZE_BUCKETS = exponential_buckets(1024, 4, 10)
+
+# The histograms by name, with their bucket bounds and label names.
+HISTOGRAMS = {
+    "http_request_duration_seconds": (LATENCY_BUCKETS, ("view", "method", "status")),
+    "track_upload_stage_seconds": (LATENCY_BUCKETS, ("stage",)),
+    "track_upload_file_decompression_seconds": (LATENCY_BUCKETS, ("file",)),
+    "track_upload_file_bytes": (SIZE_BUCKETS, ("file", "encoding")),
+}
+
+# The counts of this process: the bucket counts (not cumulative), the sum and the count of every series.
+_series: Dict[str, Dict[tuple, list]] = {}
+_lock = threading.Lock()
+_timer: Optional[threading.Timer] = None
+# Whether this process writes its counts into its file.
+_enabled = False
+# The name of the file of this process. The start time makes it unique if a process id is reused.
+_file_name = f"{os.getpid()}-{time.time_ns()}.json"
+
+
+def _reset():
+    """
+    Forget the counts of the parent process in a forked process.
+    """
+    global _series, _lock, _timer, _file_name
+    _series = {}
+    _lock = threading.Lock()
+    _timer = None
+    _file_name = f"{os.getpid()}-{time.time_ns()}.json"
+
+
+os.register_at_fork(after_in_child=_reset)
+
+
+def enable():
+    """
+    Write the counts of this process into its file, from the background timer and at exit.
+    """
+    global _enabled
+    with _lock:
+        if _enabled:
+            return
+        _enabled = True
+    atexit.register(flush)
+
+
+def observe(name: str, labels: tuple, value: float):
+    """
+    Count a value in the series of a histogram.
+    """
+    global _timer
+    bounds, _ = HISTOGRAMS[name]
+    # The bucket of a value is the first one whose bound is at least the value.
+    index = bisect.bisect_left(bounds, value)
+    with _lock:
+        series = _series.setdefault(name, {})
+        entry = series.get(labels)
+        if entry is None:
+            entry = series[labels] = [[0] * (len(bounds) + 1), 0.0, 0]
+        entry[0][index] += 1
+        entry[1] += value
+        entry[2] += 1
+        if _enabled and _timer is None:
+            _timer = threading.Timer(FLUSH_INTERVAL, flush)
+            _timer.daemon = True
+            _timer.start()
+
+
+@contextmanager
+def timed(name: str, labels: tuple):
+    """
+    Observe the seconds that the block takes, also if it raises.
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(name, labels, time.perf_counter() - start)
+
+
+def stage(name: str):
+    """
+    Time a stage of the track upload.
+    """
+    return timed("track_upload_stage_seconds", (name,))
+
+
+def snapshot() -> dict:
+    """
+    Get the counts of this process as they are written into its file.
+    """
+    with _lock:
+        return {
+            name: [[list(labels), list(buckets), total, count] for labels, (buckets, total, count) in series.items()]
+            for name, series in _series.items()
+        }
+
+
+def flush():
+    """
+    Write the counts of this process into its file.
+    """
+    global _timer
+    with _lock:
+        _timer = None
+    counts = snapshot()
+    if not counts:
+        return
+    os.makedirs(settings.REQUEST_METRICS_DIR, exist_ok=True)
+    path = os.path.join(settings.REQUEST_METRICS_DIR, _file_name)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as file:
+        json.dump(counts, file)
+    os.replace(tmp_path, path)
+
+
+
+def collect() -> Dict[str, Dict[tuple, list]]:
+    """
+    Merge the counts of all processes.
+    """
+    merged: Dict[str, Dict[tuple, list]] = {}
+    processes = [snapshot()]
+    try:
+        file_names = os.listdir(settings.REQUEST_METRICS_DIR)
+    except FileNotFoundError:
+        file_names = []
+    for file_name in file_names:
+        # The counts of this process are more recent in memory, temporary files are partially written.
+        if file_name == _file_name or not file_name.endswith(".json"):
+            continue
+        try:
+            with open(os.path.join(settings.REQUEST_METRICS_DIR, file_name)) as file:
+                processes.append(json.load(file))
+        except (OSError, ValueError) as e:
+            print(f"Skipping the request metrics in {file_name}: {e}")
+
+    for counts in processes:
+        for name, series in counts.items():
+            if name not in HISTOGRAMS:
+                continue
+            bounds, _ = HISTOGRAMS[name]
+            merged_series = merged.setdefault(name, {})
+            for labels, buckets, total, count in series:
+                # Files that were written with other buckets, e.g. by an older version, can't be merged.
+                if len(buckets) != len(bounds) + 1:
+                    continue
+                entry = merged_series.get(tuple(labels))
+                if entry is None:
+                    merged_series[tuple(labels)] = [list(buckets), total, count]
+                    continue
+                entry[0] = [a + b for a, b in zip(entry[0], buckets)]
+                entry[1] += total
+                entry[2] += count
+    return merged
+
+
+def render() -> str:
+    """
+    Get the merged histograms of all processes in the Prometheus text format.
+    """
+    merged = collect()
+    lines: List[str] = []
+    for name, (bounds, label_names) in HISTOGRAMS.items():
+        # The full float representation, since e.g. 268435456 is 2.68435e+08 in the short format.
+        les = [str(float(bound)) for bound in bounds] + ["+Inf"]
+        series = []
+        for labels, (buckets, total, count) in sorted(merged.get(name, {}).items()):
+            cumulative, running = [], 0
+            for bucket_count in buckets:
+                running += bucket_count
+                cumulative.append(running)
+            series.append((labels, cumulative, total, count))
+        lines.extend(render_series(name, les, label_names, series))
+    return "\n".join(lines) + "\n"
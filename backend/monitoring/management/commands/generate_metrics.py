@@ -1,53 +1,25 @@
 import json
-from time import time
-from typing import List
-from django.db.models import Count, Sum
+from django.db.models import Count
 from tracks.models import Track
-from django.core.management.base import BaseCommand
-from tracks.models import Track
-from answers.models import Answer
+from django.core.management.base import BaseCommand, CommandError
+from monitoring.histograms import Histogram, linear_buckets
+from monitoring.models import AnswerRollup, LatestRating
+from monitoring.publication import write_metrics
+from tracks.attributes import backfill_attributes
+from tracks.battery import backfill_battery_features
+from monitoring.rollups import compare_rollups, compute_rollups, needs_rebuild, read_breakdowns, read_rollups, rebuild_rollups
 from django.conf import settings
 
-class BatteryConsumptionHistogram:
-    def __init__(self, number_of_buckets, is_android, is_dark, save_battery):
-        self.number_of_buckets = number_of_buckets
-        self.buckets = [0 for i in range(number_of_buckets)]
-        self.is_android = is_android
-        self.is_dark = is_dark
-        self.save_battery = save_battery
-        
-    def add_value(self, bucket_idx):
-        for i in range(bucket_idx, self.number_of_buckets):
-            self.buckets[i] += 1
-        
-    def get_metric_lines(self) -> List[str]:
-        lines = []
-        for i in range(self.number_of_buckets):
-            if i == self.number_of_buckets - 1:
-                lines.append(f'battery_consumption_bucket{{os="{"Android" if self.is_android else "iOS"}", is_dark="{self.is_dark}", save_battery="{self.save_battery}", le="+Inf"}} {self.buckets[i]}')
-            else:
-                lines.append(f'battery_consumption_bucket{{os="{"Android" if self.is_android else "iOS"}", is_dark="{self.is_dark}", save_battery="{self.save_battery}", le="%.2f"}} {self.buckets[i]}'  % ((i * 0.1) + 0.1) )
-
-        lines.append(f'battery_consumption_sum{{os="{"Android" if self.is_android else "iOS"}", is_dark="{self.is_dark}", save_battery="{self.save_battery}"}} {self.get_total()}')
-        lines.append(f'battery_consumption_count{{os="{"Android" if self.is_android else "iOS"}", is_dark="{self.is_dark}", save_battery="{self.save_battery}"}} {self.get_count()}')
-
-        return lines
-    
-    def get_total(self) -> float:
-        total = 0
-        last_value = 0
-        for (i, value) in enumerate(self.buckets):
-            if value != last_value:
-                total += (value - last_value) * ((i * 0.1) + 0.1)
-                last_value = value
-        return round(total, 2)
-    
-    def get_count(self) -> int:
-        return self.buckets[-1]
+# The upper bounds of the buckets of the battery consumption in percent per minute, from 0.1 to 4.9 and +Inf.
+BATTERY_CONSUMPTION_BUCKETS = linear_buckets(0.1, 0.1, 49)
 
 class Command(BaseCommand):
     help = """ Creates the metrics for the tracks after the data has been cleaned up."""
 
+    def add_arguments(self, parser):
+        parser.add_argument("--rebuild", action="store_true", help="Recompute the aggregates of the metrics from all tracks and answers.")
+        parser.add_argument("--check", action="store_true", help="Compare the aggregates of the metrics with a recomputation and fail if they differ.")
+
     def handle(self, *args, **options):
         print(f"Starting scheduled generation of metrics of tracks.")
         
@@ -57,170 +29,81 @@ class Command(BaseCommand):
     
         metrics = []
 
-        # Add debug tracks to n_tracks.
-        metrics.append(f'n_tracks{{debug=\"true\"}} {Track.objects.filter(debug=True).count()}')
-        # Add valid tracks to n_tracks.
-        metrics.append(f'n_tracks{{debug=\"false\"}} {Track.objects.filter(debug=False).count()}')
-
-        # Add debug answers.
-        metrics.append(f'n_answers{{debug=\"true\"}} {Answer.objects.filter(user_id__contains="Biker-Swarm").count()}')
-        # Add valid answers.
-        metrics.append(f'n_answers{{debug=\"false\"}} {Answer.objects.exclude(user_id__contains="Biker-Swarm").count()}')
+        # The metrics of the tracks and answers are read from the aggregates, see monitoring.rollups.
+        if options["rebuild"] or needs_rebuild():
+            print("Rebuilding the aggregates of the metrics.")
+            rebuild_rollups()
+        if options["check"]:
+            differences = compare_rollups(compute_rollups(), read_rollups())
+            for difference in differences:
+                print(difference)
+            if differences:
+                raise CommandError(f"The aggregates differ from the data in {len(differences)} rows, run with --rebuild.")
+            print("The aggregates match the data.")
+
+        # All breakdowns of the tracks are read at once.
+        breakdowns = read_breakdowns()
+
+        # Add debug tracks and valid tracks to n_tracks.
+        for debug in (True, False):
+            metrics.append(f'n_tracks{{debug=\"{str(debug).lower()}\"}} {breakdowns["n_tracks"][debug]}')
+
+        # Add debug answers and valid answers.
+        n_answers = dict(AnswerRollup.objects.values_list("debug", "n_answers"))
+        for debug in (True, False):
+            metrics.append(f'n_answers{{debug=\"{str(debug).lower()}\"}} {n_answers.get(debug, 0)}')
 
         # Sum up how much time users spent riding.
-        tracks_with_end_time_debug = Track.objects.filter(debug=True).exclude(end_time=None)
-        tracks_with_end_time = Track.objects.filter(debug=False).exclude(end_time=None)
-
-        # Use an aggregate to sum up the duration of all debug tracks.
-        sum_of_starts = tracks_with_end_time_debug.aggregate(v=Sum('start_time'))['v'] or 0
-        sum_of_ends = tracks_with_end_time_debug.aggregate(v=Sum('end_time'))['v'] or 0
-        metrics.append(f'n_seconds_riding{{debug=\"true\"}} {(sum_of_ends - sum_of_starts) // 1000}')
+        for debug in (True, False):
+            metrics.append(f'n_seconds_riding{{debug=\"{str(debug).lower()}\"}} {breakdowns["riding_milliseconds"][debug] // 1000}')
 
-        # Use an aggregate to sum up the duration of all valid tracks.
-        sum_of_starts = tracks_with_end_time.aggregate(v=Sum('start_time'))['v'] or 0
-        sum_of_ends = tracks_with_end_time.aggregate(v=Sum('end_time'))['v'] or 0
+        # Calculate the number of unique users.
+        for debug in (False, True):
+            metrics.append(f'n_users{{debug=\"{str(debug).lower()}\"}} {breakdowns["n_users"][debug]}')
 
-        metrics.append(f'n_seconds_riding{{debug=\"false\"}} {(sum_of_ends - sum_of_starts) // 1000}')
+        # Count the numbers each device_type occurs in the database.
+        for debug in (True, False):
+            for device_type, count in sorted(breakdowns["device_type"][debug].items()):
+                metrics.append(f'n_tracks_by_device_type{{device_type="{device_type}", debug=\"{str(debug).lower()}\"}} {count}')
 
-        # Calculate the number of unique users.
-        metrics.append(f'n_users{{debug=\"false\"}} {Track.objects.filter(debug=False).values("user_id").distinct().count()}')
-        metrics.append(f'n_users{{debug=\"true\"}} {Track.objects.filter(debug=True).values("user_id").distinct().count()}')
-
-        # Count the numbers each device_type occurs in the database debug.
-        counts = Track.objects.filter(debug=True) \
-            .values("device_type") \
-            .annotate(v=Count('device_type')) \
-            .values_list("device_type", "v")
-        for device_type, count in counts:
-            metrics.append(f'n_tracks_by_device_type{{device_type="{device_type}", debug=\"true\"}} {count}')
-
-        # Count the numbers each device_type occurs in the database debug.
-        counts = Track.objects.filter(debug=False) \
-            .values("device_type") \
-            .annotate(v=Count('device_type')) \
-            .values_list("device_type", "v")
-        for device_type, count in counts:
-            metrics.append(f'n_tracks_by_device_type{{device_type="{device_type}", debug=\"false\"}} {count}')
-
-        # Count the numbers of bike types.
-        counts = Track.objects \
-            .values("bike_type") \
-            .annotate(v=Count('bike_type')) \
-            .values_list("bike_type", "v")
-        for bike_type, count in counts:
-            metrics.append(f'n_tracks_by_bike_type{{bike_type="{bike_type}"}} {count}')
-
-        # Count the number of preference types.
-        counts = Track.objects \
-            .values("preference_type") \
-            .annotate(v=Count('preference_type')) \
-            .values_list("preference_type", "v")
-        for preference_type, count in counts:
-            metrics.append(f'n_tracks_by_preference_type{{preference_type="{preference_type}"}} {count}')
-
-        # Count the number of activity types.
-        counts = Track.objects \
-            .values("activity_type") \
-            .annotate(v=Count('activity_type')) \
-            .values_list("activity_type", "v")
-        for activity_type, count in counts:
-            metrics.append(f'n_tracks_by_activity_type{{activity_type="{activity_type}"}} {count}')
+        # Count the numbers of bike types, preference types and activity types.
+        for dimension in ("bike_type", "preference_type", "activity_type"):
+            for value, count in sorted(breakdowns[dimension].items()):
+                metrics.append(f'n_tracks_by_{dimension}{{{dimension}="{value}"}} {count}')
 
         # Count the distribution of in-app ratings.
-        # Only get the most recent rating for each user (user_id field)
-        # and only count the ratings for the "Dein Feedback zur App" question.
-        most_recent_ratings = Answer.objects \
-            .filter(question_text="Dein Feedback zur App") \
-            .order_by("user_id", "-date") \
-            .distinct("user_id")
-
-        # Count in Python
-        counts = {}
-        for rating in most_recent_ratings:
-            counts[rating.value] = counts.get(rating.value, 0) + 1
-        # Add the counts to the metrics.
-        for rating, count in counts.items():
+        # Only the most recent rating for each user is kept in the aggregates.
+        counts = LatestRating.objects.values("value").annotate(v=Count("pk")).values_list("value", "v")
+        for rating, count in counts:
             metrics.append(f'n_ratings{{rating="{rating}"}} {count}')
             
+        # Classify the tracks for the battery analysis and extract their attributes if that wasn't done at ingest,
+        # e.g. tracks that were synced from workers that don't do it yet.
+        backfilled = backfill_battery_features()
+        if backfilled:
+            print(f"Computed the battery features of {backfilled} tracks.")
+        backfilled = backfill_attributes()
+        if backfilled:
+            print(f"Extracted the attributes of {backfilled} tracks.")
+
         # Battery stats
-        max_energy_consumption_per_minute = 5 # in percent
-        min_energy_consumption_per_minute = 0 # in percent
-        number_of_buckets = 50
-
-        # Migrate tracks that can be used for battery analysis.
-        for track in Track.objects.filter(has_battery_data=None):
-            if "batteryStates" not in track.metadata or len(track.metadata["batteryStates"]) < 2:
-                track.has_battery_data = False
-            else:
-                track.has_battery_data = True
-            track.save()
-        
-        # Migrate tracks that can be used for battery analysis and add average battery consumption if not set yet.
-        for track in Track.objects.filter(has_battery_data=True, avg_battery_consumption=None):
-            # Check if one battery state in battery states contains BatteryState.charging or BatteryState.full.
-            # Then this track is not usable for battery analysis.
-            if any("batteryState" in batteryState and (batteryState["batteryState"] == "BatteryState.charging" or batteryState["batteryState"] == "BatteryState.full") for batteryState in track.metadata["batteryStates"]):
-                # Set has_battery_data to False and continue with next track.
-                track.has_battery_data = False
-                track.save()
-                continue
-
-            total_battery_consumption = track.metadata["batteryStates"][0]["level"] - track.metadata["batteryStates"][-1]["level"]
-            total_milliseconds = track.metadata["batteryStates"][-1]["timestamp"] - track.metadata["batteryStates"][0]["timestamp"] 
-            total_minutes = total_milliseconds / 1000 / 60
-            track.avg_battery_consumption = total_battery_consumption / total_minutes
-            track.save()
-
-        le_histogram_android_is_dark_save_battery = BatteryConsumptionHistogram(number_of_buckets, True, True, True)
-        le_histogram_android_is_dark_no_save_battery = BatteryConsumptionHistogram(number_of_buckets, True, True, False)
-        le_histogram_android_no_dark_save_battery = BatteryConsumptionHistogram(number_of_buckets, True, False, True)
-        le_histogram_android_no_dark_no_save_battery = BatteryConsumptionHistogram(number_of_buckets, True, False, False)
-        le_histogram_ios_is_dark_save_battery = BatteryConsumptionHistogram(number_of_buckets, False, True, True)
-        le_histogram_ios_is_dark_no_save_battery = BatteryConsumptionHistogram(number_of_buckets, False, True, False)
-        le_histogram_ios_no_dark_save_battery = BatteryConsumptionHistogram(number_of_buckets, False, False, True)
-        le_histogram_ios_no_dark_no_save_battery = BatteryConsumptionHistogram(number_of_buckets, False, False, False)
-
-        # get all values for tracks with can battery analysis.
-        for track in Track.objects.filter(has_battery_data=True).values("device_type", "metadata", "avg_battery_consumption"):
-            if "isDarkMode" not in track["metadata"]:
-                continue
-            if "saveBatteryModeEnabled" not in track["metadata"]:
-                continue
-            
-            is_android = "Android" in track["device_type"]
-            is_dark_mode = track["metadata"]["isDarkMode"]
-            save_battery_mode_enabled = track["metadata"]["saveBatteryModeEnabled"]
-            
-            bucket_idx = int((track["avg_battery_consumption"] - min_energy_consumption_per_minute) / (max_energy_consumption_per_minute - min_energy_consumption_per_minute) * number_of_buckets)
-            if bucket_idx > number_of_buckets - 1:
-                bucket_idx = number_of_buckets - 1
-                
-            if is_android and is_dark_mode and save_battery_mode_enabled:
-                le_histogram_android_is_dark_save_battery.add_value(bucket_idx)
-            elif is_android and is_dark_mode and not save_battery_mode_enabled:
-                le_histogram_android_is_dark_no_save_battery.add_value(bucket_idx)
-            elif is_android and not is_dark_mode and save_battery_mode_enabled:
-                le_histogram_android_no_dark_save_battery.add_value(bucket_idx)
-            elif is_android and not is_dark_mode and not save_battery_mode_enabled:
-                le_histogram_android_no_dark_no_save_battery.add_value(bucket_idx)
-            elif not is_android and is_dark_mode and save_battery_mode_enabled:
-                le_histogram_ios_is_dark_save_battery.add_value(bucket_idx)
-            elif not is_android and is_dark_mode and not save_battery_mode_enabled:
-                le_histogram_ios_is_dark_no_save_battery.add_value(bucket_idx)
-            elif not is_android and not is_dark_mode and save_battery_mode_enabled:
-                le_histogram_ios_no_dark_save_battery.add_value(bucket_idx)
-            elif not is_android and not is_dark_mode and not save_battery_mode_enabled:
-                le_histogram_ios_no_dark_no_save_battery.add_value(bucket_idx)
-                
-        metrics.extend(le_histogram_android_is_dark_save_battery.get_metric_lines())
-        metrics.extend(le_histogram_android_is_dark_no_save_battery.get_metric_lines())
-        metrics.extend(le_histogram_android_no_dark_save_battery.get_metric_lines())
-        metrics.extend(le_histogram_android_no_dark_no_save_battery.get_metric_lines())
-        metrics.extend(le_histogram_ios_is_dark_save_battery.get_metric_lines())
-        metrics.extend(le_histogram_ios_is_dark_no_save_battery.get_metric_lines())
-        metrics.extend(le_histogram_ios_no_dark_save_battery.get_metric_lines())
-        metrics.extend(le_histogram_ios_no_dark_no_save_battery.get_metric_lines())
-        
+        battery_consumption = Histogram("battery_consumption", BATTERY_CONSUMPTION_BUCKETS, ("os", "is_dark", "save_battery"), le_format="{:.2f}")
+        # All combinations of the labels are exported, also those without tracks.
+        for os_name in ("Android", "iOS"):
+            for is_dark_mode in (True, False):
+                for save_battery_mode_enabled in (True, False):
+                    battery_consumption.add_series((os_name, is_dark_mode, save_battery_mode_enabled))
+
+        # get all values for tracks with can battery analysis, from the columns of the tracks without reading the metadata.
+        # Tracks whose metadata doesn't contain the dark mode or the battery saving mode have null attributes and are skipped.
+        rows = Track.objects.filter(has_battery_data=True, is_dark_mode__isnull=False, save_battery_mode_enabled__isnull=False).order_by() \
+            .values_list("device_type", "is_dark_mode", "save_battery_mode_enabled", "avg_battery_consumption").iterator(chunk_size=1000)
+        for device_type, is_dark_mode, save_battery_mode_enabled, avg_battery_consumption in rows:
+            os_name = "Android" if "Android" in device_type else "iOS"
+            battery_consumption.observe((os_name, is_dark_mode, save_battery_mode_enabled), avg_battery_consumption)
+
+        metrics.extend(battery_consumption.render())
+
         # Backup metrics
         try:
             with open(str(settings.BASE_DIR) + '/data/track-backup-state.json', 'r') as file:
@@ -246,7 +129,7 @@ class Command(BaseCommand):
 
         content = '\n'.join(metrics) + '\n'
         
-        with open(str(settings.BASE_DIR) + '/data/metrics.txt', 'w') as f:
-            f.write(content)
+        # Replace the metrics atomically, such that scrapes never read a partially written file.
+        write_metrics(content)
         
         print(f"Finished generation of track metrics.")
\ No newline at end of file
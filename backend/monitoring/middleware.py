@@ -0,0 +1,42 @@
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from monitoring import instrumentation
+
+
+class RequestMetricsMiddleware:
+    """
+    Observe the latency of every request, labeled by the view, the method and the status code.
+
+    The latency is measured until the response is returned to the server, so
+    the body of a streaming response is not included. The middleware runs
+    natively in both server modes, such that async views aren't moved into a thread.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        # The middleware is only created in server processes, which write their counts for the metrics endpoint.
+        instrumentation.enable()
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        start = time.perf_counter()
+        response = self.get_response(request)
+        self.observe(request, response, time.perf_counter() - start)
+        return response
+
+    async def __acall__(self, request):
+        start = time.perf_counter()
+        response = await self.get_response(request)
+        self.observe(request, response, time.perf_counter() - start)
+        return response
+
+    def observe(self, request, response, seconds: float):
+        # Requests that don't match a url are grouped, so that scanners can't create arbitrary many series.
+        view = request.resolver_match.view_name if request.resolver_match else "unmatched"
+        instrumentation.observe("http_request_duration_seconds", (view, request.method, str(response.status_code)), seconds)
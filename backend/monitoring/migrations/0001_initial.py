@@ -0,0 +1,63 @@
+# Generated by Django 4.2.30 on 2026-10-18 13:57
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AnswerRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('debug', models.BooleanField(unique=True)),
+                ('n_answers', models.BigIntegerField(default=0)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='LatestRating',
+            fields=[
+                ('user_id', models.CharField(max_length=255, primary_key=True, serialize=False)),
+                ('session_id', models.CharField(max_length=255)),
+                ('date', models.DateTimeField()),
+                ('value', models.TextField(blank=True, null=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='TrackRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('debug', models.BooleanField()),
+                ('device_type', models.CharField(max_length=255)),
+                ('bike_type', models.CharField(max_length=255)),
+                ('preference_type', models.CharField(max_length=255)),
+                ('activity_type', models.CharField(max_length=255)),
+                ('backend', models.CharField(max_length=255)),
+                ('n_tracks', models.BigIntegerField(default=0)),
+                ('n_finished_tracks', models.BigIntegerField(default=0)),
+                ('riding_milliseconds', models.BigIntegerField(default=0)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='UserRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('debug', models.BooleanField()),
+                ('user_id', models.CharField(max_length=255)),
+                ('n_tracks', models.BigIntegerField(default=0)),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='userrollup',
+            constraint=models.UniqueConstraint(fields=('debug', 'user_id'), name='unique_user_rollup'),
+        ),
+        migrations.AddConstraint(
+            model_name='trackrollup',
+            constraint=models.UniqueConstraint(fields=('debug', 'device_type', 'bike_type', 'preference_type', 'activity_type', 'backend'), name='unique_track_rollup'),
+        ),
+    ]
@@ -0,0 +1,69 @@
+from django.db import models
+
+
+class TrackRollup(models.Model):
+    """
+    The number of tracks and their riding time per combination of the dimensions of the metrics.
+
+    Maintained when tracks are inserted on the manager, see monitoring.rollups.
+    """
+
+    # The dimensions, as the fields of the tracks.
+    debug = models.BooleanField()
+    device_type = models.CharField(max_length=255)
+    bike_type = models.CharField(max_length=255)
+    preference_type = models.CharField(max_length=255)
+    activity_type = models.CharField(max_length=255)
+    backend = models.CharField(max_length=255)
+
+    # The number of tracks.
+    n_tracks = models.BigIntegerField(default=0)
+
+    # The number of tracks with an end time and the sum of their durations in milliseconds.
+    n_finished_tracks = models.BigIntegerField(default=0)
+    riding_milliseconds = models.BigIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['debug', 'device_type', 'bike_type', 'preference_type', 'activity_type', 'backend'],
+                name='unique_track_rollup',
+            ),
+        ]
+
+
+class UserRollup(models.Model):
+    """
+    The number of tracks per user, which gives the number of distinct users.
+    """
+
+    debug = models.BooleanField()
+    user_id = models.CharField(max_length=255)
+    n_tracks = models.BigIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['debug', 'user_id'], name='unique_user_rollup'),
+        ]
+
+
+class AnswerRollup(models.Model):
+    """
+    The number of answers of debug users and of other users.
+    """
+
+    debug = models.BooleanField(unique=True)
+    n_answers = models.BigIntegerField(default=0)
+
+
+class LatestRating(models.Model):
+    """
+    The most recent in-app rating of a user, which gives the distribution of the ratings.
+    """
+
+    user_id = models.CharField(max_length=255, primary_key=True)
+
+    # The answer with the rating.
+    session_id = models.CharField(max_length=255)
+    date = models.DateTimeField()
+    value = models.TextField(null=True, blank=True)
@@ -0,0 +1,70 @@
+"""
+The publication of the metrics file that is written by generate_metrics and served by the metrics endpoint.
+
+The file is replaced atomically, so a scrape never reads a partially written
+file. Every server process keeps the rendered responses of the current file in
+memory and only reads the file again when it was replaced, i.e. when its
+modification time, size or inode changed.
+"""
+import gzip
+import hashlib
+import os
+from typing import NamedTuple, Optional
+
+from django.conf import settings
+
+METRICS_FILE = os.path.join(settings.BASE_DIR, "data", "metrics.txt")
+
+# The content types of the Prometheus text format and of the OpenMetrics format.
+TEXT_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+OPENMETRICS_CONTENT_TYPE = "application/openmetrics-text; version=1.0.0; charset=utf-8"
+
+
+class Representation(NamedTuple):
+    body: bytes
+    gzipped: bytes
+    etag: str
+
+
+class Payload(NamedTuple):
+    key: tuple
+    text: Representation
+    openmetrics: Representation
+
+
+# The payload of the current metrics file in this process.
+_payload: Optional[Payload] = None
+
+
+def write_metrics(content: str):
+    """
+    Replace the metrics file atomically with the given content.
+    """
+    tmp_path = f"{METRICS_FILE}.tmp"
+    with open(tmp_path, "w") as file:
+        file.write(content)
+    os.replace(tmp_path, METRICS_FILE)
+
+
+def represent(body: bytes, variant: str) -> Representation:
+    digest = hashlib.blake2b(body, digest_size=16).hexdigest()
+    # The mtime is fixed, so the compressed body only depends on the metrics.
+    return Representation(body, gzip.compress(body, compresslevel=6, mtime=0), f'"{digest}-{variant}"')
+
+
+def load_metrics() -> Payload:
+    """
+    Get the responses of the current metrics file. Raises FileNotFoundError if no metrics have been generated.
+    """
+    global _payload
+    stat = os.stat(METRICS_FILE)
+    key = (stat.st_mtime_ns, stat.st_size, stat.st_ino)
+    payload = _payload
+    if payload is not None and payload.key == key:
+        return payload
+    with open(METRICS_FILE, "rb") as file:
+        body = file.read()
+    # OpenMetrics ends the exposition with an EOF marker.
+    payload = Payload(key, represent(body, "text"), represent(body + b"# EOF\n", "openmetrics"))
+    _payload = payload
+    return payload
@@ -0,0 +1,314 @@
+"""
+Aggregate tables behind the metrics, which are maintained when data is inserted on the manager.
+
+The metrics of the tracks and answers are read from the rollups in
+monitoring.models, instead of scanning the whole archive on every run of
+generate_metrics. The rollups are updated in the same transaction as the
+inserts of the tracks and answers, and when answers without a track are
+deleted after a sync. Other changes to the data, e.g. deletions in the admin,
+are not tracked: `generate_metrics --check` compares the rollups with a full
+recomputation and `generate_metrics --rebuild` recomputes them.
+"""
+from collections import Counter, defaultdict
+from typing import Dict, Iterable, Tuple
+
+from answers.models import Answer
+from django.db import connection, transaction
+from django.db.models import Count, F, Sum
+from monitoring.models import (AnswerRollup, LatestRating, TrackRollup,
+                               UserRollup)
+from tracks.models import Track
+
+# The fields of the tracks by which the track metrics are broken down.
+TRACK_DIMENSIONS = ("debug", "device_type", "bike_type", "preference_type", "activity_type", "backend")
+
+# Answers of users whose id contains this marker are counted as debug answers.
+DEBUG_USER_MARKER = "Biker-Swarm"
+
+# The memory of the scan over the tracks, enough for the hash tables of about a million users.
+SCAN_WORK_MEM = "256MB"
+
+# The question of the in-app rating.
+RATING_QUESTION = "Dein Feedback zur App"
+
+
+def is_debug_answer(user_id: str) -> bool:
+    return DEBUG_USER_MARKER in user_id
+
+
+def increment(model, key_fields: tuple, deltas: Dict[tuple, dict]):
+    """
+    Add deltas to the counters of the rows with the given keys, creating the rows that don't exist yet.
+
+    The deltas are added by the database in the conflict clause of one upsert
+    per batch, so concurrent inserts that create or update the same rows don't
+    lose counts and the rows are not read first.
+    """
+    if not deltas:
+        return
+    counter_fields = sorted({field for counters in deltas.values() for field in counters})
+    quote = connection.ops.quote_name
+    table = quote(model._meta.db_table)
+    keys = [quote(model._meta.get_field(field).column) for field in key_fields]
+    counters = [quote(model._meta.get_field(field).column) for field in counter_fields]
+    # The rows are locked in the order of their keys, so concurrent upserts don't deadlock.
+    rows = [
+        (*key, *(deltas[key].get(field, 0) for field in counter_fields))
+        for key in sorted(deltas)
+    ]
+    row_placeholder = "(" + ", ".join(["%s"] * (len(keys) + len(counters))) + ")"
+    with connection.cursor() as cursor:
+        for i in range(0, len(rows), 1000):
+            batch = rows[i:i + 1000]
+            cursor.execute(
+                f"INSERT INTO {table} ({', '.join(keys + counters)}) "
+                f"VALUES {', '.join([row_placeholder] * len(batch))} "
+                f"ON CONFLICT ({', '.join(keys)}) DO UPDATE SET "
+                + ", ".join(f"{column} = {table}.{column} + EXCLUDED.{column}" for column in counters),
+                [value for row in batch for value in row],
+            )
+
+
+def add_tracks(tracks: Iterable[Track]):
+    """
+    Add inserted tracks to the rollups. Must run in the transaction of the insert.
+    """
+    by_dimensions = defaultdict(lambda: {"n_tracks": 0, "n_finished_tracks": 0, "riding_milliseconds": 0})
+    by_user = defaultdict(lambda: {"n_tracks": 0})
+    for track in tracks:
+        counters = by_dimensions[tuple(getattr(track, field) for field in TRACK_DIMENSIONS)]
+        counters["n_tracks"] += 1
+        if track.end_time is not None:
+            counters["n_finished_tracks"] += 1
+            counters["riding_milliseconds"] += track.end_time - track.start_time
+        by_user[(track.debug, track.user_id)]["n_tracks"] += 1
+    increment(TrackRollup, TRACK_DIMENSIONS, by_dimensions)
+    increment(UserRollup, ("debug", "user_id"), by_user)
+
+
+def add_answers(answers: Iterable[Answer]):
+    """
+    Add inserted answers to the rollups. Must run in the transaction of the insert.
+    """
+    by_debug = Counter()
+    latest = {}
+    for answer in answers:
+        by_debug[is_debug_answer(answer.user_id)] += 1
+        if answer.question_text != RATING_QUESTION:
+            continue
+        # Ties on the date are broken by the session id, here and in latest_ratings.
+        rating = latest.get(answer.user_id)
+        if rating is None or (answer.date, answer.session_id) > (rating.date, rating.session_id):
+            latest[answer.user_id] = answer
+    increment(AnswerRollup, ("debug",), {(debug,): {"n_answers": n_answers} for debug, n_answers in by_debug.items()})
+    if not latest:
+        return
+    existing = LatestRating.objects.select_for_update().in_bulk(list(latest.keys()))
+    updated_ratings = []
+    new_ratings = []
+    for user_id, answer in latest.items():
+        rating = existing.get(user_id)
+        if rating is None:
+            new_ratings.append(LatestRating(user_id=user_id, session_id=answer.session_id, date=answer.date, value=answer.value))
+        elif (answer.date, answer.session_id) > (rating.date, rating.session_id):
+            rating.session_id, rating.date, rating.value = answer.session_id, answer.date, answer.value
+            updated_ratings.append(rating)
+    LatestRating.objects.bulk_update(updated_ratings, ["session_id", "date", "value"], batch_size=1000)
+    LatestRating.objects.bulk_create(new_ratings, batch_size=1000)
+
+
+def remove_answers(answers: Iterable[Answer]):
+    """
+    Remove deleted answers from the rollups. Must run in the transaction of the delete, after it.
+    """
+    by_debug = Counter()
+    rating_users = set()
+    for answer in answers:
+        by_debug[is_debug_answer(answer.user_id)] += 1
+        if answer.question_text == RATING_QUESTION:
+            rating_users.add(answer.user_id)
+    increment(AnswerRollup, ("debug",), {(debug,): {"n_answers": -n_answers} for debug, n_answers in by_debug.items()})
+    if not rating_users:
+        return
+    # The latest rating of these users may have been deleted, fall back to their previous ratings.
+    LatestRating.objects.filter(user_id__in=rating_users).delete()
+    LatestRating.objects.bulk_create(latest_ratings(
+        Answer.objects.filter(question_text=RATING_QUESTION, user_id__in=rating_users)
+    ).values())
+
+
+def latest_ratings(answers=None) -> Dict[str, LatestRating]:
+    """
+    Find the most recent rating of every user by reading the given or all rating answers.
+    """
+    if answers is None:
+        answers = Answer.objects.filter(question_text=RATING_QUESTION)
+    latest = {}
+    rows = answers.order_by().values_list("user_id", "session_id", "date", "value").iterator(chunk_size=10_000)
+    for user_id, session_id, date, value in rows:
+        rating = latest.get(user_id)
+        if rating is None or (date, session_id) > (rating.date, rating.session_id):
+            latest[user_id] = LatestRating(user_id=user_id, session_id=session_id, date=date, value=value)
+    return latest
+
+
+def scan_tracks() -> Tuple[dict, dict]:
+    """
+    Count the tracks per combination of the dimensions and per user, and sum up their riding time.
+
+    Postgres computes both groupings in one scan over the tracks with GROUPING
+    SETS. Other databases, i.e. SQLite in tests, group the tracks twice.
+    """
+    tracks = {}
+    users = {}
+    if connection.vendor != "postgresql":
+        rows = Track.objects.order_by().values(*TRACK_DIMENSIONS).annotate(
+            n_tracks=Count("pk"),
+            n_finished_tracks=Count("end_time"),
+            riding_milliseconds=Sum(F("end_time") - F("start_time")),
+        )
+        for row in rows:
+            tracks[tuple(row[field] for field in TRACK_DIMENSIONS)] = (
+                row["n_tracks"], row["n_finished_tracks"], row["riding_milliseconds"] or 0,
+            )
+        for debug, user_id, n_tracks in Track.objects.order_by().values("debug", "user_id").annotate(n=Count("pk")).values_list("debug", "user_id", "n"):
+            users[(debug, user_id)] = n_tracks
+        return tracks, users
+
+    def column(field):
+        return connection.ops.quote_name(Track._meta.get_field(field).column)
+
+    dimensions = ", ".join(column(field) for field in TRACK_DIMENSIONS)
+    sql = f"""
+        SELECT GROUPING({column("user_id")}), {dimensions}, {column("user_id")},
+            COUNT(*), COUNT({column("end_time")}), SUM({column("end_time")} - {column("start_time")})
+        FROM {connection.ops.quote_name(Track._meta.db_table)}
+        GROUP BY GROUPING SETS (({dimensions}), ({column("debug")}, {column("user_id")}))
+    """
+    with transaction.atomic(), connection.cursor() as cursor:
+        # Both groupings are hashed in one scan if they fit into the memory of the query, otherwise the tracks are sorted on disk.
+        cursor.execute(f"SET LOCAL work_mem = '{SCAN_WORK_MEM}'")
+        cursor.execute(sql)
+        for by_dimensions, *key, user_id, n_tracks, n_finished_tracks, riding_milliseconds in cursor:
+            # GROUPING is 1 for the rows in which the user id isn't grouped, i.e. the rows per combination of the dimensions.
+            if by_dimensions:
+                tracks[tuple(key)] = (n_tracks, n_finished_tracks, int(riding_milliseconds or 0))
+            else:
+                users[(key[0], user_id)] = n_tracks
+    return tracks, users
+
+
+def compute_rollups() -> dict:
+    """
+    Compute the contents of the rollups from the tracks and answers, by scanning them.
+
+    Keyed like the rows of the rollups, see read_rollups.
+    """
+    tracks, users = scan_tracks()
+    n_debug_answers = Answer.objects.filter(user_id__contains=DEBUG_USER_MARKER).count()
+    answers = {
+        True: n_debug_answers,
+        False: Answer.objects.count() - n_debug_answers,
+    }
+    ratings = {
+        user_id: (rating.session_id, rating.date, rating.value)
+        for user_id, rating in latest_ratings().items()
+    }
+    return {"tracks": tracks, "users": users, "answers": answers, "ratings": ratings}
+
+
+def read_rollups() -> dict:
+    """
+    Read the contents of the rollups, without the rows whose counters are zero.
+    """
+    tracks = {}
+    for row in TrackRollup.objects.exclude(n_tracks=0).values(*TRACK_DIMENSIONS, "n_tracks", "n_finished_tracks", "riding_milliseconds"):
+        tracks[tuple(row[field] for field in TRACK_DIMENSIONS)] = (
+            row["n_tracks"], row["n_finished_tracks"], row["riding_milliseconds"],
+        )
+    users = {
+        (debug, user_id): n_tracks
+        for debug, user_id, n_tracks in UserRollup.objects.exclude(n_tracks=0).values_list("debug", "user_id", "n_tracks")
+    }
+    answers = {True: 0, False: 0}
+    for debug, n_answers in AnswerRollup.objects.values_list("debug", "n_answers"):
+        answers[debug] = n_answers
+    ratings = {
+        user_id: (session_id, date, value)
+        for user_id, session_id, date, value in LatestRating.objects.values_list("user_id", "session_id", "date", "value")
+    }
+    return {"tracks": tracks, "users": users, "answers": answers, "ratings": ratings}
+
+
+def read_breakdowns() -> dict:
+    """
+    Break the tracks down by every dimension of the metrics, in one pass over the rollups.
+
+    Returns counters keyed by debug for the totals, e.g. "n_tracks", and by the
+    values of the dimensions for the others. The device types are broken down by debug first.
+    """
+    breakdowns = {name: Counter() for name in ("n_tracks", "riding_milliseconds", "n_users", "bike_type", "preference_type", "activity_type")}
+    breakdowns["device_type"] = {True: Counter(), False: Counter()}
+    rows = TrackRollup.objects.exclude(n_tracks=0).values_list(
+        "debug", "device_type", "bike_type", "preference_type", "activity_type", "n_tracks", "riding_milliseconds",
+    )
+    for debug, device_type, bike_type, preference_type, activity_type, n_tracks, riding_milliseconds in rows:
+        breakdowns["n_tracks"][debug] += n_tracks
+        breakdowns["riding_milliseconds"][debug] += riding_milliseconds
+        breakdowns["device_type"][debug][device_type] += n_tracks
+        breakdowns["bike_type"][bike_type] += n_tracks
+        breakdowns["preference_type"][preference_type] += n_tracks
+        breakdowns["activity_type"][activity_type] += n_tracks
+    for debug, n_users in UserRollup.objects.filter(n_tracks__gt=0).order_by().values("debug").annotate(n=Count("pk")).values_list("debug", "n"):
+        breakdowns["n_users"][debug] = n_users
+    return breakdowns
+
+
+def rebuild_rollups():
+    """
+    Replace the rollups with a full recomputation from the tracks and answers.
+    """
+    with transaction.atomic():
+        rollups = compute_rollups()
+        TrackRollup.objects.all().delete()
+        UserRollup.objects.all().delete()
+        AnswerRollup.objects.all().delete()
+        LatestRating.objects.all().delete()
+        TrackRollup.objects.bulk_create([
+            TrackRollup(**dict(zip(TRACK_DIMENSIONS, key)), n_tracks=n_tracks, n_finished_tracks=n_finished_tracks, riding_milliseconds=riding_milliseconds)
+            for key, (n_tracks, n_finished_tracks, riding_milliseconds) in rollups["tracks"].items()
+        ], batch_size=1000)
+        UserRollup.objects.bulk_create([
+            UserRollup(debug=debug, user_id=user_id, n_tracks=n_tracks)
+            for (debug, user_id), n_tracks in rollups["users"].items()
+        ], batch_size=1000)
+        AnswerRollup.objects.bulk_create([
+            AnswerRollup(debug=debug, n_answers=n_answers) for debug, n_answers in rollups["answers"].items()
+        ])
+        LatestRating.objects.bulk_create([
+            LatestRating(user_id=user_id, session_id=session_id, date=date, value=value)
+            for user_id, (session_id, date, value) in rollups["ratings"].items()
+        ], batch_size=1000)
+
+
+def compare_rollups(expected: dict, actual: dict) -> list:
+    """
+    Describe the differences between two contents of the rollups, one line per differing row.
+    """
+    differences = []
+    for table in ("tracks", "users", "answers", "ratings"):
+        for key in sorted(set(expected[table]) | set(actual[table]), key=repr):
+            expected_value = expected[table].get(key)
+            actual_value = actual[table].get(key)
+            if expected_value != actual_value:
+                differences.append(f"{table} {key}: expected {expected_value}, found {actual_value}")
+    return differences
+
+
+def needs_rebuild() -> bool:
+    """
+    Whether the rollups are empty while there is data, e.g. right after they were introduced.
+    """
+    if not TrackRollup.objects.exists() and Track.objects.exists():
+        return True
+    return not AnswerRollup.objects.exists() and Answer.objects.exists()
@@ -6,10 +6,15 @@ from . import views
 app_name = 'monitoring'
 
 if settings.WORKER_MODE:
-    urlpatterns = []
+    urlpatterns = [
+        path("spool", views.GetSpoolMetricsResource.as_view(), name="get-spool-metrics"),
+        path("requests", views.GetRequestMetricsResource.as_view(), name="get-request-metrics"),
+    ]
 else:
     urlpatterns = [
         path("metrics", views.GetMetricsResource.as_view(), name="get-metrics"),
+        path("requests", views.GetRequestMetricsResource.as_view(), name="get-request-metrics"),
+        path("sync", views.GetSyncMetricsResource.as_view(), name="get-sync-metrics"),
         path("backup/tracks", views.ReportTrackBackupMetricsResource.as_view(), name="report-track-backup-metrics"),
         path("backup/answers", views.ReportAnswerBackupMetricsResource.as_view(), name="report-answer-backup-metrics"),
     ]
@@ -2,10 +2,15 @@ import json
 from time import time 
 
 from django.conf import settings
-from django.http import HttpResponse, HttpResponseBadRequest
+from django.http import (HttpResponse, HttpResponseBadRequest,
+                         HttpResponseNotModified)
+from django.middleware.gzip import re_accepts_gzip
 from django.utils.decorators import method_decorator
 from django.views.decorators.csrf import csrf_exempt
 from django.views.generic import View
+from monitoring import instrumentation, publication
+from sync import state as sync_state
+from tracks import spool
 
 DATA_DIR = str(settings.BASE_DIR) + '/data/'
 
@@ -21,14 +26,104 @@ class GetMetricsResource(View):
             print("API key is missing or invalid.")
             return HttpResponseBadRequest()
         
-        # Get metrics.txt from data folder.
-        # try open file metrics.txt
-        with open(DATA_DIR + 'metrics.txt', 'r') as file:
-            metrics = file.readlines()
+        try:
+            payload = publication.load_metrics()
+        except FileNotFoundError:
+            print("The metrics haven't been generated yet.")
+            return HttpResponse(status=503)
+
+        # Prometheus asks for OpenMetrics in the Accept header if it supports it.
+        if "application/openmetrics-text" in request.META.get("HTTP_ACCEPT", ""):
+            representation, content_type = payload.openmetrics, publication.OPENMETRICS_CONTENT_TYPE
+        else:
+            representation, content_type = payload.text, publication.TEXT_CONTENT_TYPE
+        use_gzip = re_accepts_gzip.search(request.META.get("HTTP_ACCEPT_ENCODING", "")) is not None
+        # The compressed response is another representation, so it has another entity tag.
+        etag = representation.etag[:-1] + '-gzip"' if use_gzip else representation.etag
+
+        # Scrapers that send the entity tag of the last response get an empty response if the metrics are unchanged.
+        if_none_match = request.META.get("HTTP_IF_NONE_MATCH")
+        if if_none_match and (if_none_match.strip() == "*" or etag in [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]):
+            response = HttpResponseNotModified()
+        else:
+            response = HttpResponse(representation.gzipped if use_gzip else representation.body, content_type=content_type)
+            if use_gzip:
+                response["Content-Encoding"] = "gzip"
+        response["ETag"] = etag
+        response["Vary"] = "Accept, Accept-Encoding"
+        # Caches have to revalidate the metrics on every scrape.
+        response["Cache-Control"] = "no-cache"
+        return response
+
+@method_decorator(csrf_exempt, name='dispatch')
+class GetRequestMetricsResource(View):
+    def get(self, request):
+        """
+        Return Prometheus metrics of the requests that were served by all processes of this server.
+        """
+        # Only allow access with a valid api key.
+        api_key = request.GET.get("api_key", None)
+        if not api_key or api_key != settings.API_KEY:
+            print("API key is missing or invalid.")
+            return HttpResponseBadRequest()
+
+        return HttpResponse(instrumentation.render(), content_type=publication.TEXT_CONTENT_TYPE)
+
+@method_decorator(csrf_exempt, name='dispatch')
+class GetSpoolMetricsResource(View):
+    def get(self, request):
+        """
+        Return Prometheus metrics of the ingest spool of this worker.
+        """
+        # Only allow access with a valid api key.
+        api_key = request.GET.get("api_key", None)
+        if not api_key or api_key != settings.API_KEY:
+            print("API key is missing or invalid.")
+            return HttpResponseBadRequest()
+
+        metrics = []
+        for state, count in spool.depth().items():
+            metrics.append(f'ingest_spool_depth{{state="{state}"}} {count}')
+        state = spool.read_state()
+        metrics.append(f'ingest_spool_drained_total {state.get("drained_total", 0)}')
+        metrics.append(f'ingest_spool_inserted_total {state.get("inserted_total", 0)}')
+        metrics.append(f'ingest_spool_rejected_total {state.get("rejected_total", 0)}')
+        metrics.append(f'ingest_spool_failed_total {state.get("failed_total", 0)}')
+        metrics.append(f'ingest_spool_drain_rate {state.get("drain_rate", 0)}')
+        metrics.append(f'ingest_spool_last_batch_seconds {state.get("last_batch_seconds", 0)}')
+
+        return HttpResponse('\n'.join(metrics) + '\n', content_type='text/plain')
+
+@method_decorator(csrf_exempt, name='dispatch')
+class GetSyncMetricsResource(View):
+    def get(self, request):
+        """
+        Return Prometheus metrics of the last sync with the workers.
+        """
+        # Only allow access with a valid api key.
+        api_key = request.GET.get("api_key", None)
+        if not api_key or api_key != settings.API_KEY:
+            print("API key is missing or invalid.")
+            return HttpResponseBadRequest()
+
+        metrics = []
+        state = sync_state.read_state()
+        for worker, pull in state.get("workers", {}).items():
+            metrics.append(f'sync_pull_success{{worker="{worker}"}} {int(pull["success"])}')
+            metrics.append(f'sync_pull_seconds{{worker="{worker}"}} {pull["seconds"]}')
+            metrics.append(f'sync_pull_bytes{{worker="{worker}"}} {pull["bytes"]}')
+            metrics.append(f'sync_pull_batches{{worker="{worker}"}} {pull.get("batches", 0)}')
+            metrics.append(f'sync_pull_tracks{{worker="{worker}"}} {pull["tracks"]}')
+            metrics.append(f'sync_pull_answers{{worker="{worker}"}} {pull["answers"]}')
+        metrics.append(f'sync_cycle_seconds {state.get("cycle_seconds", 0)}')
+        metrics.append(f'sync_cycle_timestamp {state.get("timestamp", 0)}')
+        cleanup = state.get("cleanup", {})
+        metrics.append(f'sync_cleanup_examined_answers {cleanup.get("examined", 0)}')
+        metrics.append(f'sync_cleanup_deleted_answers {cleanup.get("deleted", 0)}')
+        metrics.append(f'sync_cleanup_seconds {cleanup.get("seconds", 0)}')
+
+        return HttpResponse('\n'.join(metrics) + '\n', content_type='text/plain')
 
-        # Return metrics as text file.
-        return HttpResponse(metrics, content_type='text/plain')
-       
 @method_decorator(csrf_exempt, name='dispatch')
 class ReportTrackBackupMetricsResource(View):
     def post(self, request):
@@ -0,0 +1,99 @@
+"""
+The cleanup of answers that don't belong to a track, which runs after every sync.
+
+Only the answers that were inserted since the last cleanup are examined, such
+that the cost of a cleanup grows with the synced answers and not with the
+archive. The watermark is the insertion date and session id of the last
+examined answer, it is kept in the sync state. A full sweep over all answers
+runs on a slow schedule and with the cleanup_answers command, it catches
+answers that the watermark missed, e.g. after the clock was set back.
+
+Answers are only deleted after a grace period, because their track can arrive
+later than they do, e.g. after a pull that failed halfway or while the track
+is still in the spool of the worker. The watermark doesn't move past answers
+that are younger than the grace period, so they are examined again later.
+"""
+import time
+from datetime import timedelta
+
+from answers.images import delete_unused_images
+from answers.models import Answer
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from monitoring.rollups import remove_answers
+from tracks.models import Track
+
+# The number of answers that are examined at once.
+BATCH_SIZE = 1000
+
+# The seconds after their insertion before answers without a track are deleted.
+GRACE_PERIOD = 60 * 60
+
+
+def delete_answers_without_track(session_ids: list) -> int:
+    """
+    Delete the answers with the given session ids that don't belong to a track. Returns the number of deleted answers.
+    """
+    with_track = set(Track.objects.filter(pk__in=session_ids).values_list("pk", flat=True))
+    orphans = [session_id for session_id in session_ids if session_id not in with_track]
+    if not orphans:
+        return 0
+    return delete_answers(Answer.objects.filter(pk__in=orphans))
+
+
+def delete_answers(answers) -> int:
+    """
+    Delete the given answers and remove them from the aggregates behind the metrics. Returns the number of deleted answers.
+
+    The images that no answer references anymore are deleted with them.
+    """
+    with transaction.atomic():
+        deleted_answers = list(answers.only("session_id", "user_id", "question_text", "question_image"))
+        for i in range(0, len(deleted_answers), BATCH_SIZE):
+            Answer.objects.filter(pk__in=[answer.pk for answer in deleted_answers[i:i + BATCH_SIZE]]).delete()
+        remove_answers(deleted_answers)
+        delete_unused_images({answer.question_image_id for answer in deleted_answers if answer.question_image_id is not None})
+    return len(deleted_answers)
+
+
+def cleanup_new_answers(watermark: dict, grace_period: int = GRACE_PERIOD, batch_size: int = BATCH_SIZE) -> dict:
+    """
+    Delete the answers without a track that were inserted after the watermark and before the grace period.
+
+    Returns the number of examined and deleted answers and the new watermark.
+    An empty watermark examines all answers.
+    """
+    start = time.monotonic()
+    examined = 0
+    deleted = 0
+    cutoff = timezone.now() - timedelta(seconds=grace_period)
+    while True:
+        answers = Answer.objects.filter(inserted_at__lt=cutoff).order_by("inserted_at", "session_id")
+        if watermark:
+            inserted_at = parse_datetime(watermark["inserted_at"])
+            session_id = watermark["session_id"]
+            # Equivalent to (inserted_at, session_id) > watermark, written such that the index range starts at the watermark.
+            answers = answers.filter(inserted_at__gte=inserted_at).exclude(inserted_at=inserted_at, session_id__lte=session_id)
+        batch = list(answers.values_list("inserted_at", "session_id")[:batch_size])
+        if not batch:
+            break
+        examined += len(batch)
+        deleted += delete_answers_without_track([session_id for _, session_id in batch])
+        watermark = {"inserted_at": batch[-1][0].isoformat(), "session_id": batch[-1][1]}
+        if len(batch) < batch_size:
+            break
+    return {"examined": examined, "deleted": deleted, "seconds": time.monotonic() - start, "watermark": watermark}
+
+
+def sweep_answers(grace_period: int = GRACE_PERIOD) -> dict:
+    """
+    Delete all answers without a track that were inserted before the grace period, examining every answer.
+
+    Returns the number of examined and deleted answers.
+    """
+    start = time.monotonic()
+    answers = Answer.objects.filter(inserted_at__lt=timezone.now() - timedelta(seconds=grace_period))
+    examined = answers.count()
+    deleted = delete_answers(answers.exclude(session_id__in=Track.objects.values("session_id")))
+    return {"examined": examined, "deleted": deleted, "seconds": time.monotonic() - start}
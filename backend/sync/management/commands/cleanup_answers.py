@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+from sync.cleanup import GRACE_PERIOD, sweep_answers
+
+
+class Command(BaseCommand):
+    help = """Deletes all answers that don't belong to a track. The sync command runs this on a slow schedule and otherwise only examines new answers."""
+
+    def add_arguments(self, parser):
+        parser.add_argument("--grace-period", type=int, default=GRACE_PERIOD, help="The seconds after their insertion before answers without a track are deleted.")
+
+    def handle(self, *args, **options):
+        result = sweep_answers(options["grace_period"])
+        print(f"Examined {result['examined']} answers, deleted {result['deleted']} answers without a track in {result['seconds']:.1f}s.")
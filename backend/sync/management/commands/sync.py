@@ -1,14 +1,24 @@
+import io
 import json
 import socket
-import tempfile
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor
 
 import requests
-from answers.models import Answer
+import urllib3
 from django.conf import settings
 from django.core.management import call_command
 from django.core.management.base import BaseCommand
-from tracks.models import Track
+from django.db import connection
+from requests.adapters import HTTPAdapter
+from sync import state as sync_state
+from sync.cleanup import GRACE_PERIOD, cleanup_new_answers, sweep_answers
+from sync.wire import VERSION, WireError, load_wire
+from urllib3.util.retry import Retry
+
+# The number of workers whose connections are kept alive between the cycles.
+MAX_WORKERS = 64
 
 
 class Command(BaseCommand):
@@ -16,12 +26,19 @@ class Command(BaseCommand):
     This command is executed by the manager to download data from the workers.
 
     The command goes through all workers, downloads new tracks, and inserts them into the database.
+    The workers are pulled concurrently, while the inserts into the database are serialized.
     """
 
     def add_arguments(self, parser):
         parser.add_argument("--host", type=str, help="The host to sync from.")
         parser.add_argument("--port", type=int, help="The port to sync from.")
         parser.add_argument("--interval", type=int, default=60, help="The interval in seconds to sync.")
+        parser.add_argument("--concurrency", type=int, default=4, help="The number of workers that are pulled at once.")
+        parser.add_argument("--timeout", type=int, default=60, help="The timeout in seconds for connecting to a worker and between two reads.")
+        parser.add_argument("--batch-size", type=int, default=200, help="The maximum number of tracks and answers that are pulled and acknowledged at once.")
+        parser.add_argument("--sweep-interval", type=int, default=24 * 60 * 60, help="The interval in seconds of the cleanup of answers without a track that examines all answers.")
+        parser.add_argument("--grace-period", type=int, default=GRACE_PERIOD, help="The seconds after their insertion before answers without a track are deleted, such that their track can arrive later.")
+        parser.add_argument("--retries", type=int, default=3, help="The number of retries of a failed request, with exponential backoff.")
 
     def handle(self, *args, **options):
         if not options["host"]:
@@ -34,64 +51,129 @@ class Command(BaseCommand):
         host = options["host"]
         port = options["port"]
         interval = options["interval"]
+        sweep_interval = options["sweep_interval"]
+        grace_period = options["grace_period"]
+        self.timeout = options["timeout"]
+        self.batch_size = options["batch_size"]
 
-        while True:
-            tracks_before = Track.objects.count()
-            answers_before = Answer.objects.count()
+        # One session for all workers, so that connections are kept alive between the cycles.
+        self.session = requests.Session()
+        retry = Retry(
+            total=options["retries"],
+            backoff_factor=1,
+            status_forcelist=[502, 503, 504],
+            allowed_methods=["GET", "DELETE"],
+        )
+        adapter = HTTPAdapter(pool_connections=MAX_WORKERS, pool_maxsize=options["concurrency"], max_retries=retry)
+        self.session.mount("http://", adapter)
+        # Only one worker inserts into the database at a time.
+        self.load_lock = threading.Lock()
+        executor = ThreadPoolExecutor(max_workers=options["concurrency"])
 
+        state = sync_state.read_state()
+        while True:
             # Get the data from the workers.
             worker_hosts = socket.getaddrinfo(host, port, proto=socket.IPPROTO_TCP)
             worker_ips = [worker_host[4][0] for worker_host in worker_hosts]
 
-            # Fetch the status for now
-            for worker_ip in worker_ips:
-                print(f"Syncing with worker: {worker_ip}")
-                url = f"http://{worker_ip}:{port}/sync/sync"
-                try:
-                    response = requests.get(url, params={"key": settings.SYNC_KEY})
-                except requests.exceptions.ConnectionError:
-                    print(f"Worker {worker_ip} seems offline")
-                    continue
-                if response.status_code != 200:
-                    print(f"Failed to sync with worker {worker_ip}: status {response.status_code}")
-                    continue
-                if not response.text:
-                    print(f"Empty response from worker {worker_ip}")
-                    continue
-                print(f"Loaded fixtures from worker {worker_ip}")
-
-                # ---------------------
-                # This section is time critical: we don't want to wait too long
-                # until telling the worker to delete all data.
-                with tempfile.TemporaryDirectory() as temp_dir:
-                    filepath = f"{temp_dir}/fixtures.xml"
-                    with open(filepath, "w") as f:
-                        f.write(response.text)
-                    call_command("loaddata", "--format=xml", filepath)
-                # ---------------------
-
-                # Tell the worker to delete all data
-                url = f"http://{worker_ip}:{port}/sync/sync"
-                response = requests.delete(url, data=json.dumps({"key": settings.SYNC_KEY}))
-                if response.status_code != 200:
-                    print(f"Failed to delete data on worker {worker_ip}: status {response.status_code}")
-                    continue
-                print(f"Deleted data on worker {worker_ip}")
-
-            # Delete all answers that are not associated with a valid track.
-            session_ids_to_keep = Track.objects.values('session_id').distinct()
-            # Delete all answers that are not associated with a valid track.
-            Answer.objects.exclude(session_id__in=session_ids_to_keep).delete()
+            start = time.monotonic()
+            pulls = dict(zip(worker_ips, executor.map(lambda worker_ip: self.sync_worker(worker_ip, port), worker_ips)))
+            state["workers"] = pulls
+            state["cycle_seconds"] = time.monotonic() - start
+            state["timestamp"] = int(time.time())
+
+            # Delete the new answers that are not associated with a valid track.
+            cleanup = cleanup_new_answers(state.get("cleanup_watermark"), grace_period)
+            state["cleanup_watermark"] = cleanup.pop("watermark")
+            print(f"Examined {cleanup['examined']} new answers, deleted {cleanup['deleted']} answers without a track.")
+            # Sweep over all answers on a slow schedule.
+            if time.time() - state.get("sweep_timestamp", 0) >= sweep_interval:
+                sweep = sweep_answers(grace_period)
+                state["sweep_timestamp"] = int(time.time())
+                print(f"Examined {sweep['examined']} answers, deleted {sweep['deleted']} answers without a track.")
+                cleanup = {key: cleanup[key] + sweep[key] for key in cleanup}
+            state["cleanup"] = cleanup
+            sync_state.write_state(state)
 
             # Check if we need to generate new metrics
-            tracks_after = Track.objects.count()
-            answers_after = Answer.objects.count()
-            if tracks_after > tracks_before or answers_after > answers_before:
-                new_tracks = tracks_after - tracks_before
-                new_answers = answers_after - answers_before
+            new_tracks = sum(pull["tracks"] for pull in pulls.values())
+            new_answers = sum(pull["answers"] for pull in pulls.values())
+            if new_tracks > 0 or new_answers > 0:
                 print(f"Inserted {new_tracks} new tracks and {new_answers} new answers into the database.")
                 call_command("generate_metrics")
                 print("Updated promeheus metrics.")
 
             print(f"Finished sync routine. Sleeping for {interval} seconds.")
-            time.sleep(interval)
\ No newline at end of file
+            time.sleep(interval)
+
+    def sync_worker(self, worker_ip: str, port: int) -> dict:
+        """
+        Pull the data of a worker. Returns the metrics of the pull.
+        """
+        pull = {"success": False, "seconds": 0, "bytes": 0, "batches": 0, "tracks": 0, "answers": 0}
+        start = time.monotonic()
+        try:
+            self.pull_worker(worker_ip, port, pull)
+        finally:
+            pull["seconds"] = time.monotonic() - start
+            # Every thread has its own database connection.
+            connection.close()
+        return pull
+
+    def pull_worker(self, worker_ip: str, port: int, pull: dict):
+        """
+        Pull the data of a worker in batches, acknowledging every inserted batch.
+
+        The worker only deletes the acknowledged tracks and answers, so data that
+        arrives on the worker during the sync is pulled by the next batch or cycle.
+        """
+        print(f"Syncing with worker: {worker_ip}")
+        url = f"http://{worker_ip}:{port}/sync/sync"
+        # The watermarks: the last session ids of the previous batch.
+        params = {"key": settings.SYNC_KEY, "format": "wire", "version": VERSION, "limit": self.batch_size, "tracksAfter": "", "answersAfter": ""}
+        while True:
+            try:
+                response = self.session.get(url, params=params, stream=True, timeout=self.timeout)
+            except requests.exceptions.RequestException as e:
+                print(f"Worker {worker_ip} seems offline: {e}")
+                return
+            if response.status_code != 200:
+                print(f"Failed to sync with worker {worker_ip}: status {response.status_code}")
+                response.close()
+                return
+
+            # The stream is inserted chunk by chunk while it is downloaded.
+            try:
+                with response:
+                    batch = load_wire(io.BufferedReader(response.raw), lock=self.load_lock)
+                    pull["bytes"] += response.raw.tell()
+            except (WireError, requests.exceptions.RequestException, urllib3.exceptions.HTTPError) as e:
+                # The worker keeps the batch, the inserted chunks are skipped on the next sync.
+                print(f"Failed to load data from worker {worker_ip}: {e}")
+                return
+            pull["batches"] += 1
+            pull["tracks"] += batch["new_tracks"]
+            pull["answers"] += batch["new_answers"]
+            if not batch["tracks"] and not batch["answers"]:
+                break
+            print(f"Loaded {batch['new_tracks']} new tracks and {batch['new_answers']} new answers from worker {worker_ip}")
+
+            # Acknowledge the batch, such that the worker deletes it.
+            try:
+                response = self.session.delete(url, data=json.dumps({"key": settings.SYNC_KEY, "tracks": batch["tracks"], "answers": batch["answers"]}), timeout=self.timeout)
+            except requests.exceptions.RequestException as e:
+                print(f"Failed to acknowledge data on worker {worker_ip}: {e}")
+                return
+            if response.status_code != 200:
+                print(f"Failed to acknowledge data on worker {worker_ip}: status {response.status_code}")
+                return
+            print(f"Deleted {len(batch['tracks'])} tracks and {len(batch['answers'])} answers on worker {worker_ip}")
+
+            if len(batch["tracks"]) < self.batch_size and len(batch["answers"]) < self.batch_size:
+                break
+            # The records are ordered by session id.
+            if batch["tracks"]:
+                params["tracksAfter"] = batch["tracks"][-1]
+            if batch["answers"]:
+                params["answersAfter"] = batch["answers"][-1]
+        pull["success"] = True
@@ -0,0 +1,23 @@
+import json
+import os
+from typing import Dict
+
+from django.conf import settings
+
+# The file in which the sync command keeps the metrics of its last cycle.
+STATE_FILE = os.path.join(settings.BASE_DIR, "data", "sync-state.json")
+
+
+def read_state() -> Dict:
+    try:
+        with open(STATE_FILE, "r") as file:
+            return json.load(file)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+
+def write_state(state: Dict):
+    tmp_path = f"{STATE_FILE}.tmp"
+    with open(tmp_path, "w") as file:
+        json.dump(state, file)
+    os.replace(tmp_path, STATE_FILE)
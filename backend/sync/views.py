@@ -1,14 +1,20 @@
-import io
 import json
 
+from answers.images import delete_unused_images
 from answers.models import Answer
 from django.conf import settings
-from django.core.management import call_command
-from django.http import HttpResponse, HttpResponseBadRequest, JsonResponse
+from django.http import (HttpResponse, HttpResponseBadRequest, JsonResponse,
+                         StreamingHttpResponse)
 from django.utils.decorators import method_decorator
 from django.views.decorators.csrf import csrf_exempt
 from django.views.generic import View
+from sync.wire import (CONTENT_TYPE, SUPPORTED_VERSIONS, iter_objects,
+                       iter_wire)
 from tracks.models import Track
+from tracks.offload import sync_iter
+
+# The maximum number of tracks and answers per batch of the incremental sync.
+MAX_BATCH_SIZE = 1000
 
 
 @method_decorator(csrf_exempt, name='dispatch')
@@ -19,12 +25,38 @@ class SyncResource(View):
             print(f"Invalid key: {sync_key}")
             return HttpResponseBadRequest(json.dumps({"error": "Invalid key."}))
         
-        pipe = io.StringIO()
-        call_command("dumpdata", "--format", "xml", "tracks", "answers", stdout=pipe)
-        contents = pipe.getvalue()
-        pipe.close()
+        # Managers with the old models can't load XML fixtures of the current models,
+        # so managers that haven't been updated to the wire format are turned away. They
+        # don't acknowledge a failed pull, so the data stays on the worker until they are updated.
+        if request.GET.get("format") != "wire":
+            print("Sync without the wire format, the manager needs to be updated.")
+            return HttpResponse(json.dumps({"error": "Only the wire format is supported, update the manager."}), status=410)
+
+        # The manager pulls the data in batches of at most `limit` tracks and answers,
+        # after the session ids of the last batch.
+        limit = request.GET.get("limit")
+        if limit is not None:
+            try:
+                limit = int(limit)
+            except ValueError:
+                limit = 0
+            if limit < 1 or limit > MAX_BATCH_SIZE:
+                return HttpResponseBadRequest(json.dumps({"error": "Invalid limit."}))
+
+        # Managers that don't ask for a version get version 1, with the images inline.
+        try:
+            version = int(request.GET.get("version", 1))
+        except ValueError:
+            version = 0
+        if version not in SUPPORTED_VERSIONS:
+            return HttpResponseBadRequest(json.dumps({"error": "Invalid version."}))
 
-        return HttpResponse(contents, content_type="application/xml")
+        # Stream the tracks and answers from server-side cursors, see sync.wire.
+        chunks = iter_wire(iter_objects(request.GET.get("tracksAfter"), request.GET.get("answersAfter"), limit), version)
+        if settings.ASYNC_VIEWS:
+            # ASGI servers would collect a sync iterator into memory before sending it.
+            chunks = sync_iter(chunks)
+        return StreamingHttpResponse(chunks, content_type=CONTENT_TYPE)
 
     def delete(self, request):        
         # Check that the sync key is correct.
@@ -43,18 +75,28 @@ class SyncResource(View):
             print(f"Invalid key: {sync_key}")
             return HttpResponseBadRequest(json.dumps({"error": "Invalid key."}))
 
+        # The manager acknowledges the session ids that it has inserted, only these are deleted.
+        track_ids = body.get("tracks")
+        answer_ids = body.get("answers")
+        if track_ids is None and answer_ids is None:
+            return HttpResponseBadRequest(json.dumps({"error": "Missing session ids."}))
+        track_ids = track_ids or []
+        answer_ids = answer_ids or []
+        if not isinstance(track_ids, list) or not isinstance(answer_ids, list) \
+                or not all(isinstance(session_id, str) for session_id in track_ids + answer_ids):
+            return HttpResponseBadRequest(json.dumps({"error": "Invalid session ids."}))
+        if len(track_ids) > MAX_BATCH_SIZE or len(answer_ids) > MAX_BATCH_SIZE:
+            return HttpResponseBadRequest(json.dumps({"error": "Too many session ids."}))
         try:
-            qs = Track.objects.all()
-            qs_n = qs.count()
-            if qs_n > 0:
-                print(f"Deleting {qs_n} tracks as requested by manager.")
-                qs.delete()
-            qs = Answer.objects.all()
-            qs_n = qs.count()
-            if qs_n > 0:
-                print(f"Deleting {qs_n} answers as requested by manager.")
-                qs.delete()
+            _, deleted_tracks = Track.objects.filter(pk__in=track_ids).delete()
+            image_hashes = set(Answer.objects.filter(pk__in=answer_ids).exclude(question_image=None).values_list("question_image", flat=True))
+            _, deleted_answers = Answer.objects.filter(pk__in=answer_ids).delete()
+            # The images are deleted once no answer that is left on the worker references them.
+            delete_unused_images(image_hashes)
         except Exception as err:
             print(f"Error during sync: {err}")
-            return HttpResponseBadRequest(json.dumps({"error": "Error during sync."}))   
-        return JsonResponse({"status": "ok"})
\ No newline at end of file
+            return HttpResponseBadRequest(json.dumps({"error": "Error during sync."}))
+        n_tracks = deleted_tracks.get("tracks.Track", 0)
+        n_answers = deleted_answers.get("answers.Answer", 0)
+        print(f"Deleted {n_tracks} tracks and {n_answers} answers acknowledged by manager.")
+        return JsonResponse({"status": "ok", "tracks": n_tracks, "answers": n_answers})
@@ -0,0 +1,383 @@
+"""
+The wire format in which the workers send their tracks and answers to the manager.
+
+The body is a JSON header line, followed by chunks of records and an end line:
+
+    {"type": "header", "version": 2}
+    {"type": "chunk", "records": <n>, "lines": <bytes>, "size": <bytes>, "crc32": <crc32 of the chunk>}
+    <the compressed JSON lines of the n records><the binary values of the records>
+    ...
+    {"type": "end", "tracks": <n>, "answers": <n>, "images": <n>}
+
+The JSON lines of a chunk are compressed with zlib. Binary values (the
+compressed files and the sensor streams) are appended to the chunk as they
+are stored, without compressing them again, and are replaced by their size in
+the JSON lines. The manager only inserts a chunk once its checksum matches,
+and the end line tells a complete stream from a truncated one.
+
+The answers reference their question image by its hash, see answers.images.
+Every image is sent once per stream, in a record before the first answer that
+references it. In version 1, which is sent to managers that don't ask for a
+version, the answers have their image inline and there are no image records.
+"""
+import json
+import zlib
+from contextlib import nullcontext
+from typing import Iterable, Iterator, Optional, Tuple
+
+from answers.images import image_hash, store_images
+from answers.models import Answer, QuestionImage
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.utils.dateparse import parse_datetime
+from monitoring.rollups import add_answers
+from tracks.fields import CompressedTextField
+from tracks.ingest import insert_tracks
+from tracks.models import SensorStream, Track, TrackPayload
+
+# The version of the wire format, increased on incompatible changes.
+VERSION = 2
+
+# The versions that are read and written, the workers write the version that the manager asks for.
+SUPPORTED_VERSIONS = (1, 2)
+
+# The maximum number of records per chunk, which is also the number of tracks that are read and inserted at once.
+CHUNK_SIZE = 100
+
+# The size from which a chunk is sent before it has CHUNK_SIZE records, such that large tracks don't pile up in memory.
+CHUNK_BYTES = 16 * 1024 * 1024
+
+# The compression level of the JSON lines. The binary values are already compressed and aren't compressed again.
+COMPRESSLEVEL = 1
+
+# The maximum size of a line and of a chunk, such that a corrupt stream can't make the manager allocate without limit.
+MAX_LINE_SIZE = 64 * 1024
+MAX_CHUNK_SIZE = 1024 * 1024 * 1024
+
+CONTENT_TYPE = "application/octet-stream"
+
+# The fields of the tracks, the payloads and the answers that are sent, the keys of the records.
+TRACK_FIELDS = [field for field in Track._meta.concrete_fields]
+PAYLOAD_FIELDS = [field for field in TrackPayload._meta.concrete_fields if field.name != "track"]
+# When an answer was inserted is set by the database that it is inserted into.
+ANSWER_FIELDS = [field for field in Answer._meta.concrete_fields if field.name != "inserted_at"]
+
+
+class WireError(ValueError):
+    """
+    Raised when a sync stream is corrupt, truncated or has an unknown version.
+    """
+    pass
+
+
+class Blobs:
+    """
+    The binary values of a chunk, which the records take in the order in which they were appended.
+    """
+    def __init__(self, data: bytes):
+        self.data = memoryview(data)
+        self.offset = 0
+
+    def take(self, size) -> bytes:
+        if not isinstance(size, int) or size < 0 or self.offset + size > len(self.data):
+            raise WireError("Invalid binary value.")
+        value = bytes(self.data[self.offset:self.offset + size])
+        self.offset += size
+        return value
+
+
+def encode_value(field, obj, blobs: list):
+    if isinstance(field, CompressedTextField):
+        # The compressed bytes, without decompressing them.
+        value = field.get_compressed_value(obj)
+        if value is None:
+            return None
+        blobs.append(value)
+        return len(value)
+    value = field.value_from_object(obj)
+    if value is not None and field.get_internal_type() == "DateTimeField":
+        # With microseconds, the JSON encoder of Django only keeps milliseconds.
+        return value.isoformat()
+    return value
+
+
+def decode_value(field, value, blobs: Blobs):
+    if value is None:
+        return None
+    if isinstance(field, CompressedTextField):
+        return blobs.take(value)
+    if field.get_internal_type() == "DateTimeField":
+        return parse_datetime(value)
+    return value
+
+
+def encode_track(track: Track, blobs: list) -> dict:
+    payload = track.get_payload()
+    streams = []
+    for stream in track.sensor_streams.all():
+        blobs.append(bytes(stream.data))
+        streams.append({"sensor": stream.sensor, "n_samples": stream.n_samples, "data": len(stream.data)})
+    return {
+        "type": "track",
+        "track": {field.attname: encode_value(field, track, blobs) for field in TRACK_FIELDS},
+        "payload": {field.attname: encode_value(field, payload, blobs) for field in PAYLOAD_FIELDS} if payload is not None else None,
+        "streams": streams,
+    }
+
+
+def decode_track(record: dict, blobs: Blobs):
+    """
+    Create an unsaved track, its payload and its sensor streams from a track record.
+    """
+    # The binary values are taken in the order of encode_track.
+    sensor_streams = [
+        SensorStream(sensor=stream["sensor"], n_samples=stream["n_samples"], data=blobs.take(stream["data"]))
+        for stream in record["streams"]
+    ]
+    # Fields that workers of an older version don't send keep their defaults, e.g. the attributes are backfilled.
+    track = Track(**{field.attname: decode_value(field, record["track"][field.attname], blobs) for field in TRACK_FIELDS if field.attname in record["track"]})
+    if record["payload"] is not None:
+        payload = TrackPayload(track=track, **{field.attname: decode_value(field, record["payload"][field.attname], blobs) for field in PAYLOAD_FIELDS})
+        # Cache the payload on the track, so that insert_tracks finds it.
+        Track.payload.related.set_cached_value(track, payload)
+    return track, sensor_streams
+
+
+def encode_answer(answer: Answer, blobs: list, version: int = VERSION) -> dict:
+    values = {field.attname: encode_value(field, answer, blobs) for field in ANSWER_FIELDS}
+    if version == 1:
+        # Version 1 has the image inline.
+        question_image_id = values.pop("question_image_id")
+        values["question_image"] = QuestionImage.objects.values_list("data", flat=True).get(pk=question_image_id) if question_image_id is not None else None
+    return {"type": "answer", "answer": values}
+
+
+def decode_answer(record: dict, blobs: Blobs) -> Tuple[Answer, Optional[QuestionImage]]:
+    """
+    Create an unsaved answer from an answer record, and its image if the record has the image inline.
+    """
+    values = record["answer"]
+    image = None
+    if "question_image" in values:
+        # Answers of version 1 have the image inline.
+        if values["question_image"] is not None:
+            image = QuestionImage(hash=image_hash(values["question_image"]), data=values["question_image"])
+        values = {**values, "question_image_id": image.hash if image is not None else None}
+    return Answer(**{field.attname: decode_value(field, values[field.attname], blobs) for field in ANSWER_FIELDS}), image
+
+
+def encode_image(question_image_id: str) -> dict:
+    data = QuestionImage.objects.values_list("data", flat=True).get(pk=question_image_id)
+    return {"type": "image", "image": {"hash": question_image_id, "data": data}}
+
+
+def decode_image(record: dict) -> QuestionImage:
+    image = QuestionImage(hash=record["image"]["hash"], data=record["image"]["data"])
+    # The hash is the key of the content, so an image that doesn't match it is never stored.
+    if image_hash(image.data) != image.hash:
+        raise WireError("Image hash mismatch.")
+    return image
+
+
+def iter_objects(tracks_after: str = None, answers_after: str = None, limit: int = None) -> Iterator:
+    """
+    Yield the tracks and answers, read through server-side cursors and ordered by session id.
+
+    If set, only the tracks and answers after the given session ids are
+    yielded, and at most `limit` tracks and `limit` answers.
+    """
+    tracks = Track.objects.select_related("payload").prefetch_related("sensor_streams").order_by("pk")
+    answers = Answer.objects.order_by("pk")
+    if tracks_after is not None:
+        tracks = tracks.filter(pk__gt=tracks_after)
+    if answers_after is not None:
+        answers = answers.filter(pk__gt=answers_after)
+    if limit is not None:
+        tracks = tracks[:limit]
+        answers = answers[:limit]
+    yield from tracks.iterator(chunk_size=CHUNK_SIZE)
+    yield from answers.iterator(chunk_size=CHUNK_SIZE)
+
+
+def line(record: dict) -> bytes:
+    return json.dumps(record, cls=DjangoJSONEncoder, separators=(",", ":")).encode("utf-8") + b"\n"
+
+
+def encode_chunk(lines: list, blobs: list) -> bytes:
+    body = zlib.compress(b"".join(lines), COMPRESSLEVEL)
+    n_lines = len(body)
+    body = b"".join([body, *blobs])
+    return line({"type": "chunk", "records": len(lines), "lines": n_lines, "size": len(body), "crc32": zlib.crc32(body)}) + body
+
+
+def iter_wire(objects: Iterable, version: int = VERSION) -> Iterator[bytes]:
+    """
+    Encode tracks and answers into the wire format of the given version, yielding it chunk by chunk.
+    """
+    counts = {"track": 0, "answer": 0, "image": 0}
+    # The hashes of the images that were sent in this stream.
+    sent_images = set()
+    lines = []
+    blobs = []
+    size = 0
+    yield line({"type": "header", "version": version})
+    for obj in objects:
+        n_blobs = len(blobs)
+        records = []
+        if isinstance(obj, Track):
+            records.append(encode_track(obj, blobs))
+        else:
+            # The image is sent before the first answer that references it, in the same chunk.
+            if version >= 2 and obj.question_image_id is not None and obj.question_image_id not in sent_images:
+                sent_images.add(obj.question_image_id)
+                records.append(encode_image(obj.question_image_id))
+            records.append(encode_answer(obj, blobs, version))
+        for record in records:
+            counts[record["type"]] += 1
+            lines.append(line(record))
+            size += len(lines[-1])
+        size += sum(len(blob) for blob in blobs[n_blobs:])
+        if len(lines) >= CHUNK_SIZE or size >= CHUNK_BYTES:
+            yield encode_chunk(lines, blobs)
+            lines = []
+            blobs = []
+            size = 0
+    if lines:
+        yield encode_chunk(lines, blobs)
+    end = {"type": "end", "tracks": counts["track"], "answers": counts["answer"]}
+    if version >= 2:
+        end["images"] = counts["image"]
+    yield line(end)
+
+
+def read_exactly(file, size: int) -> bytes:
+    parts = []
+    while size > 0:
+        data = file.read(min(size, 1024 * 1024))
+        if not data:
+            raise WireError("Stream is truncated.")
+        parts.append(data)
+        size -= len(data)
+    return b"".join(parts)
+
+
+def read_record(file) -> dict:
+    data = file.readline(MAX_LINE_SIZE)
+    if not data:
+        raise WireError("Stream is truncated.")
+    if not data.endswith(b"\n"):
+        raise WireError("Line too long or truncated.")
+    try:
+        record = json.loads(data)
+    except ValueError as e:
+        raise WireError(f"Invalid record: {e}")
+    if not isinstance(record, dict) or "type" not in record:
+        raise WireError("Invalid record.")
+    return record
+
+
+def read_chunk(file, header: dict):
+    """
+    Read the body of a chunk and return its records and binary values, once the checksum matches.
+    """
+    size = header.get("size")
+    n_lines = header.get("lines")
+    if not isinstance(size, int) or not isinstance(n_lines, int) or not 0 <= n_lines <= size <= MAX_CHUNK_SIZE:
+        raise WireError("Invalid chunk size.")
+    body = read_exactly(file, size)
+    if zlib.crc32(body) != header.get("crc32"):
+        raise WireError("Checksum mismatch.")
+    try:
+        lines = zlib.decompress(body[:n_lines]).splitlines()
+        records = [json.loads(data) for data in lines]
+    except (zlib.error, ValueError) as e:
+        raise WireError(f"Invalid chunk: {e}")
+    if len(records) != header.get("records"):
+        raise WireError("Record count mismatch.")
+    return records, Blobs(body[n_lines:])
+
+
+def iter_chunks(file) -> Iterator[tuple]:
+    """
+    Read a wire stream from a file object and yield the records and the binary values chunk by chunk.
+
+    Raises WireError if the stream is corrupt, truncated or has an unknown version.
+    """
+    header = read_record(file)
+    if header["type"] != "header" or header.get("version") not in SUPPORTED_VERSIONS:
+        raise WireError(f"Unsupported header: {str(header)[:100]}")
+    counts = {"track": 0, "answer": 0}
+    if header["version"] >= 2:
+        counts["image"] = 0
+    while True:
+        record = read_record(file)
+        if record["type"] == "chunk":
+            records, blobs = read_chunk(file, record)
+            for chunk_record in records:
+                if not isinstance(chunk_record, dict) or chunk_record.get("type") not in counts:
+                    raise WireError("Invalid record.")
+                counts[chunk_record["type"]] += 1
+            yield records, blobs
+        elif record["type"] == "end":
+            if record.get("tracks") != counts["track"] or record.get("answers") != counts["answer"] or record.get("images") != counts.get("image"):
+                raise WireError("Record count mismatch.")
+            return
+        else:
+            raise WireError(f"Unknown record type: {str(record['type'])[:100]}")
+
+
+def insert_answers(answers: list) -> int:
+    """
+    Insert answers, skipping the answers that already exist. Returns the number of inserted answers.
+    """
+    with transaction.atomic():
+        existing = set(Answer.objects.filter(session_id__in=[answer.session_id for answer in answers]).values_list("session_id", flat=True))
+        new_answers = [answer for answer in answers if answer.session_id not in existing]
+        # Conflicts with answers that are inserted concurrently are ignored.
+        Answer.objects.bulk_create(new_answers, ignore_conflicts=True)
+        if not settings.WORKER_MODE:
+            add_answers(new_answers)
+    return len(new_answers)
+
+
+def load_wire(file, lock=None) -> dict:
+    """
+    Insert the tracks and answers of a wire stream, chunk by chunk.
+
+    Existing tracks and answers are skipped, so a stream can be loaded again
+    after an error. If a lock is given, the chunks are inserted while holding
+    it, such that streams can be read concurrently but are inserted one chunk
+    at a time. Returns the session ids of the tracks and answers of the stream,
+    which are all in the database afterwards, and the number of inserted ones.
+    """
+    result = {"tracks": [], "answers": [], "new_tracks": 0, "new_answers": 0}
+    for records, blobs in iter_chunks(file):
+        tracks = []
+        answers = []
+        images = []
+        try:
+            # The records take their binary values in order.
+            for record in records:
+                if record["type"] == "track":
+                    tracks.append(decode_track(record, blobs))
+                elif record["type"] == "image":
+                    images.append(decode_image(record))
+                else:
+                    answer, image = decode_answer(record, blobs)
+                    answers.append(answer)
+                    if image is not None:
+                        images.append(image)
+        except (KeyError, TypeError, ValueError, AttributeError) as e:
+            raise WireError(f"Invalid record: {e}")
+        with lock or nullcontext():
+            if tracks:
+                result["new_tracks"] += insert_tracks(tracks)
+            # The images are stored before the answers that reference them.
+            if images:
+                store_images(images)
+            if answers:
+                result["new_answers"] += insert_answers(answers)
+        result["tracks"].extend(track.session_id for track, _ in tracks)
+        result["answers"].extend(answer.session_id for answer in answers)
+    return result
@@ -0,0 +1,94 @@
+"""
+The attributes of the metadata that are extracted into columns of the tracks, such that they can be filtered and aggregated in SQL.
+
+The attributes are read from the metadata when a track is uploaded. Tracks
+that were uploaded before, or synced from workers that don't extract them yet,
+are filled by the backfill_attributes command and by generate_metrics.
+
+To add an attribute, add its column to the track, add it to METADATA_ATTRIBUTES
+and increase ATTRIBUTES_VERSION, such that the backfill extracts it from the existing tracks.
+"""
+from typing import Any, Callable, NamedTuple, Optional
+
+from django.db.models import Q
+from tracks.backfill import CHUNK_SIZE, backfill
+from tracks.models import Track
+
+# The version of the extracted attributes, stored with every track. Tracks with an older version are backfilled.
+ATTRIBUTES_VERSION = 1
+
+
+def text(value) -> Optional[str]:
+    """
+    Store text and numbers as text, e.g. build numbers that older apps sent as numbers.
+    """
+    if value is None or isinstance(value, (dict, list)):
+        return None
+    return str(value)[:255]
+
+
+def flag(value) -> bool:
+    return bool(value)
+
+
+def parse_flag(value: str) -> bool:
+    if value not in ("true", "false"):
+        raise ValueError(f"Invalid boolean: {value[:100]}")
+    return value == "true"
+
+
+class MetadataAttribute(NamedTuple):
+    # The column of the track.
+    field: str
+    # The key in the metadata, which is also the filter parameter of the list endpoint.
+    key: str
+    # Converts the value in the metadata into the value of the column. Tracks without the key get null.
+    convert: Callable[[Any], Any]
+    # Parses the value of the filter parameter, raises ValueError if it is invalid.
+    parse: Callable[[str], Any]
+
+
+METADATA_ATTRIBUTES = (
+    MetadataAttribute("app_version", "appVersion", text, str),
+    MetadataAttribute("build_number", "buildNumber", text, str),
+    MetadataAttribute("is_dark_mode", "isDarkMode", flag, parse_flag),
+    MetadataAttribute("save_battery_mode_enabled", "saveBatteryModeEnabled", flag, parse_flag),
+)
+
+
+def extract_attributes(metadata) -> dict:
+    """
+    Get the values of the attribute columns of a track, including the version of the attributes.
+    """
+    values = {"attributes_version": ATTRIBUTES_VERSION}
+    for attribute in METADATA_ATTRIBUTES:
+        if isinstance(metadata, dict) and attribute.key in metadata:
+            values[attribute.field] = attribute.convert(metadata[attribute.key])
+        else:
+            values[attribute.field] = None
+    return values
+
+
+def filter_attributes(tracks, params):
+    """
+    Filter the tracks by the attributes that are given in the parameters. Raises ValueError if a value is invalid.
+    """
+    for attribute in METADATA_ATTRIBUTES:
+        if attribute.key in params:
+            tracks = tracks.filter(**{attribute.field: attribute.parse(params[attribute.key])})
+    return tracks
+
+
+def pending_tracks():
+    """
+    The tracks whose attributes haven't been extracted yet, or with an older version of the attributes.
+    """
+    return Track.objects.filter(Q(attributes_version=None) | Q(attributes_version__lt=ATTRIBUTES_VERSION))
+
+
+def backfill_attributes(chunk_size: int = CHUNK_SIZE, progress: bool = False) -> int:
+    """
+    Extract the attributes of the pending tracks. Returns the number of updated tracks.
+    """
+    fields = ["attributes_version", *[attribute.field for attribute in METADATA_ATTRIBUTES]]
+    return backfill(pending_tracks(), extract_attributes, fields, chunk_size, progress, "attributes")
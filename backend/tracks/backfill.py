@@ -0,0 +1,52 @@
+"""
+The backfill of the columns of the tracks that are computed from their metadata.
+
+The columns are computed when a track is uploaded. Tracks that were uploaded
+before, or synced from workers that don't compute them yet, are backfilled by
+the backfill commands and by generate_metrics. Only the session ids and the
+metadata are read, and only the computed columns are written, chunk by chunk.
+Every chunk is committed on its own, so an interrupted backfill continues with
+the remaining pending tracks.
+"""
+import time
+from typing import Any, Callable, Sequence
+
+from django.db import transaction
+from tracks.fields import load_json
+from tracks.models import Track
+
+# The number of tracks that are read and updated at once.
+CHUNK_SIZE = 1000
+
+
+def backfill(pending, compute: Callable[[Any], dict], fields: Sequence[str], chunk_size: int = CHUNK_SIZE, progress: bool = False, name: str = "columns") -> int:
+    """
+    Compute the columns of the pending tracks from their metadata. Returns the number of updated tracks.
+
+    `compute` gets the parsed metadata and returns the values of the `fields` by column.
+    """
+    total = pending.count()
+    if not total:
+        return 0
+    start = time.monotonic()
+    updated = 0
+    chunk = []
+    rows = pending.order_by().values_list("session_id", "payload__metadata").iterator(chunk_size=chunk_size)
+    for session_id, metadata in rows:
+        chunk.append(Track(session_id=session_id, **compute(load_json(metadata))))
+        if len(chunk) >= chunk_size:
+            updated += update_tracks(chunk, fields)
+            chunk = []
+            if progress:
+                print(f"Updated the {name} of {updated}/{total} tracks ({time.monotonic() - start:.1f}s).")
+    if chunk:
+        updated += update_tracks(chunk, fields)
+        if progress:
+            print(f"Updated the {name} of {updated}/{total} tracks ({time.monotonic() - start:.1f}s).")
+    return updated
+
+
+def update_tracks(tracks: list, fields: Sequence[str]) -> int:
+    with transaction.atomic():
+        return Track.objects.bulk_update(tracks, fields)
+
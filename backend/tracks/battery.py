@@ -0,0 +1,58 @@
+"""
+The battery features of tracks, which are used for the battery consumption metrics.
+
+The features are computed from the battery states in the metadata when a
+track is uploaded. Tracks that were uploaded before, or synced from workers
+that don't compute them yet, are classified by the backfill_battery command
+and by generate_metrics.
+"""
+from typing import Optional, Tuple
+
+from django.db.models import Q
+from tracks.backfill import CHUNK_SIZE, backfill
+from tracks.models import Track
+
+# Battery states that make a track unusable for the analysis of the consumption.
+CHARGING_STATES = ("BatteryState.charging", "BatteryState.full")
+
+
+def battery_features(metadata) -> Tuple[bool, Optional[float]]:
+    """
+    Compute whether a track can be used for the battery analysis and its average battery consumption per minute.
+
+    Tracks without at least two battery states, with a charging or full battery,
+    or with malformed battery states can't be used and have no consumption.
+    """
+    battery_states = metadata.get("batteryStates") if isinstance(metadata, dict) else None
+    if not isinstance(battery_states, list) or len(battery_states) < 2:
+        return False, None
+    if any(isinstance(battery_state, dict) and battery_state.get("batteryState") in CHARGING_STATES for battery_state in battery_states):
+        return False, None
+    try:
+        total_battery_consumption = battery_states[0]["level"] - battery_states[-1]["level"]
+        total_milliseconds = battery_states[-1]["timestamp"] - battery_states[0]["timestamp"]
+    except (KeyError, TypeError):
+        return False, None
+    if total_milliseconds <= 0:
+        return False, None
+    total_minutes = total_milliseconds / 1000 / 60
+    return True, total_battery_consumption / total_minutes
+
+
+def pending_tracks():
+    """
+    The tracks whose battery features haven't been computed yet.
+    """
+    return Track.objects.filter(Q(has_battery_data=None) | Q(has_battery_data=True, avg_battery_consumption=None))
+
+
+def battery_columns(metadata) -> dict:
+    has_battery_data, avg_battery_consumption = battery_features(metadata)
+    return {"has_battery_data": has_battery_data, "avg_battery_consumption": avg_battery_consumption}
+
+
+def backfill_battery_features(chunk_size: int = CHUNK_SIZE, progress: bool = False) -> int:
+    """
+    Compute the battery features of the pending tracks. Returns the number of updated tracks.
+    """
+    return backfill(pending_tracks(), battery_columns, ["has_battery_data", "avg_battery_consumption"], chunk_size, progress, "battery features")
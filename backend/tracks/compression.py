@@ -0,0 +1,122 @@
+import codecs
+import zlib
+from typing import Iterable, Iterator, Optional
+
+# The window bits that tell zlib to expect a gzip header and trailer.
+GZIP_WBITS = 16 + zlib.MAX_WBITS
+
+# The number of bytes that are read from the upload and inflated at once.
+CHUNK_SIZE = 64 * 1024
+
+
+class PayloadTooLarge(Exception):
+    """
+    Raised when a compressed upload inflates to more bytes than allowed.
+    """
+    pass
+
+
+class DecompressionBudget:
+    """
+    Keeps track of the decompressed bytes of all files of one upload.
+    """
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self.size = 0
+
+    def consume(self, n_bytes: int):
+        self.size += n_bytes
+        if self.size > self.max_size:
+            raise PayloadTooLarge(f"Upload exceeds {self.max_size} decompressed bytes.")
+
+    def release(self, n_bytes: int):
+        """
+        Give back bytes that were consumed by a file which is inflated again.
+        """
+        self.size -= n_bytes
+
+
+def iter_gunzip(file, max_size: int, budget: Optional[DecompressionBudget] = None, chunk_size: int = CHUNK_SIZE) -> Iterator[bytes]:
+    """
+    Incrementally inflate a gzip file and yield the decompressed chunks.
+
+    Neither the compressed nor the decompressed file is held in memory as a whole.
+    Each call to the decompressor is capped at `chunk_size` output bytes, such that
+    a gzip bomb is detected before it can allocate more than `max_size` bytes.
+    """
+    decompressor = zlib.decompressobj(GZIP_WBITS)
+    started = False
+    size = 0
+    data = b""
+    while True:
+        if not data:
+            data = file.read(chunk_size)
+        if data:
+            started = True
+            chunk = decompressor.decompress(data, chunk_size)
+            data = decompressor.unconsumed_tail
+        elif not started:
+            return
+        else:
+            # The file is exhausted, emit the output that is still buffered in the decompressor.
+            chunk = decompressor.flush()
+            if not decompressor.eof:
+                # Same behavior as zlib.decompress for truncated files.
+                raise zlib.error("Error -5 while decompressing data: incomplete or truncated stream")
+        if chunk:
+            size += len(chunk)
+            if size > max_size:
+                raise PayloadTooLarge(f"File exceeds {max_size} decompressed bytes.")
+            if budget is not None:
+                budget.consume(len(chunk))
+            yield chunk
+        if decompressor.eof:
+            # Concatenated gzip members are inflated one after another, like gzip.decompress does.
+            data = decompressor.unused_data
+            decompressor = zlib.decompressobj(GZIP_WBITS)
+            started = False
+
+
+def read_gzip(file, max_size: int, budget: Optional[DecompressionBudget] = None) -> bytes:
+    """
+    Check that a gzip file inflates within the limits and return its compressed bytes.
+
+    The decompressed chunks are discarded, so only the compressed file is held in memory.
+    """
+    for _ in iter_gunzip(file, max_size, budget):
+        pass
+    file.seek(0)
+    return file.read()
+
+
+def gunzip_text(file, max_size: int, budget: Optional[DecompressionBudget] = None, encoding: str = "utf-8") -> str:
+    """
+    Inflate a gzip file into a string, decoding the chunks as they are inflated.
+    """
+    return "".join(iter_gunzip_text(file, max_size, budget, encoding))
+
+
+def iter_gunzip_text(file, max_size: int, budget: Optional[DecompressionBudget] = None, encoding: str = "utf-8") -> Iterator[str]:
+    """
+    Incrementally inflate a gzip file and yield the decoded text chunks.
+    """
+    decoder = codecs.getincrementaldecoder(encoding)()
+    for chunk in iter_gunzip(file, max_size, budget):
+        text = decoder.decode(chunk)
+        if text:
+            yield text
+    text = decoder.decode(b"", final=True)
+    if text:
+        yield text
+
+
+def iter_gzip(chunks: Iterable[str], compresslevel: int = 6, encoding: str = "utf-8") -> Iterator[bytes]:
+    """
+    Incrementally compress text chunks into a gzip stream, like gzip_text does for a whole string.
+    """
+    compressor = zlib.compressobj(compresslevel, zlib.DEFLATED, GZIP_WBITS)
+    for chunk in chunks:
+        data = compressor.compress(chunk.encode(encoding))
+        if data:
+            yield data
+    yield compressor.flush()
@@ -1,37 +1,286 @@
+import base64
+import gzip
 import json
+from functools import partialmethod
 
+from django.conf import settings
 from django.core.serializers.json import DjangoJSONEncoder
 from django.db import models
+from django.db.models.fields.json import (ContainedBy, DataContains, HasAnyKeys,
+                                         HasKey, HasKeys, KeyTransformFactory)
+from django.db.models.query_utils import DeferredAttribute
+
+# orjson parses and serializes JSON several times faster than the json module, it is installed with the fast-json extra.
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+# The lookups of JSON values, which only work on jsonb columns.
+JSONB_LOOKUPS = {
+    "contains": DataContains,
+    "contained_by": ContainedBy,
+    "has_key": HasKey,
+    "has_keys": HasKeys,
+    "has_any_keys": HasAnyKeys,
+}
+
+
+class RawJSON(str):
+    """
+    The JSON text of a JSONField as it was read from the database, before it is parsed.
+    """
+    pass
+
+
+def load_json(value):
+    """
+    Parse the JSON text of a JSONField.
+
+    Values that are already parsed are returned as they are.
+    """
+    if value is None or not isinstance(value, str):
+        return value
+    if not value:
+        return None
+    # When the string contains symbols like Ã\\x9f (ß), we need to use the correct encoding.
+    if "\\x" in value:
+        value = bytes(value, "utf-8").decode("unicode_escape")
+    if orjson is not None:
+        try:
+            # orjson only reads exact strings, not RawJSON.
+            return orjson.loads(str(value) if type(value) is not str else value)
+        except orjson.JSONDecodeError:
+            # E.g. NaN, which the json module writes but orjson doesn't read.
+            pass
+    try:
+        return json.loads(value)
+    except (TypeError, ValueError) as e:
+        # Print out a detailed error message.
+        print(f"Error: {e}")
+        raise
+
+
+def dump_json(value) -> str:
+    """
+    Serialize a value of a JSONField.
+    """
+    if orjson is not None:
+        try:
+            return orjson.dumps(value, default=DjangoJSONEncoder().default, option=orjson.OPT_NON_STR_KEYS).decode("utf-8")
+        except TypeError:
+            # E.g. integers with more than 64 bits, which the json module can write.
+            pass
+    return json.dumps(value, cls=DjangoJSONEncoder)
+
+
+class JSONDescriptor(DeferredAttribute):
+    """
+    Parses the JSON text that was read from the database on first attribute access.
+
+    Loading a model doesn't parse its JSON, so models whose JSON isn't used don't pay for it.
+    """
+    def __get__(self, instance, cls=None):
+        if instance is None:
+            return self
+        value = super().__get__(instance, cls)
+        if isinstance(value, RawJSON):
+            value = load_json(value)
+            instance.__dict__[self.field.attname] = value
+        return value
+
+    def __set__(self, instance, value):
+        # A data descriptor, so that the attribute isn't read from the instance dict without parsing it.
+        instance.__dict__[self.field.attname] = value
 
 
 class JSONField(models.TextField):
     """
-    A JSONField that uses the json module to serialize/deserialize data.
+    A JSONField that is stored as text and parsed when it is accessed.
+
+    The JSON is parsed and serialized with orjson if it is installed, otherwise
+    with the json module. `get_<name>_json()` returns the JSON text without
+    parsing it. If METADATA_JSONB is set, the column is a jsonb column on
+    PostgreSQL, whose keys can be queried, e.g. `filter(metadata__deviceType="Pixel 7")`.
+    Querysets of values return the JSON text as RawJSON, which is parsed with `load_json`.
     """
+    descriptor_class = JSONDescriptor
+
+    def contribute_to_class(self, cls, name, *args, **kwargs):
+        super().contribute_to_class(cls, name, *args, **kwargs)
+        setattr(cls, f"get_{self.name}_json", partialmethod(_get_json_text, field=self))
+
+    def db_type(self, connection):
+        if settings.METADATA_JSONB and connection.vendor == "postgresql":
+            return "jsonb"
+        return super().db_type(connection)
+
+    def get_lookup(self, lookup_name):
+        if settings.METADATA_JSONB and lookup_name in JSONB_LOOKUPS:
+            return JSONB_LOOKUPS[lookup_name]
+        return super().get_lookup(lookup_name)
+
+    def get_transform(self, name):
+        transform = super().get_transform(name)
+        if transform is None and settings.METADATA_JSONB:
+            # Key lookups, which only work on jsonb columns.
+            return KeyTransformFactory(name)
+        return transform
+
+    def get_json_text(self, obj):
+        """
+        Get the JSON text of the field, without parsing the value if it wasn't accessed yet.
+        """
+        value = obj.__dict__.get(self.attname)
+        # Text with escaped bytes is repaired when it is parsed, so it is serialized again.
+        if isinstance(value, RawJSON) and "\\x" not in value:
+            return str(value)
+        value = getattr(obj, self.attname)
+        return dump_json(value) if value is not None else None
+
+    def pre_save(self, model_instance, add):
+        # The JSON text is saved as it is if it wasn't accessed.
+        value = model_instance.__dict__.get(self.attname)
+        if isinstance(value, RawJSON):
+            return value
+        return super().pre_save(model_instance, add)
+
+    def get_prep_value(self, value):
+        # Lookup values aren't JSON text, e.g. the "Pixel 7" of a key lookup.
+        return value
+
+    def get_db_prep_value(self, value, connection, prepared=False):
+        # The values of lookups on jsonb columns are compared as JSON.
+        if self.db_type(connection) == "jsonb" and value is not None and not isinstance(value, RawJSON):
+            return dump_json(value)
+        return super().get_db_prep_value(value, connection, prepared)
+
     def to_python(self, value):
-        if not value: 
-            return None
-        # When the string contains symbols like Ã\\x9f (ß), we need to use the correct encoding.
-        if isinstance(value, str) and "\\x" in value:
-            value = bytes(value, "utf-8").decode("unicode_escape")
-        try:
-            return json.loads(value)
-        except (TypeError, ValueError) as e:
-            # Print out a detailed error message.
-            print(f"Error: {e}")
-            raise
+        return load_json(value)
 
     def from_db_value(self, value, *args):
-        return self.to_python(value)
+        if value is None or not isinstance(value, str):
+            return value
+        return RawJSON(value)
 
     def get_db_prep_save(self, value, *args, **kwargs):
         value_for_db = None
-        if isinstance(value, dict):
-            value_for_db = json.dumps(value, cls=DjangoJSONEncoder)
+        if isinstance(value, RawJSON):
+            value_for_db = str(value)
+        elif isinstance(value, dict):
+            value_for_db = dump_json(value)
         return value_for_db
     
     def value_to_string(self, obj):
         value = self.value_from_object(obj)
         if value is not None:
-            return json.dumps(value, cls=DjangoJSONEncoder)
+            return dump_json(value)
         return ''
+
+
+def _get_json_text(obj, field):
+    return field.get_json_text(obj)
+
+
+# The gzip magic bytes, used to tell compressed payloads apart from plain text.
+GZIP_MAGIC = b"\x1f\x8b"
+
+
+def gzip_text(value: str) -> bytes:
+    """
+    Compress a string with gzip. The mtime is fixed, so equal strings give equal bytes.
+    """
+    return gzip.compress(value.encode("utf-8"), compresslevel=6, mtime=0)
+
+
+class CompressedTextDescriptor(DeferredAttribute):
+    """
+    Decompresses the stored gzip bytes on first attribute access.
+
+    The compressed bytes are kept next to the text, so that they can be
+    written back or passed through without compressing the text again.
+    """
+    def __get__(self, instance, cls=None):
+        if instance is None:
+            return self
+        value = super().__get__(instance, cls)
+        if isinstance(value, (bytes, memoryview)):
+            compressed = bytes(value)
+            value = gzip.decompress(compressed).decode("utf-8")
+            instance.__dict__[self.field.attname] = value
+            instance.__dict__[self.field.compressed_cache_name] = compressed
+        return value
+
+    def __set__(self, instance, value):
+        instance.__dict__[self.field.attname] = value
+        instance.__dict__.pop(self.field.compressed_cache_name, None)
+
+
+class CompressedTextField(models.BinaryField):
+    """
+    A text field that is stored as gzip compressed bytes.
+
+    Assigning a string compresses it when the model is saved. Assigning bytes
+    stores them as they are, so they must already be gzip compressed (e.g. the
+    files uploaded by the app). Reading the attribute returns the decompressed
+    text, while `get_<name>_gzip()` returns the compressed bytes without inflating them.
+    """
+    descriptor_class = CompressedTextDescriptor
+
+    def contribute_to_class(self, cls, name, *args, **kwargs):
+        super().contribute_to_class(cls, name, *args, **kwargs)
+        setattr(cls, f"get_{self.name}_gzip", partialmethod(_get_compressed_value, field=self))
+
+    @property
+    def compressed_cache_name(self):
+        return f"_{self.attname}_gzip"
+
+    def get_compressed_value(self, obj):
+        if self.attname not in obj.__dict__:
+            # The field was deferred, load the compressed bytes without inflating them.
+            obj.__dict__[self.attname] = type(obj)._base_manager \
+                .filter(pk=obj.pk) \
+                .values_list(self.attname, flat=True) \
+                .get()
+        value = obj.__dict__[self.attname]
+        if value is None:
+            return None
+        if isinstance(value, (bytes, memoryview)):
+            return bytes(value)
+        compressed = obj.__dict__.get(self.compressed_cache_name)
+        if compressed is None:
+            compressed = gzip_text(value)
+            obj.__dict__[self.compressed_cache_name] = compressed
+        return compressed
+
+    def pre_save(self, model_instance, add):
+        return self.get_compressed_value(model_instance)
+
+    def get_db_prep_value(self, value, connection, prepared=False):
+        if isinstance(value, str):
+            value = gzip_text(value)
+        return super().get_db_prep_value(value, connection, prepared)
+
+    def to_python(self, value):
+        # Serialized fixtures contain the compressed bytes in base 64.
+        # Plain text from fixtures created before the field was compressed is kept as text.
+        if isinstance(value, str):
+            try:
+                compressed = base64.b64decode(value.encode("ascii"), validate=True)
+            except (ValueError, UnicodeEncodeError):
+                return value
+            if not compressed.startswith(GZIP_MAGIC):
+                return value
+            return compressed
+        return value
+
+    def value_to_string(self, obj):
+        compressed = self.get_compressed_value(obj)
+        if compressed is None:
+            return None
+        return base64.b64encode(compressed).decode("ascii")
+
+
+def _get_compressed_value(obj, field):
+    return field.get_compressed_value(obj)
@@ -0,0 +1,163 @@
+import codecs
+import json
+from contextlib import contextmanager
+from typing import List, Tuple
+
+from django.conf import settings
+from django.db import transaction
+from monitoring import instrumentation
+from monitoring.rollups import add_tracks
+from tracks.attributes import extract_attributes
+from tracks.battery import battery_features
+from tracks.compression import (DecompressionBudget, gunzip_text, iter_gunzip,
+                                read_gzip)
+from tracks.models import SensorStream, Track, TrackPayload
+from tracks.sensors import (SENSORS, SensorFormatError, encode_sensor_data,
+                            parse_sensor_csv)
+
+# The names of the multipart files that are uploaded by the app.
+UPLOAD_FILES = (
+    "metadata.json.gz",
+    "gps.csv.gz",
+    "accelerometer.csv.gz",
+    "gyroscope.csv.gz",
+    "magnetometer.csv.gz",
+)
+
+
+@contextmanager
+def observed_file(name: str, file, budget: DecompressionBudget):
+    """
+    Observe the decompression time and the compressed and decompressed size of an uploaded file that is read in the block.
+    """
+    consumed = budget.size
+    with instrumentation.timed("track_upload_file_decompression_seconds", (name,)):
+        yield
+    # The file is read to the end, so its position is its compressed size.
+    instrumentation.observe("track_upload_file_bytes", (name, "compressed"), file.tell())
+    instrumentation.observe("track_upload_file_bytes", (name, "decompressed"), budget.size - consumed)
+
+
+def read_track_files(files):
+    """
+    Read the uploaded files of a track, given as a mapping from upload names to file objects.
+
+    The files are inflated chunk by chunk and the decompressed size is bounded
+    per file and per upload, so that gzip bombs can't exhaust the worker memory.
+    The GPS data is kept as uploaded, i.e. gzip compressed. The inertial sensor
+    data is converted into packed columns, files that can't be converted are kept as uploaded.
+
+    Returns the metadata, the compressed GPS data, the compressed sensor CSVs that
+    couldn't be converted and the sensor streams. Raises PayloadTooLarge if the limits are exceeded.
+    The decompression time and the sizes of every file are observed in the request metrics.
+    """
+    budget = DecompressionBudget(settings.MAX_DECOMPRESSED_TRACK_SIZE)
+    max_file_size = settings.MAX_DECOMPRESSED_FILE_SIZE
+
+    metadata_file = files.get("metadata.json.gz", None)
+    with observed_file("metadata.json.gz", metadata_file, budget):
+        metadata = json.loads(gunzip_text(metadata_file, max_file_size, budget))
+    gps_csv = files.get("gps.csv.gz", None)
+    with observed_file("gps.csv.gz", gps_csv, budget):
+        gps_gz = read_gzip(gps_csv, max_file_size, budget)
+
+    sensor_streams = []
+    sensor_csvs = {}
+    for sensor in SENSORS:
+        sensor_file = files.get(f"{sensor}.csv.gz", None)
+        sensor_csvs[sensor] = None
+        if not sensor_file:
+            continue
+        with observed_file(f"{sensor}.csv.gz", sensor_file, budget):
+            consumed = budget.size
+            try:
+                decoder = codecs.getincrementaldecoder("utf-8")()
+                data = parse_sensor_csv(decoder.decode(chunk) for chunk in iter_gunzip(sensor_file, max_file_size, budget))
+            except SensorFormatError as e:
+                print(f"Storing {sensor} data as CSV: {e}")
+                # The file is inflated again, so the bytes of the failed parse are only counted once.
+                budget.release(budget.size - consumed)
+                sensor_file.seek(0)
+                sensor_csvs[sensor] = read_gzip(sensor_file, max_file_size, budget)
+                continue
+        sensor_streams.append(SensorStream(sensor=sensor, n_samples=len(data.timestamp), data=encode_sensor_data(data)))
+
+    return metadata, gps_gz, sensor_csvs, sensor_streams
+
+
+def build_track(metadata, gps_gz, sensor_csvs) -> Track:
+    """
+    Create an unsaved track from the uploaded data.
+    """
+    has_battery_data, avg_battery_consumption = battery_features(metadata)
+    return Track(
+        # Fields that are extracted from the raw json data for querying.
+        start_time=metadata.get("startTime", None),
+        end_time=metadata.get("endTime", None),
+        debug=metadata.get("debug", False) if metadata.get("debug", False) != None else False,
+        backend=metadata.get("backend", "unknown") if metadata.get("backend", "unknown") != None else "unknown",
+        positioning_mode=metadata.get("positioningMode", "unknown") if metadata.get("positioningMode", "unknown") != None else "unknown",
+        user_id=metadata.get("userId", "anonymous") if metadata.get("userId", "anonymous") != None else "anonymous",
+        session_id=metadata.get("sessionId", "unknown") if metadata.get("sessionId", "unknown") != None else "unknown",
+        device_type=metadata.get("deviceType", "unknown") if metadata.get("deviceType", "unknown") != None else "unknown",
+        bike_type=metadata.get("bikeType", "unknown") if metadata.get("bikeType", "unknown") != None else "unknown",
+        preference_type=metadata.get("preferenceType", "unknown") if metadata.get("preferenceType", "unknown") != None else "unknown",
+        activity_type=metadata.get("activityType", "unknown") if metadata.get("activityType", "unknown") != None else "unknown",
+        has_battery_data=has_battery_data,
+        avg_battery_consumption=avg_battery_consumption,
+        **extract_attributes(metadata),
+        # Fields that contain raw data.
+        metadata=metadata,
+        gps_csv=gps_gz,
+        accelerometer_csv=sensor_csvs["accelerometer"],
+        gyroscope_csv=sensor_csvs["gyroscope"],
+        magnetometer_csv=sensor_csvs["magnetometer"],
+    )
+
+
+def save_track(track: Track, sensor_streams: List[SensorStream]):
+    """
+    Insert a track together with its sensor streams.
+    """
+    with transaction.atomic():
+        track.save()
+        for sensor_stream in sensor_streams:
+            sensor_stream.track = track
+        SensorStream.objects.bulk_create(sensor_streams)
+        if not settings.WORKER_MODE:
+            add_tracks([track])
+
+
+def insert_tracks(tracks: List[Tuple[Track, List[SensorStream]]]) -> int:
+    """
+    Insert tracks together with their sensor streams in one batch.
+
+    Tracks that already exist in the database are skipped, such that a batch
+    can be inserted again after a crash. Returns the number of inserted tracks.
+    """
+    with transaction.atomic():
+        session_ids = [track.session_id for track, _ in tracks]
+        existing = set(Track.objects.filter(session_id__in=session_ids).values_list("session_id", flat=True))
+        new_tracks = []
+        new_payloads = []
+        new_sensor_streams = []
+        for track, sensor_streams in tracks:
+            if track.session_id in existing:
+                continue
+            # Skip duplicates within the batch.
+            existing.add(track.session_id)
+            new_tracks.append(track)
+            payload = track.get_payload()
+            if payload is not None:
+                payload.track = track
+                new_payloads.append(payload)
+            for sensor_stream in sensor_streams:
+                sensor_stream.track = track
+                new_sensor_streams.append(sensor_stream)
+        Track.objects.bulk_create(new_tracks)
+        TrackPayload.objects.bulk_create(new_payloads)
+        SensorStream.objects.bulk_create(new_sensor_streams)
+        # The manager keeps the aggregates behind the metrics up to date, see monitoring.rollups.
+        if not settings.WORKER_MODE:
+            add_tracks(new_tracks)
+    return len(new_tracks)
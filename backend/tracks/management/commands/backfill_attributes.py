@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+from tracks.attributes import backfill_attributes, pending_tracks
+from tracks.backfill import CHUNK_SIZE
+
+
+class Command(BaseCommand):
+    """
+    This command extracts the metadata attributes of tracks that were uploaded before they were extracted at ingest.
+
+    Every chunk of tracks is committed on its own. If the command is interrupted,
+    running it again continues with the tracks that are still pending.
+    """
+
+    help = """Extracts the metadata attributes into the columns of the tracks that don't have them yet."""
+
+    def add_arguments(self, parser):
+        parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE, help="The number of tracks that are read and updated at once.")
+
+    def handle(self, *args, **options):
+        print(f"Backfilling the attributes of {pending_tracks().count()} tracks.")
+        updated = backfill_attributes(options["chunk_size"], progress=True)
+        print(f"Finished, updated {updated} tracks.")
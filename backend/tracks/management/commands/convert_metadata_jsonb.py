@@ -0,0 +1,106 @@
+import json
+import math
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connection, transaction
+from tracks.fields import load_json
+from tracks.models import TrackPayload
+
+# The number of payloads whose metadata is repaired per transaction.
+CHUNK_SIZE = 1000
+
+# The GIN index of the jsonb column, which answers the contains and has_key lookups on keys that aren't extracted into columns.
+GIN_INDEX = "track_payload_metadata_gin_idx"
+
+
+def strict_json(value):
+    """
+    Replace the values that are valid in the json module but not in jsonb: NaN and infinite numbers, and null characters.
+    """
+    if isinstance(value, float) and not math.isfinite(value):
+        return None
+    if isinstance(value, str):
+        return value.replace("\x00", "")
+    if isinstance(value, dict):
+        return {strict_json(key): strict_json(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [strict_json(item) for item in value]
+    return value
+
+
+class Command(BaseCommand):
+    """
+    This command converts the metadata column of the track payloads between text and jsonb on PostgreSQL.
+
+    jsonb only accepts standard JSON, so the metadata with escaped bytes, NaN
+    or null characters is repaired first, chunk by chunk. The conversion
+    rewrites the table and locks it until it is finished. jsonb doesn't keep the
+    order of the keys and the whitespace of the stored text. The jsonb column
+    gets a GIN index, which is dropped again on revert.
+    """
+
+    help = """Converts the metadata of the tracks into a jsonb column, set METADATA_JSONB before. --revert converts it back into text."""
+
+    def add_arguments(self, parser):
+        parser.add_argument("--revert", action="store_true", help="Convert the jsonb column back into a text column, unset METADATA_JSONB afterwards.")
+
+    def handle(self, *args, **options):
+        if connection.vendor != "postgresql":
+            raise CommandError("jsonb columns are only supported on PostgreSQL.")
+        if not options["revert"] and not settings.METADATA_JSONB:
+            raise CommandError("Set METADATA_JSONB=True before converting the metadata, the server reads the column by this setting.")
+
+        table = TrackPayload._meta.db_table
+        column = TrackPayload._meta.get_field("metadata").column
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT data_type FROM information_schema.columns WHERE table_name = %s AND column_name = %s", [table, column])
+            data_type = cursor.fetchone()[0]
+        target = "text" if options["revert"] else "jsonb"
+        quote = connection.ops.quote_name
+        if data_type == target:
+            print(f"The metadata is already stored as {target}.")
+        else:
+            if not options["revert"]:
+                self.repair(table, column)
+
+            print(f"Converting the metadata from {data_type} into {target}.")
+            start = time.monotonic()
+            with connection.cursor() as cursor:
+                # The GIN index can't be kept on a text column.
+                cursor.execute(f"DROP INDEX IF EXISTS {quote(GIN_INDEX)}")
+                cursor.execute(f"ALTER TABLE {quote(table)} ALTER COLUMN {quote(column)} TYPE {target} USING {quote(column)}::{target}")
+            print(f"Finished in {time.monotonic() - start:.1f}s.")
+
+        if target == "jsonb":
+            print("Creating the GIN index of the metadata.")
+            start = time.monotonic()
+            with connection.cursor() as cursor:
+                cursor.execute(f"CREATE INDEX IF NOT EXISTS {quote(GIN_INDEX)} ON {quote(table)} USING gin ({quote(column)})")
+            print(f"Finished in {time.monotonic() - start:.1f}s.")
+
+    def repair(self, table: str, column: str):
+        """
+        Serialize the metadata that jsonb doesn't accept again, as standard JSON.
+        """
+        quote = connection.ops.quote_name
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"SELECT track_id FROM {quote(table)} WHERE {quote(column)} LIKE %s OR {quote(column)} ~ %s",
+                # The backslash escapes itself in LIKE patterns.
+                ["%\\\\x%", r"NaN|Infinity|\\u0000"],
+            )
+            pks = [row[0] for row in cursor.fetchall()]
+        if not pks:
+            return
+        print(f"Repairing the metadata of {len(pks)} tracks.")
+        for offset in range(0, len(pks), CHUNK_SIZE):
+            with transaction.atomic():
+                payloads = []
+                for pk, metadata in TrackPayload.objects.filter(pk__in=pks[offset:offset + CHUNK_SIZE]).values_list("pk", "metadata"):
+                    text = json.dumps(strict_json(load_json(metadata)), cls=DjangoJSONEncoder, allow_nan=False)
+                    payloads.append((text, pk))
+                with connection.cursor() as cursor:
+                    cursor.executemany(f"UPDATE {quote(table)} SET {quote(column)} = %s WHERE track_id = %s", payloads)
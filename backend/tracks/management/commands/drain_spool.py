@@ -0,0 +1,122 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import DatabaseError, InterfaceError, OperationalError
+from monitoring import instrumentation
+from tracks import spool
+from tracks.ingest import build_track, insert_tracks, read_track_files
+from tracks.validation import validate_track
+
+
+class Command(BaseCommand):
+    """
+    This command is executed by the worker in the spool ingest mode.
+
+    The command takes the uploads from the ingest spool, validates them, and inserts the tracks in batches.
+    """
+
+    help = """Inserts the spooled track uploads into the database."""
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=100, help="The maximum number of tracks that are inserted at once.")
+        parser.add_argument("--interval", type=float, default=1, help="The interval in seconds to check for new uploads when the spool is empty.")
+        parser.add_argument("--once", action="store_true", help="Exit once the spool is empty.")
+
+    def handle(self, *args, **options):
+        batch_size = options["batch_size"]
+        interval = options["interval"]
+        # The decompression times and file sizes of the spooled uploads are part of the request metrics of the worker.
+        instrumentation.enable()
+
+        recovered = spool.recover()
+        if recovered:
+            print(f"Recovered {recovered} uploads that were being processed before a restart.")
+
+        state = spool.read_state()
+        state.setdefault("drained_total", 0)
+        state.setdefault("inserted_total", 0)
+        state.setdefault("rejected_total", 0)
+        state.setdefault("failed_total", 0)
+
+        while True:
+            paths = spool.claim(batch_size)
+            if not paths:
+                state["drain_rate"] = 0
+                spool.write_state(state)
+                if options["once"]:
+                    break
+                time.sleep(interval)
+                continue
+
+            start = time.time()
+            batch = []
+            rejected = []
+            for path in paths:
+                try:
+                    tar, files = spool.open_upload(path)
+                    with tar:
+                        metadata, gps_gz, sensor_csvs, sensor_streams = read_track_files(files)
+                    track = build_track(metadata, gps_gz, sensor_csvs)
+                    err = validate_track(track)
+                except Exception as e:
+                    print(f"Failed to read spooled upload {path}: {e}")
+                    spool.fail(path)
+                    state["failed_total"] += 1
+                    continue
+                if err:
+                    print(f"Track with id {track.session_id} won't be inserted into the DB: {err}")
+                    rejected.append(path)
+                    continue
+                batch.append((track, sensor_streams, path))
+
+            try:
+                try:
+                    inserted = insert_tracks([(track, sensor_streams) for track, sensor_streams, _ in batch])
+                except (OperationalError, InterfaceError):
+                    raise
+                except DatabaseError as e:
+                    # A track breaks a constraint of the database, so the tracks are inserted one by one to find it.
+                    print(f"Failed to insert {len(batch)} spooled tracks, inserting them one by one: {e}")
+                    inserted, batch = self.insert_one_by_one(batch, state)
+            except (OperationalError, InterfaceError) as e:
+                # Keep the uploads and try again later, e.g. when the database is unavailable.
+                # Inserting is idempotent, so the tracks that were inserted already are skipped.
+                print(f"Failed to insert {len(batch)} spooled tracks: {e}")
+                spool.recover()
+                time.sleep(interval)
+                continue
+
+            for path in rejected + [path for _, _, path in batch]:
+                spool.complete(path)
+
+            elapsed = time.time() - start
+            state["drained_total"] += len(batch) + len(rejected)
+            state["inserted_total"] += inserted
+            state["rejected_total"] += len(rejected)
+            state["last_batch_size"] = len(paths)
+            state["last_batch_seconds"] = elapsed
+            state["drain_rate"] = len(paths) / elapsed if elapsed > 0 else 0
+            state["timestamp"] = int(time.time())
+            spool.write_state(state)
+            print(f"Inserted {inserted} of {len(paths)} spooled tracks in {elapsed:.2f}s.")
+
+    def insert_one_by_one(self, batch: list, state: dict):
+        """
+        Insert the tracks of a batch one at a time and move the uploads whose track can't be inserted into the failed directory.
+
+        Returns the number of inserted tracks and the remaining batch. Raises OperationalError and InterfaceError, e.g. if the database becomes unavailable.
+        """
+        inserted = 0
+        remaining = []
+        for track, sensor_streams, path in batch:
+            try:
+                inserted += insert_tracks([(track, sensor_streams)])
+            except (OperationalError, InterfaceError):
+                raise
+            except DatabaseError as e:
+                print(f"Failed to insert the spooled track {track.session_id}: {e}")
+                spool.fail(path)
+                state["failed_total"] += 1
+                continue
+            remaining.append((track, sensor_streams, path))
+        return inserted, remaining
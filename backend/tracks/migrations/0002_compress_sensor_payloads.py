@@ -0,0 +1,91 @@
+from django.db import migrations, transaction
+import tracks.fields
+
+PAYLOAD_FIELDS = ['gps_csv', 'accelerometer_csv', 'gyroscope_csv', 'magnetometer_csv']
+
+# The number of tracks that are compressed per transaction.
+CHUNK_SIZE = 100
+
+
+def report_size(label, columns):
+    def report(apps, schema_editor):
+        if schema_editor.connection.vendor != 'postgresql':
+            return
+        column_sizes = ' + '.join(f'COALESCE(SUM(pg_column_size({column})), 0)' for column in columns)
+        with schema_editor.connection.cursor() as cursor:
+            cursor.execute(f"SELECT pg_size_pretty(({column_sizes})::bigint) FROM tracks_track")
+            payload_size = cursor.fetchone()[0]
+            cursor.execute("SELECT pg_size_pretty(pg_total_relation_size('tracks_track'))")
+            table_size = cursor.fetchone()[0]
+        print(f"\n  Sensor payloads {label}: {payload_size}, table size incl. TOAST: {table_size}")
+        if label == 'after':
+            print("  Run VACUUM FULL tracks_track to return the space of the removed columns to the OS.")
+    return report
+
+
+def copy_payloads(source_suffix, target_suffix):
+    """
+    Copy the payloads between the plain and the compressed columns in chunks.
+    """
+    def copy(apps, schema_editor):
+        Track = apps.get_model('tracks', 'Track')
+        n_tracks = Track.objects.count()
+        n_done = 0
+        last_pk = None
+        while True:
+            qs = Track.objects.order_by('pk')
+            if last_pk is not None:
+                qs = qs.filter(pk__gt=last_pk)
+            pks = list(qs.values_list('pk', flat=True)[:CHUNK_SIZE])
+            if not pks:
+                break
+            with transaction.atomic():
+                tracks = list(Track.objects.filter(pk__in=pks).only('pk', *[f'{field}{source_suffix}' for field in PAYLOAD_FIELDS]))
+                for track in tracks:
+                    for field in PAYLOAD_FIELDS:
+                        # The compressed field compresses the text when it is written
+                        # and decompresses it when it is read.
+                        setattr(track, f'{field}{target_suffix}', getattr(track, f'{field}{source_suffix}'))
+                Track.objects.bulk_update(tracks, [f'{field}{target_suffix}' for field in PAYLOAD_FIELDS])
+            last_pk = pks[-1]
+            n_done += len(pks)
+            print(f"\n  Copied sensor payloads of {n_done}/{n_tracks} tracks", end='')
+    return copy
+
+
+class Migration(migrations.Migration):
+
+    # Every chunk is committed separately, so that large tables aren't rewritten in one transaction.
+    atomic = False
+
+    dependencies = [
+        ('tracks', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.RunPython(report_size('before', PAYLOAD_FIELDS), migrations.RunPython.noop),
+    ] + [
+        migrations.AddField(
+            model_name='track',
+            name=f'{field}_gz',
+            field=tracks.fields.CompressedTextField(blank=True, null=True),
+        )
+        for field in PAYLOAD_FIELDS
+    ] + [
+        migrations.RunPython(copy_payloads('', '_gz'), copy_payloads('_gz', '')),
+    ] + [
+        migrations.RemoveField(
+            model_name='track',
+            name=field,
+        )
+        for field in PAYLOAD_FIELDS
+    ] + [
+        migrations.RenameField(
+            model_name='track',
+            old_name=f'{field}_gz',
+            new_name=field,
+        )
+        for field in PAYLOAD_FIELDS
+    ] + [
+        migrations.RunPython(report_size('after', PAYLOAD_FIELDS), migrations.RunPython.noop),
+    ]
@@ -0,0 +1,92 @@
+# Generated by Django 4.2.30 on 2026-10-18 10:32
+
+from django.db import migrations, models, transaction
+import django.db.models.deletion
+
+from tracks.sensors import (SENSORS, SensorFormatError, decode_sensor_data,
+                            encode_sensor_data, parse_sensor_csv,
+                            sensor_data_to_csv)
+
+# The number of tracks that are converted per transaction.
+CHUNK_SIZE = 100
+
+
+def iter_track_chunks(Track, fields):
+    last_pk = None
+    while True:
+        qs = Track.objects.order_by('pk')
+        if last_pk is not None:
+            qs = qs.filter(pk__gt=last_pk)
+        pks = list(qs.values_list('pk', flat=True)[:CHUNK_SIZE])
+        if not pks:
+            break
+        yield list(Track.objects.filter(pk__in=pks).only('pk', *fields))
+        last_pk = pks[-1]
+
+
+def convert_csvs_to_streams(apps, schema_editor):
+    Track = apps.get_model('tracks', 'Track')
+    SensorStream = apps.get_model('tracks', 'SensorStream')
+    csv_fields = [f'{sensor}_csv' for sensor in SENSORS]
+    n_converted = 0
+    n_kept = 0
+    for tracks in iter_track_chunks(Track, csv_fields):
+        with transaction.atomic():
+            streams = []
+            for track in tracks:
+                for sensor in SENSORS:
+                    csv = getattr(track, f'{sensor}_csv')
+                    if csv is None:
+                        continue
+                    try:
+                        data = parse_sensor_csv([csv])
+                    except SensorFormatError:
+                        # Keep the CSV if it can't be converted.
+                        n_kept += 1
+                        continue
+                    streams.append(SensorStream(track=track, sensor=sensor, n_samples=len(data.timestamp), data=encode_sensor_data(data)))
+                    setattr(track, f'{sensor}_csv', None)
+                    n_converted += 1
+            SensorStream.objects.bulk_create(streams)
+            Track.objects.bulk_update(tracks, csv_fields)
+        print(f"\n  Converted {n_converted} sensor CSVs into streams, kept {n_kept} CSVs", end='')
+
+
+def convert_streams_to_csvs(apps, schema_editor):
+    Track = apps.get_model('tracks', 'Track')
+    SensorStream = apps.get_model('tracks', 'SensorStream')
+    csv_fields = [f'{sensor}_csv' for sensor in SENSORS]
+    for tracks in iter_track_chunks(Track, csv_fields):
+        with transaction.atomic():
+            for stream in SensorStream.objects.filter(track__in=tracks):
+                track = next(track for track in tracks if track.pk == stream.track_id)
+                setattr(track, f'{stream.sensor}_csv', sensor_data_to_csv(decode_sensor_data(stream.data)))
+            Track.objects.bulk_update(tracks, csv_fields)
+
+
+class Migration(migrations.Migration):
+
+    # Every chunk is committed separately, so that large tables aren't rewritten in one transaction.
+    atomic = False
+
+    dependencies = [
+        ('tracks', '0002_compress_sensor_payloads'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SensorStream',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('sensor', models.CharField(choices=[('accelerometer', 'accelerometer'), ('gyroscope', 'gyroscope'), ('magnetometer', 'magnetometer')], max_length=32)),
+                ('n_samples', models.BigIntegerField()),
+                ('data', models.BinaryField()),
+                ('track', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='sensor_streams', to='tracks.track')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='sensorstream',
+            constraint=models.UniqueConstraint(fields=('track', 'sensor'), name='unique_sensor_stream_per_track'),
+        ),
+        migrations.RunPython(convert_csvs_to_streams, convert_streams_to_csvs),
+    ]
@@ -0,0 +1,100 @@
+from django.db import migrations, models, transaction
+import django.db.models.deletion
+import tracks.fields
+
+PAYLOAD_FIELDS = ['metadata', 'gps_csv', 'accelerometer_csv', 'gyroscope_csv', 'magnetometer_csv']
+
+# The number of tracks whose payloads are moved per transaction.
+CHUNK_SIZE = 1000
+
+
+def iter_pk_chunks(Track):
+    last_pk = None
+    while True:
+        qs = Track.objects.order_by('pk')
+        if last_pk is not None:
+            qs = qs.filter(pk__gt=last_pk)
+        pks = list(qs.values_list('pk', flat=True)[:CHUNK_SIZE])
+        if not pks:
+            break
+        yield pks
+        last_pk = pks[-1]
+
+
+def move_payloads(apps, schema_editor):
+    """
+    Copy the raw data of the tracks into the payload table.
+
+    The columns are copied in SQL, so the payloads are neither parsed nor decompressed.
+    """
+    Track = apps.get_model('tracks', 'Track')
+    TrackPayload = apps.get_model('tracks', 'TrackPayload')
+    quote = schema_editor.quote_name
+    columns = ', '.join(quote(field) for field in PAYLOAD_FIELDS)
+    n_tracks = Track.objects.count()
+    n_done = 0
+    for pks in iter_pk_chunks(Track):
+        with transaction.atomic(), schema_editor.connection.cursor() as cursor:
+            cursor.execute(
+                f"INSERT INTO {quote(TrackPayload._meta.db_table)} ({quote('track_id')}, {columns}) "
+                f"SELECT {quote('session_id')}, {columns} FROM {quote(Track._meta.db_table)} "
+                f"WHERE {quote('session_id')} >= %s AND {quote('session_id')} <= %s",
+                [pks[0], pks[-1]],
+            )
+        n_done += len(pks)
+        print(f"\n  Moved payloads of {n_done}/{n_tracks} tracks", end='')
+
+
+def restore_payloads(apps, schema_editor):
+    Track = apps.get_model('tracks', 'Track')
+    TrackPayload = apps.get_model('tracks', 'TrackPayload')
+    quote = schema_editor.quote_name
+    track_table = quote(Track._meta.db_table)
+    payload_table = quote(TrackPayload._meta.db_table)
+    assignments = ', '.join(
+        f"{quote(field)} = (SELECT {quote(field)} FROM {payload_table} WHERE {payload_table}.{quote('track_id')} = {track_table}.{quote('session_id')})"
+        for field in PAYLOAD_FIELDS
+    )
+    for pks in iter_pk_chunks(Track):
+        with transaction.atomic(), schema_editor.connection.cursor() as cursor:
+            cursor.execute(
+                f"UPDATE {track_table} SET {assignments} WHERE {quote('session_id')} >= %s AND {quote('session_id')} <= %s",
+                [pks[0], pks[-1]],
+            )
+
+
+class Migration(migrations.Migration):
+
+    # Every chunk is committed separately, so that large tables aren't copied in one transaction.
+    atomic = False
+
+    dependencies = [
+        ('tracks', '0003_sensor_streams'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TrackPayload',
+            fields=[
+                ('track', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='payload', serialize=False, to='tracks.track')),
+                ('metadata', tracks.fields.JSONField()),
+                ('gps_csv', tracks.fields.CompressedTextField(blank=True, null=True)),
+                ('accelerometer_csv', tracks.fields.CompressedTextField(blank=True, null=True)),
+                ('gyroscope_csv', tracks.fields.CompressedTextField(blank=True, null=True)),
+                ('magnetometer_csv', tracks.fields.CompressedTextField(blank=True, null=True)),
+            ],
+        ),
+        # The metadata column is nullable while the payloads are moved, so that it can be added back when the migration is reversed.
+        migrations.AlterField(
+            model_name='track',
+            name='metadata',
+            field=tracks.fields.JSONField(null=True),
+        ),
+        migrations.RunPython(move_payloads, restore_payloads),
+    ] + [
+        migrations.RemoveField(
+            model_name='track',
+            name=field,
+        )
+        for field in PAYLOAD_FIELDS
+    ]
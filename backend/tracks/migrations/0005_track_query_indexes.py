@@ -0,0 +1,57 @@
+# Generated by Django 4.2.30 on 2026-10-18 11:51
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tracks', '0004_track_payloads'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='track',
+            index=models.Index(condition=models.Q(('debug', False)), fields=['session_id'], name='track_list_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='track',
+            index=models.Index(condition=models.Q(('debug', False)), fields=['start_time', 'end_time'], name='track_list_time_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='track',
+            index=models.Index(condition=models.Q(('debug', False)), fields=['backend', 'positioning_mode', 'session_id'], name='track_list_backend_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='track',
+            index=models.Index(condition=models.Q(('debug', False)), fields=['positioning_mode', 'session_id'], name='track_list_positioning_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='track',
+            index=models.Index(condition=models.Q(('debug', False)), fields=['device_type', 'session_id'], name='track_list_device_type_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='track',
+            index=models.Index(condition=models.Q(('debug', False)), fields=['user_id', 'session_id'], name='track_list_user_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='track',
+            index=models.Index(condition=models.Q(('debug', True)), fields=['user_id'], name='track_debug_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='track',
+            index=models.Index(fields=['debug', 'device_type', 'bike_type', 'preference_type', 'activity_type'], name='track_metrics_types_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='track',
+            index=models.Index(condition=models.Q(('has_battery_data', None)), fields=['session_id'], name='track_battery_pending_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='track',
+            index=models.Index(condition=models.Q(('avg_battery_consumption', None), ('has_battery_data', True)), fields=['session_id'], name='track_battery_no_avg_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='track',
+            index=models.Index(fields=['date'], name='track_date_idx'),
+        ),
+    ]
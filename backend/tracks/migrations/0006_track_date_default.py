@@ -0,0 +1,19 @@
+# Generated by Django 4.2.30 on 2026-10-18 12:28
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tracks', '0005_track_query_indexes'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='track',
+            name='date',
+            field=models.DateTimeField(default=django.utils.timezone.now, editable=False),
+        ),
+    ]
@@ -0,0 +1,50 @@
+# Generated by Django 4.2.30 on 2026-10-18 14:53
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tracks', '0006_track_date_default'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='track',
+            name='app_version',
+            field=models.CharField(blank=True, max_length=255, null=True),
+        ),
+        migrations.AddField(
+            model_name='track',
+            name='attributes_version',
+            field=models.PositiveSmallIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='track',
+            name='build_number',
+            field=models.CharField(blank=True, max_length=255, null=True),
+        ),
+        migrations.AddField(
+            model_name='track',
+            name='is_dark_mode',
+            field=models.BooleanField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='track',
+            name='save_battery_mode_enabled',
+            field=models.BooleanField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='track',
+            index=models.Index(condition=models.Q(('debug', False)), fields=['app_version', 'session_id'], name='track_list_app_version_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='track',
+            index=models.Index(condition=models.Q(('debug', False)), fields=['build_number', 'session_id'], name='track_list_build_number_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='track',
+            index=models.Index(fields=['attributes_version'], name='track_attributes_version_idx'),
+        ),
+    ]
@@ -1,6 +1,24 @@
 from django.contrib import admin
 from django.db import models
-from tracks.fields import JSONField
+from django.utils import timezone
+from tracks.fields import CompressedTextField, JSONField
+from tracks.sensors import (SENSORS, SensorData, decode_sensor_data,
+                            parse_sensor_csv, sensor_data_to_csv)
+
+
+def payload_property(name: str) -> property:
+    """
+    Create a property that reads and writes a field of the payload of a track.
+    """
+    def get(track):
+        payload = track.get_payload()
+        return getattr(payload, name) if payload is not None else None
+
+    def set(track, value):
+        setattr(track.get_payload(create=True), name, value)
+        track._payload_changed = True
+
+    return property(get, set)
 
 
 class Track(models.Model):
@@ -41,7 +59,8 @@ class Track(models.Model):
     device_type = models.CharField(max_length=255, default='unknown')
 
     # The date the track was received.
-    date = models.DateTimeField(auto_now_add=True)
+    # A default instead of auto_now_add, so that the date of the worker is kept when tracks are synced in bulk.
+    date = models.DateTimeField(default=timezone.now, editable=False)
 
     # The bike type that was used to create the track.
     bike_type = models.CharField(max_length=255, default='unknown')
@@ -58,22 +77,80 @@ class Track(models.Model):
     # The average battery consumption of the track.
     avg_battery_consumption = models.FloatField(blank=True, null=True)
 
-    ####### Fields that contain raw data. #######
+    # Attributes of the metadata, see tracks.attributes. Null if the metadata doesn't contain them.
+    app_version = models.CharField(max_length=255, blank=True, null=True)
+    build_number = models.CharField(max_length=255, blank=True, null=True)
+    is_dark_mode = models.BooleanField(blank=True, null=True)
+    save_battery_mode_enabled = models.BooleanField(blank=True, null=True)
+
+    # The version of the attributes that were extracted, null if they haven't been extracted yet.
+    attributes_version = models.PositiveSmallIntegerField(blank=True, null=True)
+
+    ####### Fields that contain raw data, stored in the TrackPayload. #######
 
     # The plain json data of the track.
-    metadata = JSONField()
+    metadata = payload_property("metadata")
 
     # The CSV file containing the GPS data.
-    gps_csv = models.TextField(null=True, blank=True)
+    gps_csv = payload_property("gps_csv")
+
+    # The CSV files containing the inertial sensor data.
+    # Only set if the data couldn't be converted into a SensorStream at ingest.
+    accelerometer_csv = payload_property("accelerometer_csv")
+    gyroscope_csv = payload_property("gyroscope_csv")
+    magnetometer_csv = payload_property("magnetometer_csv")
+
+    def get_payload(self, create: bool = False):
+        """
+        Get the raw data of the track, or None if the track has no payload.
 
-    # The CSV file containing the accelerometer data.
-    accelerometer_csv = models.TextField(null=True, blank=True)
+        The payload is loaded with an extra query on first access, unless it was
+        selected with `select_related("payload")`. If `create` is set, a missing
+        payload is created, it is saved together with the track.
+        """
+        if not self._state.adding or Track.payload.related.is_cached(self):
+            try:
+                return self.payload
+            except TrackPayload.DoesNotExist:
+                pass
+        if not create:
+            return None
+        return TrackPayload(track=self)
 
-    # The CSV file containing the gyroscope data.
-    gyroscope_csv = models.TextField(null=True, blank=True)
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        # Only write the payload if it was changed, since it is much larger than the track.
+        if getattr(self, "_payload_changed", False):
+            payload = self.get_payload()
+            payload.track = self
+            payload.save()
+            self._payload_changed = False
 
-    # The CSV file containing the magnetometer data.
-    magnetometer_csv = models.TextField(null=True, blank=True)
+    def get_sensor_data(self, sensor: str) -> SensorData:
+        """
+        Get the samples of an inertial sensor as NumPy arrays.
+
+        Tracks whose sensor CSV couldn't be converted into a stream keep the CSV, which is parsed here.
+        """
+        for stream in self.sensor_streams.all():
+            if stream.sensor == sensor:
+                return decode_sensor_data(stream.data)
+        csv = getattr(self, f"{sensor}_csv")
+        if csv is None:
+            return None
+        return parse_sensor_csv([csv])
+
+    def get_sensor_csv(self, sensor: str) -> str:
+        """
+        Get the data of an inertial sensor in the CSV format that was uploaded by the app.
+        """
+        csv = getattr(self, f"{sensor}_csv")
+        if csv is not None:
+            return csv
+        for stream in self.sensor_streams.all():
+            if stream.sensor == sensor:
+                return sensor_data_to_csv(decode_sensor_data(stream.data))
+        return None
 
     def __str__(self):
         output = ""
@@ -85,6 +162,90 @@ class Track(models.Model):
 
     class Meta:
         ordering = ['-date']
+        # The indexes follow the queries of the list endpoint and the metrics, see the benchmark_queries command.
+        # The list endpoint only returns non debug tracks, so its indexes are partial and end with the pk it is ordered by.
+        indexes = [
+            models.Index(fields=['session_id'], condition=models.Q(debug=False), name='track_list_idx'),
+            models.Index(fields=['start_time', 'end_time'], condition=models.Q(debug=False), name='track_list_time_idx'),
+            models.Index(fields=['backend', 'positioning_mode', 'session_id'], condition=models.Q(debug=False), name='track_list_backend_idx'),
+            models.Index(fields=['positioning_mode', 'session_id'], condition=models.Q(debug=False), name='track_list_positioning_idx'),
+            models.Index(fields=['device_type', 'session_id'], condition=models.Q(debug=False), name='track_list_device_type_idx'),
+            models.Index(fields=['user_id', 'session_id'], condition=models.Q(debug=False), name='track_list_user_id_idx'),
+            models.Index(fields=['app_version', 'session_id'], condition=models.Q(debug=False), name='track_list_app_version_idx'),
+            models.Index(fields=['build_number', 'session_id'], condition=models.Q(debug=False), name='track_list_build_number_idx'),
+            # Debug tracks are few, the metrics on them read them through this index.
+            models.Index(fields=['user_id'], condition=models.Q(debug=True), name='track_debug_idx'),
+            # Covers the group-bys of the metrics, which are answered from the index only.
+            models.Index(fields=['debug', 'device_type', 'bike_type', 'preference_type', 'activity_type'], name='track_metrics_types_idx'),
+            # The tracks that the battery analysis of the metrics still has to process, usually none.
+            models.Index(fields=['session_id'], condition=models.Q(has_battery_data=None), name='track_battery_pending_idx'),
+            models.Index(fields=['session_id'], condition=models.Q(has_battery_data=True, avg_battery_consumption=None), name='track_battery_no_avg_idx'),
+            # The tracks whose attributes the backfill still has to extract, usually none.
+            models.Index(fields=['attributes_version'], name='track_attributes_version_idx'),
+            # The admin orders the tracks by date.
+            models.Index(fields=['date'], name='track_date_idx'),
+        ]
+
+
+class TrackPayload(models.Model):
+    """
+    The raw data of a track.
+
+    The raw data is kept out of the track table, so that queries on the
+    tracks don't read it. It is loaded on demand through the track.
+    """
+
+    # The track that the raw data belongs to, i.e. the session id.
+    track = models.OneToOneField(Track, on_delete=models.CASCADE, primary_key=True, related_name='payload')
+
+    # The plain json data of the track.
+    metadata = JSONField()
+
+    # The CSV file containing the GPS data, stored gzip compressed.
+    gps_csv = CompressedTextField(null=True, blank=True)
+
+    # The CSV file containing the accelerometer data, stored gzip compressed.
+    # Only set if the data couldn't be converted into a SensorStream at ingest.
+    accelerometer_csv = CompressedTextField(null=True, blank=True)
+
+    # The CSV file containing the gyroscope data, stored gzip compressed.
+    # Only set if the data couldn't be converted into a SensorStream at ingest.
+    gyroscope_csv = CompressedTextField(null=True, blank=True)
+
+    # The CSV file containing the magnetometer data, stored gzip compressed.
+    # Only set if the data couldn't be converted into a SensorStream at ingest.
+    magnetometer_csv = CompressedTextField(null=True, blank=True)
+
+    def __str__(self):
+        return f"Payload of {self.track_id}"
+
+
+class SensorStream(models.Model):
+    """
+    The samples of an inertial sensor of a track, stored as packed columns.
+
+    See tracks.sensors for the layout of the stored data.
+    """
+
+    # The track that the samples belong to, i.e. the session id.
+    track = models.ForeignKey(Track, on_delete=models.CASCADE, related_name='sensor_streams')
+
+    # The sensor that recorded the samples.
+    sensor = models.CharField(max_length=32, choices=[(sensor, sensor) for sensor in SENSORS])
+
+    # The number of samples in the stream.
+    n_samples = models.BigIntegerField()
+
+    # The encoded samples.
+    data = models.BinaryField()
+
+    def __str__(self):
+        return f"{self.sensor} ({self.n_samples} samples) of {self.track_id}"
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['track', 'sensor'], name='unique_sensor_stream_per_track'),
+        ]
 
 
 class TracksAdmin(admin.ModelAdmin):
@@ -97,12 +258,14 @@ class TracksAdmin(admin.ModelAdmin):
         'user_id',
         'session_id',
         'device_type',
+        'app_version',
+        'build_number',
         'date',
         'metadata',
         'gps_csv',
-        'accelerometer_csv',
-        'gyroscope_csv',
-        'magnetometer_csv',
+        'accelerometer',
+        'gyroscope',
+        'magnetometer',
     )
     readonly_fields = (
         'start_time',
@@ -113,10 +276,21 @@ class TracksAdmin(admin.ModelAdmin):
         'user_id',
         'session_id',
         'device_type',
+        'app_version',
+        'build_number',
         'date',
         'metadata',
         'gps_csv',
-        'accelerometer_csv',
-        'gyroscope_csv',
-        'magnetometer_csv',
+        'accelerometer',
+        'gyroscope',
+        'magnetometer',
     )
+
+    def accelerometer(self, track):
+        return track.get_sensor_csv('accelerometer')
+
+    def gyroscope(self, track):
+        return track.get_sensor_csv('gyroscope')
+
+    def magnetometer(self, track):
+        return track.get_sensor_csv('magnetometer')
@@ -0,0 +1,75 @@
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import connections
+
+_executor = None
+
+
+def get_executor() -> ThreadPoolExecutor:
+    """
+    Return the thread pool for CPU-heavy work of the async views, created on first use.
+
+    The pool is bounded, such that a burst of uploads can't start more
+    decompressions at once than OFFLOAD_THREADS.
+    """
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=settings.OFFLOAD_THREADS, thread_name_prefix="offload")
+    return _executor
+
+
+def _run_without_connections(func):
+    """
+    Run a function in a thread of the pool and close the database connections that it opened.
+
+    Django only closes the connections of the request threads, so a connection
+    that was opened by mistake in the pool would otherwise stay open with its thread.
+    """
+    try:
+        return func()
+    finally:
+        connections.close_all()
+
+
+async def offload(func, *args, **kwargs):
+    """
+    Run a function in the thread pool and wait for its result without blocking the event loop.
+
+    The function must not access the database, use sync_to_async for that.
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_executor(), _run_without_connections, functools.partial(func, *args, **kwargs))
+
+
+async def offload_iter(iterator):
+    """
+    Consume a sync iterator in the thread pool, e.g. the body of a streaming response.
+
+    The iterator must not access the database either.
+    """
+    iterator = iter(iterator)
+    done = object()
+    while True:
+        item = await offload(next, iterator, done)
+        if item is done:
+            return
+        yield item
+
+
+async def sync_iter(iterator):
+    """
+    Consume a sync iterator that reads from the database, e.g. a queryset iterator.
+
+    Every step runs in the thread of sync_to_async, which owns the database connection.
+    """
+    iterator = iter(iterator)
+    done = object()
+    while True:
+        item = await sync_to_async(next)(iterator, done)
+        if item is done:
+            return
+        yield item
@@ -0,0 +1,223 @@
+import struct
+import warnings
+import zlib
+from collections import namedtuple
+from typing import Iterable, Iterator
+
+import numpy as np
+
+# The inertial sensors that are stored as columnar streams.
+SENSORS = ("accelerometer", "gyroscope", "magnetometer")
+
+# The header of the CSV files that are uploaded for every sensor.
+CSV_HEADER = "timestamp,x,y,z"
+
+# Layout of an encoded stream (little endian):
+#   magic (8 bytes), number of samples (uint64),
+#   then the timestamp, x, y and z columns, each as:
+#   decimal scale (int8), size of the compressed column (uint64), the compressed column.
+# Every column is stored as int64 values: the timestamps as they are, a value column
+# as its values times 10 ** scale if that restores every value exactly, or else
+# as the bits of the float64 values (scale -1). The int64 values are delta encoded,
+# zigzag encoded (0, -1, 1, -2, ... become 0, 1, 2, 3, ...), byte shuffled (all first
+# bytes, then all second bytes, ...) and zlib compressed, such that the high bytes
+# of the small deltas of the sensor values are zeros that compress well.
+# Streams of the first two versions have uncompressed float32 (version 1) or
+# float64 (version 2) value columns, they are still read but no longer written.
+MAGIC = b"PBIMU\x00\x00\x03"
+MAGIC_FLOAT64 = b"PBIMU\x00\x00\x02"
+MAGIC_FLOAT32 = b"PBIMU\x00\x00\x01"
+HEADER = struct.Struct("<8sQ")
+COLUMN_HEADER = struct.Struct("<bQ")
+# The header of the streams of the first two versions, with the first timestamp and the size of the compressed timestamp deltas.
+HEADER_V2 = struct.Struct("<8sQqQ")
+
+# The largest decimal scale of the value columns, i.e. the number of decimal places.
+MAX_SCALE = 12
+# The scale of value columns that are stored as the bits of their float64 values.
+FLOAT_BITS = -1
+
+# The samples of a sensor stream as NumPy arrays.
+SensorData = namedtuple("SensorData", ["timestamp", "x", "y", "z"])
+
+
+class SensorFormatError(ValueError):
+    """
+    Raised when sensor data doesn't have the expected `timestamp,x,y,z` layout.
+    """
+    pass
+
+
+def parse_sensor_csv(chunks: Iterable[str]) -> SensorData:
+    """
+    Parse a `timestamp,x,y,z` CSV from an iterable of text chunks.
+
+    The chunks are parsed one after another, so the CSV is never held in memory as a whole.
+    """
+    columns = []
+    remainder = ""
+    header = None
+    for chunk in chunks:
+        text = remainder + chunk
+        end = text.rfind("\n")
+        if end < 0:
+            remainder = text
+            continue
+        remainder = text[end + 1:]
+        text = text[:end]
+        if header is None:
+            header, _, text = text.partition("\n")
+            _check_header(header)
+        columns.append(_parse_lines(text))
+    if header is None:
+        header, _, remainder = remainder.partition("\n")
+        _check_header(header)
+    columns.append(_parse_lines(remainder))
+
+    values = np.concatenate(columns)
+    timestamps = values[0::4]
+    if not np.array_equal(timestamps, np.floor(timestamps)):
+        raise SensorFormatError("Sensor timestamps are not integers.")
+    return SensorData(
+        timestamp=timestamps.astype(np.int64),
+        x=values[1::4],
+        y=values[2::4],
+        z=values[3::4],
+    )
+
+
+def _check_header(header: str):
+    if header.strip().replace(" ", "") != CSV_HEADER:
+        raise SensorFormatError(f"Unexpected sensor CSV header: {header[:100]}")
+
+
+def _parse_lines(text: str) -> np.ndarray:
+    lines = [line for line in text.replace("\r", "").split("\n") if line.strip()]
+    if not lines:
+        return np.empty(0, dtype=np.float64)
+    # The values of all rows are parsed at once, so a short row next to a long one would shift the columns.
+    for line in lines:
+        if line.count(",") != 3:
+            raise SensorFormatError(f"Sensor CSV contains a row that is not `timestamp,x,y,z`: {line[:100]}")
+    with warnings.catch_warnings():
+        # NumPy warns (and will raise in the future) if the text contains something else than numbers.
+        warnings.simplefilter("ignore", DeprecationWarning)
+        try:
+            values = np.fromstring(",".join(lines), dtype=np.float64, sep=",")
+        except ValueError:
+            raise SensorFormatError("Sensor CSV contains values that are not numbers.")
+    if len(values) != 4 * len(lines):
+        raise SensorFormatError("Sensor CSV contains rows that are not `timestamp,x,y,z` numbers.")
+    return values
+
+
+def encode_sensor_data(data: SensorData) -> bytes:
+    """
+    Encode the samples of a sensor into the columnar stream layout.
+    """
+    n_samples = len(data.timestamp)
+    columns = [_encode_column(0, np.asarray(data.timestamp, dtype=np.int64))]
+    for values in (data.x, data.y, data.z):
+        columns.append(_encode_column(*_scale_values(np.asarray(values, dtype=np.float64))))
+    return b"".join([HEADER.pack(MAGIC, n_samples), *columns])
+
+
+def _scale_values(values: np.ndarray):
+    """
+    Find the smallest decimal scale that restores all values exactly, e.g. 6 for values with 6 decimal places.
+
+    Returns the scale and the int64 values, or FLOAT_BITS and the bits of the values if there is none.
+    """
+    bits = values.view(np.int64)
+    # Larger integers than 2 ** 53 can't be restored from float64 values.
+    limit = np.abs(values).max(initial=0) if np.isfinite(values).all() else np.inf
+    for scale in range(MAX_SCALE + 1):
+        factor = 10.0 ** scale
+        if limit * factor >= 2 ** 53:
+            break
+        scaled = np.round(values * factor).astype(np.int64)
+        # The values are compared, so a negative zero, e.g. -0.000000 in the CSV, is restored as 0.0.
+        if np.array_equal(scaled / factor, values):
+            return scale, scaled
+    return FLOAT_BITS, bits
+
+
+def _encode_column(scale: int, ints: np.ndarray) -> bytes:
+    # The deltas wrap around like the cumulative sum that restores them.
+    deltas = np.diff(ints, prepend=np.int64(0))
+    zigzag = ((deltas << 1) ^ (deltas >> 63)).astype("<i8")
+    shuffled = zigzag.view(np.uint8).reshape(-1, 8).T.tobytes()
+    compressed = zlib.compress(shuffled, 6)
+    return COLUMN_HEADER.pack(scale, len(compressed)) + compressed
+
+
+def _decode_column(stream, offset: int, n_samples: int):
+    scale, size = COLUMN_HEADER.unpack_from(stream, offset)
+    offset += COLUMN_HEADER.size
+    shuffled = np.frombuffer(zlib.decompress(stream[offset:offset + size]), dtype=np.uint8)
+    zigzag = shuffled.reshape(8, n_samples).T.copy().view("<u8").ravel()
+    deltas = ((zigzag >> np.uint64(1)) ^ (np.uint64(0) - (zigzag & np.uint64(1)))).view(np.int64)
+    ints = np.cumsum(deltas, dtype=np.int64)
+    if scale == FLOAT_BITS:
+        values = ints.view(np.float64)
+    else:
+        values = ints / 10.0 ** scale
+    return values, ints, offset + size
+
+
+def decode_sensor_data(stream) -> SensorData:
+    """
+    Decode an encoded sensor stream (bytes or memoryview).
+    """
+    magic = bytes(stream[:8])
+    if magic in (MAGIC_FLOAT64, MAGIC_FLOAT32):
+        return _decode_uncompressed(stream)
+    if magic != MAGIC:
+        raise SensorFormatError("Not an encoded sensor stream.")
+    _, n_samples = HEADER.unpack_from(stream, 0)
+    offset = HEADER.size
+    _, timestamp, offset = _decode_column(stream, offset, n_samples)
+    x, _, offset = _decode_column(stream, offset, n_samples)
+    y, _, offset = _decode_column(stream, offset, n_samples)
+    z, _, offset = _decode_column(stream, offset, n_samples)
+    return SensorData(timestamp=timestamp, x=x, y=y, z=z)
+
+
+def _decode_uncompressed(stream) -> SensorData:
+    """
+    Decode a stream of the first two versions, whose x, y and z arrays are read-only views on the stream.
+    """
+    magic, n_samples, first_timestamp, deltas_size = HEADER_V2.unpack_from(stream, 0)
+    dtype = np.dtype("<f8") if magic == MAGIC_FLOAT64 else np.dtype("<f4")
+    offset = HEADER_V2.size
+    column_size = dtype.itemsize * n_samples
+    x = np.frombuffer(stream, dtype=dtype, count=n_samples, offset=offset)
+    y = np.frombuffer(stream, dtype=dtype, count=n_samples, offset=offset + column_size)
+    z = np.frombuffer(stream, dtype=dtype, count=n_samples, offset=offset + 2 * column_size)
+    deltas_offset = offset + 3 * column_size
+    deltas = np.frombuffer(zlib.decompress(stream[deltas_offset:deltas_offset + deltas_size]), dtype="<i8")
+    timestamp = np.cumsum(deltas) + first_timestamp
+    return SensorData(timestamp=timestamp, x=x, y=y, z=z)
+
+
+def sensor_data_to_csv(data: SensorData) -> str:
+    """
+    Render sensor samples in the `timestamp,x,y,z` CSV format of the app.
+
+    The values are printed with the shortest representation that restores the
+    parsed float64 values exactly, e.g. `0.1` is rendered as `0.1` again.
+    Streams of the first version only hold float32 values, which are printed with 9 significant digits.
+    """
+    return "".join(iter_sensor_csv(data))
+
+
+def iter_sensor_csv(data: SensorData, chunk_size: int = 10_000) -> Iterator[str]:
+    """
+    Render sensor samples like sensor_data_to_csv, in chunks of `chunk_size` rows.
+    """
+    yield CSV_HEADER
+    row_format = "{},{:.9g},{:.9g},{:.9g}" if data.x.dtype == np.float32 else "{},{!r},{!r},{!r}"
+    for start in range(0, len(data.timestamp), chunk_size):
+        end = start + chunk_size
+        rows = map(row_format.format, data.timestamp[start:end].tolist(), data.x[start:end].tolist(), data.y[start:end].tolist(), data.z[start:end].tolist())
+        yield "".join("\n" + row for row in rows)
@@ -0,0 +1,179 @@
+import hashlib
+import json
+import os
+import tarfile
+import time
+from typing import Dict, List
+
+from django.conf import settings
+
+# The spool consists of the following directories:
+# - incoming: uploads that are currently written by a request.
+# - ready: complete uploads that wait to be inserted.
+# - processing: uploads that are currently inserted by the drain_spool command.
+# - failed: uploads that couldn't be read, kept for inspection.
+INCOMING = "incoming"
+READY = "ready"
+PROCESSING = "processing"
+FAILED = "failed"
+
+# The file in which the drain_spool command keeps its counters.
+STATE_FILE = "state.json"
+
+# Incoming files older than this (in seconds) are left over from crashed requests.
+STALE_INCOMING_AGE = 60 * 60
+
+
+class SpoolConflict(Exception):
+    """
+    Raised when an upload for the same session is already spooled.
+    """
+    pass
+
+
+def spool_path(*parts) -> str:
+    return os.path.join(settings.INGEST_SPOOL_DIR, *parts)
+
+
+def ensure_spool_dirs():
+    for name in (INCOMING, READY, PROCESSING, FAILED):
+        os.makedirs(spool_path(name), exist_ok=True)
+
+
+def _fsync_dir(path: str):
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def spool_upload(session_id: str, files: Dict[str, object]):
+    """
+    Durably write the uploaded files of one session into the spool.
+
+    The files are written into a tar archive that is fsync'd before it is
+    linked into the ready directory, so that the drain_spool command never
+    sees a partially written upload. Raises SpoolConflict if the session is already spooled.
+    """
+    ensure_spool_dirs()
+    name = hashlib.sha256(session_id.encode("utf-8")).hexdigest() + ".tar"
+    if os.path.exists(spool_path(PROCESSING, name)):
+        raise SpoolConflict(f"Session {session_id} is already spooled.")
+
+    incoming_path = spool_path(INCOMING, f"{name}.{os.getpid()}.{time.time_ns()}")
+    try:
+        with open(incoming_path, "wb") as f:
+            with tarfile.open(fileobj=f, mode="w") as tar:
+                for upload_name, file in files.items():
+                    file.seek(0)
+                    info = tarfile.TarInfo(upload_name)
+                    info.size = file.size
+                    info.mtime = int(time.time())
+                    tar.addfile(info, file)
+            f.flush()
+            os.fsync(f.fileno())
+        # Linking fails if the file already exists, i.e. the session is already spooled.
+        try:
+            os.link(incoming_path, spool_path(READY, name))
+        except FileExistsError:
+            raise SpoolConflict(f"Session {session_id} is already spooled.")
+        _fsync_dir(spool_path(READY))
+    finally:
+        if os.path.exists(incoming_path):
+            os.unlink(incoming_path)
+
+
+def recover() -> int:
+    """
+    Return uploads that were claimed by a crashed drain_spool command to the ready directory.
+
+    Inserting tracks is idempotent, so half-processed uploads are simply processed again.
+    Returns the number of recovered uploads.
+    """
+    ensure_spool_dirs()
+    recovered = 0
+    for name in os.listdir(spool_path(PROCESSING)):
+        os.replace(spool_path(PROCESSING, name), spool_path(READY, name))
+        recovered += 1
+    now = time.time()
+    for name in os.listdir(spool_path(INCOMING)):
+        path = spool_path(INCOMING, name)
+        if now - os.path.getmtime(path) > STALE_INCOMING_AGE:
+            os.unlink(path)
+    if recovered:
+        _fsync_dir(spool_path(READY))
+    return recovered
+
+
+def claim(batch_size: int) -> List[str]:
+    """
+    Move up to `batch_size` of the oldest uploads into the processing directory and return their paths.
+    """
+    names = sorted(os.listdir(spool_path(READY)), key=lambda name: _mtime(spool_path(READY, name)))
+    paths = []
+    for name in names[:batch_size]:
+        try:
+            os.replace(spool_path(READY, name), spool_path(PROCESSING, name))
+        except FileNotFoundError:
+            continue
+        paths.append(spool_path(PROCESSING, name))
+    return paths
+
+
+def _mtime(path: str) -> float:
+    try:
+        return os.path.getmtime(path)
+    except FileNotFoundError:
+        return 0
+
+
+def complete(path: str):
+    """
+    Remove an upload from the spool after it was processed.
+    """
+    os.unlink(path)
+
+
+def fail(path: str):
+    """
+    Move an upload that can't be processed into the failed directory.
+    """
+    os.replace(path, spool_path(FAILED, os.path.basename(path)))
+
+
+def open_upload(path: str):
+    """
+    Open a spooled upload. Returns the tar archive and a mapping from upload names to file objects.
+    """
+    tar = tarfile.open(path, mode="r")
+    files = {member.name: tar.extractfile(member) for member in tar.getmembers() if member.isfile()}
+    return tar, files
+
+
+def depth() -> Dict[str, int]:
+    """
+    Count the uploads in the spool by their state.
+    """
+    counts = {}
+    for name in (READY, PROCESSING, FAILED):
+        try:
+            counts[name] = len(os.listdir(spool_path(name)))
+        except FileNotFoundError:
+            counts[name] = 0
+    return counts
+
+
+def read_state() -> Dict[str, float]:
+    try:
+        with open(spool_path(STATE_FILE), "r") as file:
+            return json.load(file)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+
+def write_state(state: Dict[str, float]):
+    tmp_path = spool_path(f"{STATE_FILE}.tmp")
+    with open(tmp_path, "w") as file:
+        json.dump(state, file)
+    os.replace(tmp_path, spool_path(STATE_FILE))
@@ -2,14 +2,27 @@ from django.conf import settings
 from django.urls import path
 from tracks import views
 
+# ASGI workers serve the async views, see SERVER_MODE in the settings.
+if settings.ASYNC_VIEWS:
+    PostTrackResource = views.AsyncPostTrackResource
+    ListTracksResource = views.AsyncListTracksResource
+    FetchTrackResource = views.AsyncFetchTrackResource
+    ExportTracksResource = views.AsyncExportTracksResource
+else:
+    PostTrackResource = views.PostTrackResource
+    ListTracksResource = views.ListTracksResource
+    FetchTrackResource = views.FetchTrackResource
+    ExportTracksResource = views.ExportTracksResource
+
 app_name = 'tracks'
 
 if settings.WORKER_MODE:
     urlpatterns = [
-        path("post/", views.PostTrackResource.as_view(), name="send-track"),
+        path("post/", PostTrackResource.as_view(), name="send-track"),
     ]
 else:
     urlpatterns = [
-        path("list/", views.ListTracksResource.as_view(), name="list-tracks"),
-        path("fetch/", views.FetchTrackResource.as_view(), name="fetch-track"),
+        path("list/", ListTracksResource.as_view(), name="list-tracks"),
+        path("fetch/", FetchTrackResource.as_view(), name="fetch-track"),
+        path("export/", ExportTracksResource.as_view(), name="export-tracks"),
     ]
@@ -0,0 +1,105 @@
+from io import StringIO
+from typing import Iterable, Optional, Tuple
+
+# The minimum number of GPS points a valid track must contain.
+MIN_GPS_POINTS = 6
+
+# The bounding boxes (min_lat, max_lat, min_lon, max_lon) of the cities per backend.
+BOUNDING_BOXES = {
+    # Bounding box Dresden
+    'staging': (50.8, 51.3, 13.2, 14.3),
+    # Bounds for Hamburg
+    'production': (53.1, 54.0, 9.1, 10.9),
+    # Bounds for Hamburg
+    'release': (53.1, 54.0, 9.1, 10.9),
+}
+
+
+def _parse_optional(value: str):
+    """
+    Parse an optional coordinate. Returns None if it is missing and False if it is invalid.
+    """
+    if not value.strip():
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        return False
+
+
+def validate_gps_csv(lines: Iterable[str], bounding_box: Tuple[float, float, float, float]) -> Optional[str]:
+    """
+    Scan the GPS CSV once and check it against the bounding box of the city.
+
+    The row count and the extreme coordinates are tracked while scanning,
+    and the scan stops at the first point that is out of the bounding box.
+    Returns an error message if the GPS data is invalid, otherwise None.
+    """
+    min_lat, max_lat, min_lon, max_lon = bounding_box
+
+    # The GPS data only contains numbers, so the rows are split without a CSV parser.
+    lines = iter(lines)
+    header = next(lines, "").strip()
+    if not header:
+        return "GPS data is empty."
+    columns = [column.strip() for column in header.split(",")]
+    if "latitude" not in columns or "longitude" not in columns:
+        return "GPS data has no latitude or longitude column."
+    lat_idx = columns.index("latitude")
+    lon_idx = columns.index("longitude")
+    n_columns = max(lat_idx, lon_idx) + 1
+
+    n_points = 0
+    for line in lines:
+        row = line.split(",")
+        if len(row) < n_columns:
+            # Skip blank lines, e.g. a trailing newline.
+            if not line.strip():
+                continue
+            return "GPS data contains incomplete rows."
+        n_points += 1
+        try:
+            lat = float(row[lat_idx])
+            lon = float(row[lon_idx])
+        except ValueError:
+            # Missing values are ignored, like the NaN values of a dataframe.
+            lat = _parse_optional(row[lat_idx])
+            lon = _parse_optional(row[lon_idx])
+            if lat is False or lon is False:
+                return "GPS data contains invalid coordinates."
+            if lat is None:
+                lat = min_lat
+            if lon is None:
+                lon = min_lon
+        if not (min_lat <= lat <= max_lat and min_lon <= lon <= max_lon):
+            return "Track is out of bounding box of the city."
+
+    if n_points < MIN_GPS_POINTS:
+        return "Track is too short."
+
+    return None
+
+
+def validate_track(track) -> Optional[str]:
+    """
+    Check if a track should be inserted into the database.
+
+    Returns the reason why the track is invalid, or None if the track is valid.
+    """
+    if track.debug:
+        return "Track is in debug mode."
+    # The times are required by the database and the list endpoint, booleans are no times either.
+    for name, value in (("start time", track.start_time), ("end time", track.end_time)):
+        if type(value) is not int:
+            return f"Track has no valid {name}."
+    if track.positioning_mode != "gnss":
+        return "Track is created using mock position mode."
+
+    bounding_box = BOUNDING_BOXES.get(track.backend)
+    if bounding_box is None:
+        return "Track is not from a valid backend."
+
+    if not track.gps_csv:
+        return "Track has no GPS data."
+
+    return validate_gps_csv(StringIO(track.gps_csv), bounding_box)
@@ -1,61 +1,64 @@
 import json
-import zlib
-from io import StringIO
+import math
+import uuid
 
-import pandas as pd
+from asgiref.sync import sync_to_async
+from backend.pagination import (InvalidCursor, InvalidPageParams, cursor_response,
+                                decode_cursor, get_page_params)
 from django.conf import settings
 from django.core.exceptions import ValidationError
 from django.core.paginator import Paginator
+from django.db.models import Prefetch
 from django.db.utils import IntegrityError
-from django.http import (HttpResponseBadRequest, HttpResponseServerError,
-                         JsonResponse)
+from django.http import (HttpResponse, HttpResponseBadRequest,
+                         HttpResponseServerError, JsonResponse,
+                         StreamingHttpResponse)
+from django.utils.cache import patch_vary_headers
 from django.utils.decorators import method_decorator
 from django.views.decorators.csrf import csrf_exempt
 from django.views.generic import View
-from tracks.models import Track
+from monitoring.instrumentation import stage
+from tracks.attributes import filter_attributes
+from tracks.compression import PayloadTooLarge, gunzip_text
+from tracks.ingest import (UPLOAD_FILES, build_track, read_track_files,
+                           save_track)
+from tracks.models import SensorStream, Track
+from tracks.offload import offload, offload_iter, sync_iter
+from tracks.sensors import SENSORS
+from tracks.spool import SpoolConflict, spool_upload
+from tracks.streaming import (PAYLOAD_COLUMNS, TRACK_FIELDS, InvalidFields,
+                              accepts_gzip, get_fields, iter_field_gzip,
+                              iter_multipart, iter_ndjson, iter_ndjson_export,
+                              iter_tar_export)
+from tracks.validation import validate_track
 
+# The sensor files that can be fetched compressed, by their upload name.
+SENSOR_FILES = {
+    "gps.csv.gz": "gps",
+    "accelerometer.csv.gz": "accelerometer",
+    "gyroscope.csv.gz": "gyroscope",
+    "magnetometer.csv.gz": "magnetometer",
+}
 
-def validate_track(track):
-    if track.debug:
-        return "Track is in debug mode."
-    if track.positioning_mode != "gnss":
-        return "Track is created using mock position mode."
-    
-    track_gps_data = pd.read_csv(StringIO(track.gps_csv), sep=",")
-    
-    if len(track_gps_data.index) < 6:
-        return "Track is too short."
-    
-    if track.backend == 'staging':
-        # Bounding box Dresden 
-        min_lat, max_lat = 50.8, 51.3
-        min_lon, max_lon = 13.2, 14.3
-    elif track.backend == 'production':
-        # Bounds for Hamburg
-        min_lat, max_lat = 53.1, 54.0
-        min_lon, max_lon = 9.1, 10.9
-    elif track.backend == 'release':
-        # Bounds for Hamburg
-        min_lat, max_lat = 53.1, 54.0
-        min_lon, max_lon = 9.1, 10.9
-    else:
-        return "Track is not from a valid backend."
-    
-    # Get the maximum and minimum latitude and longitude values of the track.
-    try:
-        track_max_lat = track_gps_data['latitude'].max()
-        track_min_lat = track_gps_data['latitude'].min()
-        track_max_lon = track_gps_data['longitude'].max()
-        track_min_lon = track_gps_data['longitude'].min()
-    except KeyError as e:
-        print(f"Track with id {track.session_id} has no latitude or longitude column (in GPS data).")
-        return
-    
-    # Check if the track is fully within the bounding box of the city.
-    if track_max_lat > max_lat or track_min_lat < min_lat or track_max_lon > max_lon or track_min_lon < min_lon:
-        return "Track is out of bounding box of the city."
-    
-    return None
+# The response formats of the fetch endpoint.
+FETCH_FORMATS = ("json", "ndjson", "multipart")
+
+# The response formats of the export endpoint.
+EXPORT_FORMATS = ("ndjson", "tar")
+
+# The number of tracks that the export endpoint fetches from the database at once.
+# Every track comes with its payload and sensor streams, so this bounds the memory of an export.
+EXPORT_CHUNK_SIZE = 25
+
+
+def read_upload(request):
+    """
+    Parse the multipart body of an upload and read the track files, timing both stages.
+    """
+    with stage("multipart"):
+        files = request.FILES
+    with stage("decompression"):
+        return read_track_files(files)
 
 
 @method_decorator(csrf_exempt, name='dispatch')
@@ -65,47 +68,26 @@ class PostTrackResource(View):
         if not request.content_type.startswith("multipart/form-data"):
             return HttpResponseBadRequest(json.dumps({"error": "Invalid request."}))
 
+        if settings.INGEST_MODE == "spool":
+            return self.spool(request)
+
         # Extract the multipart files.
         try:
-            metadata_file = request.FILES.get("metadata.json.gz", None)
-            metadata = json.loads(zlib.decompress(metadata_file.read(), 16+zlib.MAX_WBITS).decode("utf-8"))
-            gps_csv = request.FILES.get("gps.csv.gz", None)
-            gps_str = zlib.decompress(gps_csv.read(), 16+zlib.MAX_WBITS).decode("utf-8")
-            accelerometer_csv = request.FILES.get("accelerometer.csv.gz", None)
-            accelerometer_str = zlib.decompress(accelerometer_csv.read(), 16+zlib.MAX_WBITS).decode("utf-8") if accelerometer_csv else None
-            gyroscope_csv = request.FILES.get("gyroscope.csv.gz", None)
-            gyroscope_str = zlib.decompress(gyroscope_csv.read(), 16+zlib.MAX_WBITS).decode("utf-8") if gyroscope_csv else None
-            magnetometer_csv = request.FILES.get("magnetometer.csv.gz", None)
-            magnetometer_str = zlib.decompress(magnetometer_csv.read(), 16+zlib.MAX_WBITS).decode("utf-8") if magnetometer_csv else None
+            metadata, gps_gz, sensor_csvs, sensor_streams = read_upload(request)
+        except PayloadTooLarge as e:
+            print(e)
+            return HttpResponse(json.dumps({"error": "Payload too large."}), status=413)
         except Exception as e:
             print(e)
             return HttpResponseBadRequest(json.dumps({"error": "Invalid request."}))
 
         try:
-            track = Track(
-                # Fields that are extracted from the raw json data for querying.
-                start_time=metadata.get("startTime", None),
-                end_time=metadata.get("endTime", None),
-                debug=metadata.get("debug", False) if metadata.get("debug", False) != None else False,
-                backend=metadata.get("backend", "unknown") if metadata.get("backend", "unknown") != None else "unknown",
-                positioning_mode=metadata.get("positioningMode", "unknown") if metadata.get("positioningMode", "unknown") != None else "unknown",
-                user_id=metadata.get("userId", "anonymous") if metadata.get("userId", "anonymous") != None else "anonymous",
-                session_id=metadata.get("sessionId", "unknown") if metadata.get("sessionId", "unknown") != None else "unknown",
-                device_type=metadata.get("deviceType", "unknown") if metadata.get("deviceType", "unknown") != None else "unknown",
-                bike_type=metadata.get("bikeType", "unknown") if metadata.get("bikeType", "unknown") != None else "unknown",
-                preference_type=metadata.get("preferenceType", "unknown") if metadata.get("preferenceType", "unknown") != None else "unknown",
-                activity_type=metadata.get("activityType", "unknown") if metadata.get("activityType", "unknown") != None else "unknown",
-                has_battery_data = metadata.get("batteryStates") != None and len(metadata.get("batteryStates")) >= 2,
-                # Fields that contain raw data.
-                metadata=metadata,
-                gps_csv=gps_str,
-                accelerometer_csv=accelerometer_str,
-                gyroscope_csv=gyroscope_str,
-                magnetometer_csv=magnetometer_str,
-            )
-            err = validate_track(track)
+            track = build_track(metadata, gps_gz, sensor_csvs)
+            with stage("validation"):
+                err = validate_track(track)
             if not err:
-                track.save()
+                with stage("save"):
+                    save_track(track, sensor_streams)
             else:
                 # Log but don't tell the client to not leak validation information.
                 print(f"Track with id {track.session_id} won't be inserted into the DB: {err}")
@@ -113,6 +95,7 @@ class PostTrackResource(View):
             print(e)
             return HttpResponseBadRequest(json.dumps({"error": "Invalid request."}))
         except IntegrityError as e:
+            print(e)
             return HttpResponseBadRequest(json.dumps({"error": "Track already exists."}))
         except Exception as e:
             print(e, type(e))
@@ -120,6 +103,177 @@ class PostTrackResource(View):
         
         return JsonResponse({"success": True})
 
+    def spool(self, request):
+        """
+        Write the upload into the ingest spool and return before the track is inserted.
+
+        The track is validated and inserted by the drain_spool command.
+        """
+        with stage("multipart"):
+            files = {name: request.FILES[name] for name in UPLOAD_FILES if name in request.FILES}
+        if "metadata.json.gz" not in files or "gps.csv.gz" not in files:
+            return HttpResponseBadRequest(json.dumps({"error": "Invalid request."}))
+        # The compressed files are never larger than the decompressed files that are accepted.
+        if sum(file.size for file in files.values()) > settings.MAX_DECOMPRESSED_TRACK_SIZE:
+            return HttpResponse(json.dumps({"error": "Payload too large."}), status=413)
+        try:
+            metadata = json.loads(gunzip_text(files["metadata.json.gz"], settings.MAX_DECOMPRESSED_FILE_SIZE))
+            session_id = metadata.get("sessionId", "unknown") if metadata.get("sessionId", "unknown") != None else "unknown"
+        except PayloadTooLarge as e:
+            print(e)
+            return HttpResponse(json.dumps({"error": "Payload too large."}), status=413)
+        except Exception as e:
+            print(e)
+            return HttpResponseBadRequest(json.dumps({"error": "Invalid request."}))
+
+        try:
+            with stage("spool"):
+                spool_upload(str(session_id), files)
+        except SpoolConflict:
+            return HttpResponseBadRequest(json.dumps({"error": "Track already exists."}))
+        except Exception as e:
+            print(e, type(e))
+            return HttpResponseServerError(json.dumps({"error": "Unknown error."}))
+
+        return JsonResponse({"success": True}, status=202)
+
+
+def filter_tracks(params):
+    """
+    Get the non debug tracks that match the filter parameters of the list endpoint, ordered by pk.
+    """
+    tracks = Track.objects.all()
+
+    # Always fetch non debug tracks.
+    tracks = tracks.filter(debug=False)
+    
+    # Filter the tracks by the requested parameters.
+    if "from" in params: # Start time. (int)
+        tracks = tracks.filter(start_time__gte=int(params["from"]))
+    if "to" in params: # End time. (int)
+        tracks = tracks.filter(end_time__lte=int(params["to"]))
+    if "backend" in params: # Backend. (str)
+        tracks = tracks.filter(backend=params["backend"])
+    if "positioning" in params: # Positioning mode. (str)
+        tracks = tracks.filter(positioning_mode=params["positioning"])
+    if "deviceType" in params: # Device type. (str)
+        tracks = tracks.filter(device_type=params["deviceType"])
+    if "userId" in params: # User ID. (str)
+        tracks = tracks.filter(user_id=params["userId"])
+    if "sessionId" in params: # Session ID. (str)
+        tracks = tracks.filter(session_id=params["sessionId"])
+    # The attributes of the metadata, e.g. appVersion. (str or true/false)
+    tracks = filter_attributes(tracks, params)
+    # The primary key is the session id, so the pk range compares strings.
+    if "pk" in params: # Primary key, exclusive. (str)
+        tracks = tracks.filter(pk__gt=params["pk"])
+    if "maxPk" in params: # Last primary key, inclusive. (str)
+        tracks = tracks.filter(pk__lte=params["maxPk"])
+    
+    # Order the tracks by pk.
+    return tracks.order_by("pk")
+
+
+def tracks_after_cursor(tracks, token: str):
+    """
+    Get the tracks after the cursor of the cursor mode of the list endpoint.
+
+    The tracks are ordered by pk, so the cursor is the pk of the last track of the previous page.
+    An empty token starts at the first track. Raises InvalidCursor if the token is invalid.
+    """
+    if not token:
+        return tracks
+    cursor = decode_cursor(token)
+    if "pk" not in cursor:
+        raise InvalidCursor(f"Invalid cursor: {token[:100]}")
+    return tracks.filter(pk__gt=cursor["pk"])
+
+
+def track_cursor_values(track: Track):
+    return {"pk": track.pk}
+
+
+def serialize_track_summary(track: Track):
+    return {
+        "pk": track.pk,
+        "startTime": track.start_time,
+        "endTime": track.end_time,
+        "debug": track.debug,
+        "backend": track.backend,
+        "positioningMode": track.positioning_mode,
+        "deviceType": track.device_type,
+        "userId": track.user_id,
+        "sessionId": track.session_id,
+    }
+
+
+def fetch_tracks(fields: tuple, tracks=None):
+    """
+    Get the tracks with only the payload columns and sensor streams of the requested fields.
+    """
+    if tracks is None:
+        tracks = Track.objects.all()
+    tracks = tracks.select_related("payload").only("pk", *[f"payload__{PAYLOAD_COLUMNS[field]}" for field in fields])
+    sensors = [field for field in fields if field in SENSORS]
+    if sensors:
+        # Prefetch the streams, so that no query is made while the response is rendered.
+        tracks = tracks.prefetch_related(Prefetch("sensor_streams", queryset=SensorStream.objects.filter(sensor__in=sensors)))
+    return tracks
+
+
+def track_file(track: Track, sensor: str):
+    """
+    Get a sensor file of a track gzip compressed, or None if the track has no such file.
+    """
+    return b"".join(iter_field_gzip(track, sensor)) or None
+
+
+def track_response(track: Track, fields: tuple = TRACK_FIELDS) -> JsonResponse:
+    data = {}
+    for field in fields:
+        if field == "metadata":
+            data["metadata"] = track.metadata
+        elif field == "gps":
+            data["gpsCSV"] = track.gps_csv
+        else:
+            data[f"{field}CSV"] = track.get_sensor_csv(field)
+    data["pk"] = track.pk
+    return JsonResponse(data)
+
+
+def track_stream(request, track: Track, fields: tuple):
+    """
+    Get the body chunks and the content type of the streaming formats of the fetch endpoint.
+    """
+    if request.GET["format"] == "ndjson":
+        return iter_ndjson(track, fields), "application/x-ndjson"
+    boundary = uuid.uuid4().hex
+    return iter_multipart(track, fields, boundary, accepts_gzip(request)), f'multipart/mixed; boundary="{boundary}"'
+
+
+def export_tracks(params):
+    """
+    Get the tracks and the fields of the export endpoint, filtered like the list endpoint.
+    """
+    fields = get_fields(params)
+    return fetch_tracks(fields, filter_tracks(params)), fields
+
+
+def export_stream(request, tracks, fields: tuple):
+    """
+    Get the body chunks and the content type of the formats of the export endpoint.
+    """
+    if request.GET.get("format", "ndjson") == "tar":
+        return iter_tar_export(tracks, fields), "application/x-tar"
+    return iter_ndjson_export(tracks, fields), "application/x-ndjson"
+
+
+def export_response(chunks, content_type: str) -> StreamingHttpResponse:
+    response = StreamingHttpResponse(chunks, content_type=content_type)
+    if content_type == "application/x-tar":
+        response["Content-Disposition"] = 'attachment; filename="tracks.tar"'
+    return response
+
 
 @method_decorator(csrf_exempt, name='dispatch')
 class ListTracksResource(View):
@@ -131,60 +285,35 @@ class ListTracksResource(View):
         if api_key != settings.API_KEY:
             return HttpResponseBadRequest(json.dumps({"error": "Invalid key."}))
 
-        tracks = Track.objects.all()
-
-        # Always fetch non debug tracks.
-        tracks = tracks.filter(debug=False)
-        
-        # Filter the tracks by the requested parameters.
-        if "from" in request.GET: # Start time. (int)
-            tracks = tracks.filter(start_time__gte=int(request.GET["from"]))
-        if "to" in request.GET: # End time. (int)
-            tracks = tracks.filter(end_time__lte=int(request.GET["to"]))
-        if "backend" in request.GET: # Backend. (str)
-            tracks = tracks.filter(backend=request.GET["backend"])
-        if "positioning" in request.GET: # Positioning mode. (str)
-            tracks = tracks.filter(positioning_mode=request.GET["positioning"])
-        if "deviceType" in request.GET: # Device type. (str)
-            tracks = tracks.filter(device_type=request.GET["deviceType"])
-        if "userId" in request.GET: # User ID. (str)
-            tracks = tracks.filter(user_id=request.GET["userId"])
-        if "sessionId" in request.GET: # Session ID. (str)
-            tracks = tracks.filter(session_id=request.GET["sessionId"])
-        if "pk" in request.GET: # Primary key. (int)
-            tracks = tracks.filter(pk__gt=int(request.GET["pk"]))
-        
-        # Order the tracks by pk.
-        tracks = tracks.order_by("pk")
+        try:
+            tracks = filter_tracks(request.GET)
+        except ValueError as e:
+            print(e)
+            return HttpResponseBadRequest(json.dumps({"error": "Invalid request."}))
         
         # Paginate the tracks.
-        page = int(request.GET.get("page", 1))
-        if page < 1:
-            page = 1
+        try:
+            page, page_size = get_page_params(request.GET)
+        except InvalidPageParams as e:
+            print(e)
+            return HttpResponseBadRequest(json.dumps({"error": "Invalid page."}))
 
-        page_size = int(request.GET.get("pageSize", 10))
-        if page_size > 100:
-            page_size = 100
+        # In the cursor mode, the next page starts after the last track of the previous page.
+        # This neither counts the tracks nor skips the previous pages.
+        if "cursor" in request.GET:
+            try:
+                tracks = tracks_after_cursor(tracks, request.GET["cursor"])
+            except InvalidCursor as e:
+                print(e)
+                return HttpResponseBadRequest(json.dumps({"error": "Invalid cursor."}))
+            return cursor_response(list(tracks[:page_size + 1]), page_size, serialize_track_summary, track_cursor_values)
 
         paginator = Paginator(tracks, page_size)
         tracks = paginator.get_page(page)
 
         # Serialize the tracks.
         return JsonResponse({
-            "results": [
-                {
-                    "pk": track.pk,
-                    "startTime": track.start_time,
-                    "endTime": track.end_time,
-                    "debug": track.debug,
-                    "backend": track.backend,
-                    "positioningMode": track.positioning_mode,
-                    "deviceType": track.device_type,
-                    "userId": track.user_id,
-                    "sessionId": track.session_id,
-                } 
-                for track in tracks
-            ], 
+            "results": [serialize_track_summary(track) for track in tracks], 
             "page": page,
             "pageSize": page_size,
             "totalPages": tracks.paginator.num_pages,
@@ -203,16 +332,237 @@ class FetchTrackResource(View):
 
         if "pk" not in request.GET:
             return HttpResponseBadRequest(json.dumps({"error": "Missing pk."}))
+
+        # Return a single sensor file as it is stored, i.e. gzip compressed.
+        if "file" in request.GET:
+            sensor = SENSOR_FILES.get(request.GET["file"])
+            if sensor is None:
+                return HttpResponseBadRequest(json.dumps({"error": "Invalid file."}))
+            try:
+                track = fetch_tracks((sensor,)).get(pk=request.GET["pk"])
+            except Track.DoesNotExist:
+                return HttpResponseBadRequest(json.dumps({"error": "Invalid pk."}))
+            compressed = track_file(track, sensor)
+            if compressed is None:
+                return HttpResponseBadRequest(json.dumps({"error": "Missing file."}))
+            return HttpResponse(compressed, content_type="application/gzip")
+
+        # Only load the requested fields.
         try:
-            track = Track.objects.get(pk=request.GET["pk"])
+            fields = get_fields(request.GET)
+        except InvalidFields as e:
+            print(e)
+            return HttpResponseBadRequest(json.dumps({"error": "Invalid fields."}))
+        if request.GET.get("format", "json") not in FETCH_FORMATS:
+            return HttpResponseBadRequest(json.dumps({"error": "Invalid format."}))
+
+        try:
+            track = fetch_tracks(fields).get(pk=request.GET["pk"])
         except Track.DoesNotExist:
             return HttpResponseBadRequest(json.dumps({"error": "Invalid pk."}))
 
+        # Stream the files in chunks instead of building the whole response in memory.
+        if request.GET.get("format", "json") != "json":
+            chunks, content_type = track_stream(request, track, fields)
+            response = StreamingHttpResponse(chunks, content_type=content_type)
+            patch_vary_headers(response, ("Accept-Encoding",))
+            return response
+
+        return track_response(track, fields)
+
+
+@method_decorator(csrf_exempt, name='dispatch')
+class ExportTracksResource(View):
+    def get(self, request):
+        # Get the API key from the request.
+        api_key = request.GET.get("key", None)
+        if not api_key:
+            return HttpResponseBadRequest(json.dumps({"error": "Missing key."}))
+        if api_key != settings.API_KEY:
+            return HttpResponseBadRequest(json.dumps({"error": "Invalid key."}))
+
+        try:
+            tracks, fields = export_tracks(request.GET)
+        except InvalidFields as e:
+            print(e)
+            return HttpResponseBadRequest(json.dumps({"error": "Invalid fields."}))
+        except ValueError as e:
+            print(e)
+            return HttpResponseBadRequest(json.dumps({"error": "Invalid request."}))
+        if request.GET.get("format", "ndjson") not in EXPORT_FORMATS:
+            return HttpResponseBadRequest(json.dumps({"error": "Invalid format."}))
+
+        # The tracks are read through a server-side cursor while the response is streamed.
+        chunks, content_type = export_stream(request, tracks.iterator(chunk_size=EXPORT_CHUNK_SIZE), fields)
+        return export_response(chunks, content_type)
+
+
+# Async versions of the views above, served by ASGI workers (SERVER_MODE=asgi).
+# Database queries run through the async ORM, while decompression, validation
+# and serialization run in the bounded offload thread pool, so that the event
+# loop keeps accepting requests while uploads are processed.
+
+
+@method_decorator(csrf_exempt, name='dispatch')
+class AsyncPostTrackResource(PostTrackResource):
+    async def post(self, request):
+        # This view only accepts multipart files.
+        if not request.content_type.startswith("multipart/form-data"):
+            return HttpResponseBadRequest(json.dumps({"error": "Invalid request."}))
+
+        if settings.INGEST_MODE == "spool":
+            return await offload(self.spool, request)
+
+        # Extract the multipart files. The multipart body is also parsed in the thread pool.
+        try:
+            metadata, gps_gz, sensor_csvs, sensor_streams = await offload(read_upload, request)
+        except PayloadTooLarge as e:
+            print(e)
+            return HttpResponse(json.dumps({"error": "Payload too large."}), status=413)
+        except Exception as e:
+            print(e)
+            return HttpResponseBadRequest(json.dumps({"error": "Invalid request."}))
+
+        try:
+            track = build_track(metadata, gps_gz, sensor_csvs)
+            with stage("validation"):
+                err = await offload(validate_track, track)
+            if not err:
+                with stage("save"):
+                    await sync_to_async(save_track)(track, sensor_streams)
+            else:
+                # Log but don't tell the client to not leak validation information.
+                print(f"Track with id {track.session_id} won't be inserted into the DB: {err}")
+        except (ValidationError, KeyError) as e:
+            print(e)
+            return HttpResponseBadRequest(json.dumps({"error": "Invalid request."}))
+        except IntegrityError as e:
+            print(e)
+            return HttpResponseBadRequest(json.dumps({"error": "Track already exists."}))
+        except Exception as e:
+            print(e, type(e))
+            return HttpResponseServerError(json.dumps({"error": "Unknown error."}))
+
+        return JsonResponse({"success": True})
+
+
+@method_decorator(csrf_exempt, name='dispatch')
+class AsyncListTracksResource(View):
+    async def get(self, request):
+        # Get the API key from the request body.
+        api_key = request.GET.get("key", None)
+        if not api_key:
+            return HttpResponseBadRequest(json.dumps({"error": "Missing key."}))
+        if api_key != settings.API_KEY:
+            return HttpResponseBadRequest(json.dumps({"error": "Invalid key."}))
+
+        try:
+            tracks = filter_tracks(request.GET)
+        except ValueError as e:
+            print(e)
+            return HttpResponseBadRequest(json.dumps({"error": "Invalid request."}))
+
+        # Paginate the tracks like Paginator.get_page, which has no async interface.
+        try:
+            page, page_size = get_page_params(request.GET)
+        except InvalidPageParams as e:
+            print(e)
+            return HttpResponseBadRequest(json.dumps({"error": "Invalid page."}))
+
+        # In the cursor mode, the next page starts after the last track of the previous page.
+        if "cursor" in request.GET:
+            try:
+                tracks = tracks_after_cursor(tracks, request.GET["cursor"])
+            except InvalidCursor as e:
+                print(e)
+                return HttpResponseBadRequest(json.dumps({"error": "Invalid cursor."}))
+            rows = [track async for track in tracks[:page_size + 1]]
+            return cursor_response(rows, page_size, serialize_track_summary, track_cursor_values)
+        num_pages = max(1, math.ceil(await tracks.acount() / page_size))
+        offset = (min(page, num_pages) - 1) * page_size
+
+        # Serialize the tracks.
         return JsonResponse({
-            "metadata": track.metadata,
-            "gpsCSV": track.gps_csv,
-            "accelerometerCSV": track.accelerometer_csv,
-            "gyroscopeCSV": track.gyroscope_csv,
-            "magnetometerCSV": track.magnetometer_csv,
-            "pk": track.pk,
+            "results": [serialize_track_summary(track) async for track in tracks[offset:offset + page_size]],
+            "page": page,
+            "pageSize": page_size,
+            "totalPages": num_pages,
         })
+
+
+@method_decorator(csrf_exempt, name='dispatch')
+class AsyncFetchTrackResource(View):
+    async def get(self, request):
+        # Get the API key from the request.
+        api_key = request.GET.get("key", None)
+        if not api_key:
+            return HttpResponseBadRequest(json.dumps({"error": "Missing key."}))
+        if api_key != settings.API_KEY:
+            return HttpResponseBadRequest(json.dumps({"error": "Invalid key."}))
+
+        if "pk" not in request.GET:
+            return HttpResponseBadRequest(json.dumps({"error": "Missing pk."}))
+
+        # Return a single sensor file as it is stored, i.e. gzip compressed.
+        if "file" in request.GET:
+            sensor = SENSOR_FILES.get(request.GET["file"])
+            if sensor is None:
+                return HttpResponseBadRequest(json.dumps({"error": "Invalid file."}))
+            try:
+                track = await fetch_tracks((sensor,)).aget(pk=request.GET["pk"])
+            except Track.DoesNotExist:
+                return HttpResponseBadRequest(json.dumps({"error": "Invalid pk."}))
+            compressed = await offload(track_file, track, sensor)
+            if compressed is None:
+                return HttpResponseBadRequest(json.dumps({"error": "Missing file."}))
+            return HttpResponse(compressed, content_type="application/gzip")
+
+        # Only load the requested fields.
+        try:
+            fields = get_fields(request.GET)
+        except InvalidFields as e:
+            print(e)
+            return HttpResponseBadRequest(json.dumps({"error": "Invalid fields."}))
+        if request.GET.get("format", "json") not in FETCH_FORMATS:
+            return HttpResponseBadRequest(json.dumps({"error": "Invalid format."}))
+
+        try:
+            track = await fetch_tracks(fields).aget(pk=request.GET["pk"])
+        except Track.DoesNotExist:
+            return HttpResponseBadRequest(json.dumps({"error": "Invalid pk."}))
+
+        # Stream the files in chunks, which are rendered in the thread pool.
+        if request.GET.get("format", "json") != "json":
+            chunks, content_type = track_stream(request, track, fields)
+            response = StreamingHttpResponse(offload_iter(chunks), content_type=content_type)
+            patch_vary_headers(response, ("Accept-Encoding",))
+            return response
+
+        return await offload(track_response, track, fields)
+
+
+@method_decorator(csrf_exempt, name='dispatch')
+class AsyncExportTracksResource(View):
+    async def get(self, request):
+        # Get the API key from the request.
+        api_key = request.GET.get("key", None)
+        if not api_key:
+            return HttpResponseBadRequest(json.dumps({"error": "Missing key."}))
+        if api_key != settings.API_KEY:
+            return HttpResponseBadRequest(json.dumps({"error": "Invalid key."}))
+
+        try:
+            tracks, fields = export_tracks(request.GET)
+        except InvalidFields as e:
+            print(e)
+            return HttpResponseBadRequest(json.dumps({"error": "Invalid fields."}))
+        except ValueError as e:
+            print(e)
+            return HttpResponseBadRequest(json.dumps({"error": "Invalid request."}))
+        if request.GET.get("format", "ndjson") not in EXPORT_FORMATS:
+            return HttpResponseBadRequest(json.dumps({"error": "Invalid format."}))
+
+        # The server-side cursor belongs to the database connection of the sync thread,
+        # so the stream is consumed there instead of in the offload thread pool.
+        chunks, content_type = export_stream(request, tracks.iterator(chunk_size=EXPORT_CHUNK_SIZE), fields)
+        return export_response(sync_iter(chunks), content_type)
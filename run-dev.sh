@@ -19,6 +19,12 @@ if [ "$WORKER_MODE" = "True" ]; then
 
     SYNC_EXPOSED="False" poetry run python manage.py runserver 0.0.0.0:8000 &
     pids+=($!)
+
+    # In the spool ingest mode, the uploads are inserted into the database in the background.
+    if [ "$INGEST_MODE" = "spool" ]; then
+        poetry run python manage.py drain_spool &
+        pids+=($!)
+    fi
 else
     # Create a superuser for the manager
     poetry run python manage.py createsuperuser \
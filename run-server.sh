@@ -10,15 +10,31 @@ cd backend
 # Run gunicorn
 poetry run python manage.py migrate
 
+# The request metrics of the processes of the last run, see monitoring/instrumentation.py.
+rm -rf "${REQUEST_METRICS_DIR:-data/request-metrics}"
+
 pids=()
 
+# Serve the async views with uvicorn workers in the ASGI server mode, see SERVER_MODE in the settings.
+if [ "$SERVER_MODE" = "asgi" ]; then
+    app=(backend.asgi:application --worker-class uvicorn.workers.UvicornWorker)
+else
+    app=(backend.wsgi:application)
+fi
+
 if [ "$WORKER_MODE" = "True" ]; then
     # Expose the sync API in worker mode, but only on the internal network between the containers.
-    SYNC_EXPOSED="True" poetry run gunicorn backend.wsgi:application --workers 4 --bind 0.0.0.0:8001 &
+    SYNC_EXPOSED="True" poetry run gunicorn "${app[@]}" --workers 4 --bind 0.0.0.0:8001 &
     pids+=($!)
 
-    SYNC_EXPOSED="False" poetry run gunicorn backend.wsgi:application --workers 4 --bind 0.0.0.0:8000 &
+    SYNC_EXPOSED="False" poetry run gunicorn "${app[@]}" --workers 4 --bind 0.0.0.0:8000 &
     pids+=($!)
+
+    # In the spool ingest mode, the uploads are inserted into the database in the background.
+    if [ "$INGEST_MODE" = "spool" ]; then
+        poetry run python manage.py drain_spool &
+        pids+=($!)
+    fi
 else
     # Create a superuser for the manager
     poetry run python manage.py createsuperuser \
@@ -30,7 +46,7 @@ else
     poetry run python manage.py sync --interval 60 --host "$WORKER_HOST" --port 8001 &
     pids+=($!)
 
-    SYNC_EXPOSED="False" poetry run gunicorn backend.wsgi:application --workers 4 --bind 0.0.0.0:8000 &
+    SYNC_EXPOSED="False" poetry run gunicorn "${app[@]}" --workers 4 --bind 0.0.0.0:8000 &
     pids+=($!)
 fi
 